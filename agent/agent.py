@@ -12,6 +12,7 @@ Endpoint agent responsible for:
 This file is the ONLY executable on endpoints.
 """
 
+import day1
 import day2
 import day3
 import day4
@@ -76,6 +77,38 @@ def run_agent():
 
     return scan
 
+
+# Collectors that can be re-run on their own for RUN_PARTIAL_SCAN jobs.
+# Keys are the scan sections the backend merges into the endpoint's latest scan.
+SECTION_COLLECTORS = {
+    "privilege_posture": d6.collect_privilege_posture,
+    "exposure_posture": d7.collect_exposure_posture,
+    "cis_compliance": d8.collect_cis_compliance,
+}
+
+
+def run_partial_agent(sections):
+    """
+    Runs only the requested collectors.
+    Returns a scan containing just those sections plus identity/metadata;
+    unknown section names are ignored.
+    """
+    selected = [s for s in sections or [] if s in SECTION_COLLECTORS]
+
+    scan = {
+        "metadata": {
+            "scan_time_utc": datetime.now().isoformat() + "Z",
+            "agent_version": "1.0"
+        },
+        "system": day1.get_system_info(),
+        "partial_sections": selected,
+    }
+
+    for section in selected:
+        scan[section] = SECTION_COLLECTORS[section]()
+
+    return scan
+
 #Day 5: llm explain
 #training model: (should not be here)
     
@@ -87,16 +120,20 @@ print(f"DEBUG: Using BACKEND_URL={BACKEND_URL}")
 # SCANS_URL = "http://127.0.0.1:8000/api/scans/"
 SCANS_URL = f"{BACKEND_URL}/api/scans/"
 
+# One keep-alive session for all backend calls (avoids a new connection per request)
+SESSION = requests.Session()
+
 def send_scan_to_backend(scan_data: dict, endpoint_id: str):
     """
     Sends collected scan data to backend API.
     Includes endpoint_id for association and hostname for display.
+    Returns the response status code, or None if the backend was unreachable.
     """
     payload = dict(scan_data)
     payload["endpoint_id"] = endpoint_id
     payload["hostname"] = payload.get("hostname") or socket.gethostname()
     try:
-        response = requests.post(
+        response = SESSION.post(
             SCANS_URL,
             json=payload,
             timeout=10
@@ -108,54 +145,85 @@ def send_scan_to_backend(scan_data: dict, endpoint_id: str):
         else:
             print("[-] Backend rejected scan")
             print(response.status_code, response.text)
+        return response.status_code
 
     except requests.exceptions.RequestException as e:
         print("[-] Failed to connect to backend")
         print(str(e))
+        return None
 
 
 import time
-import requests
 
-POLL_INTERVAL = 30  # seconds
+POLL_INTERVAL = 30  # seconds (fallback when the backend does not suggest one)
 
 
-def poll_for_jobs(endpoint_id):
+def checkin(endpoint_id, completed_job_ids):
+    """
+    Heartbeat + completion acks + job poll in one request.
+    Returns the backend response, or None if the check-in failed
+    (acks are then retried on the next check-in).
+    """
     try:
-        response = requests.get(
-            f"{BACKEND_URL}/api/agent/jobs/{endpoint_id}",
+        response = SESSION.post(
+            f"{BACKEND_URL}/api/agent/checkin",
+            json={
+                "endpoint_id": endpoint_id,
+                "completed_job_ids": list(completed_job_ids),
+            },
             timeout=5
         )
+        if response.status_code != 200:
+            return None
         return response.json()
     except Exception:
         return None
 
 
-def mark_job_complete(job_id):
-    try:
-        requests.post(
-            f"{BACKEND_URL}/api/agent/jobs/{job_id}/complete",
-            timeout=5
-        )
-    except Exception:
-        pass
+def run_job(job, endpoint_id):
+    """
+    Runs a job handed out by the backend.
+    Returns True if the job was handled and should be acknowledged.
+    """
+    if job.get("job_type") == "RUN_SCAN":
+        print("[+] Received RUN_SCAN job")
+
+        scan_result = run_agent()
+        send_scan_to_backend(scan_result, endpoint_id)
+        return True
+
+    if job.get("job_type") == "RUN_PARTIAL_SCAN":
+        sections = job.get("sections") or []
+        print(f"[+] Received RUN_PARTIAL_SCAN job: {', '.join(sections)}")
+
+        scan_result = run_partial_agent(sections)
+        if send_scan_to_backend(scan_result, endpoint_id) == 409:
+            # No earlier full scan to merge into: send a full one instead
+            print("[+] Backend has no full scan yet; running a full scan")
+            send_scan_to_backend(run_agent(), endpoint_id)
+        return True
+
+    return False
 
 
 def agent_main_loop(endpoint_id: str, hostname: str):
     print(f"[+] Agent started for endpoint: {hostname}")
 
+    completed_job_ids = []
+
     while True:
-        send_heartbeat(endpoint_id)
-        job = poll_for_jobs(endpoint_id)
+        response = checkin(endpoint_id, completed_job_ids)
+        delay = POLL_INTERVAL
+
+        if response is not None:
+            completed_job_ids = []
+            delay = response.get("next_poll_seconds", POLL_INTERVAL)
 
-        if job and job.get("job_type") == "RUN_SCAN":
-            print("[+] Received RUN_SCAN job")
+            job = response.get("job")
+            if job and run_job(job, endpoint_id):
+                completed_job_ids.append(job["job_id"])
 
-            scan_result = run_agent()
-            send_scan_to_backend(scan_result, endpoint_id)
-            mark_job_complete(job["job_id"])
-            
-        time.sleep(POLL_INTERVAL)
+        time.sleep(delay)
 
 
 def register_agent(endpoint_id: str):
@@ -166,7 +234,7 @@ def register_agent(endpoint_id: str):
     }
 
     try:
-        r = requests.post(
+        r = SESSION.post(
             f"{BACKEND_URL}/api/agent/register",
             json=payload,
             timeout=5
@@ -180,16 +248,6 @@ def register_agent(endpoint_id: str):
         print("[-] Agent registration failed:", e)
 
 
-def send_heartbeat(endpoint_id):
-    try:
-        requests.post(
-            f"{BACKEND_URL}/api/agent/heartbeat/{endpoint_id}",
-            timeout=3
-        )
-    except Exception:
-        pass
-
-
 if __name__ == "__main__":
     # Persistent endpoint ID (generated once, avoids hostname collisions)
     endpoint_id = get_or_create_endpoint_id()
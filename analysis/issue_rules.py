@@ -0,0 +1,451 @@
+"""
+issue_rules.py
+
+Declarative issue rules for systemic analysis.
+
+Rules are read from a JSON file (ISSUE_RULES_PATH, default issue_rules.json
+next to this module) and compiled once into a RuleSet. Three kinds:
+
+- field rules:       {"issue", "field": "a.b.c", "op", "value", "default"}
+                     the host has the issue if the field value passes `op`;
+                     "default" replaces a missing / null value
+- any-control rules: {"issue", "any_control": {"status": "non-compliant", ...}}
+                     the host has the issue if any CIS control entry has all given fields
+- control rules:     {"issue", "control_id"}
+                     counts the host's non-compliant entries of that CIS control
+
+Operators: is (true / false / null), eq, ne, in, not_in, lt, le, gt, ge, truthy, falsy.
+
+Compiled form: the rules are turned into the source of one Python function
+(rule values bound as constants, never pasted into the code) and compiled
+once. In it, every distinct parent path of the field rules is resolved once
+per host, and the host's CIS control list is walked once for all control and
+any-control rules (control_id -> issue dictionary lookup). A host's issues
+come out in this order: field rules (file order), any-control rules, then
+control issues in the host's own control order.
+
+active_rules() reloads the file when it changes (hot reload); a file that
+fails to load or compile keeps the previous rules. Every
+ISSUE_RULES_PROFILE_EVERY-th evaluated host is timed per rule (control and
+any-control rules share one pass, timed as a whole); see RuleSet.stats().
+"""
+
+import hashlib
+import itertools
+import json
+import operator
+import os
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "issue_rules.json")
+ISSUE_RULES_PATH = os.getenv("ISSUE_RULES_PATH", DEFAULT_RULES_PATH)
+
+# How often active_rules() checks the file for changes
+ISSUE_RULES_RELOAD_SECONDS = float(os.getenv("ISSUE_RULES_RELOAD_SECONDS", "2"))
+
+# Time every Nth host per rule (0 disables profiling)
+ISSUE_RULES_PROFILE_EVERY = int(os.getenv("ISSUE_RULES_PROFILE_EVERY", "64"))
+
+CONTROLS_PATH = ("cis_compliance", "controls")
+
+
+# -------------------------------
+# Compilation
+# -------------------------------
+
+def _guarded(compare):
+    def test(value, expected):
+        try:
+            return compare(value, expected)
+        except TypeError:
+            return False
+    return test
+
+
+OPERATORS = {
+    "is": lambda value, expected: value is expected,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "in": lambda value, expected: value in expected,
+    "not_in": lambda value, expected: value not in expected,
+    "lt": _guarded(operator.lt),
+    "le": _guarded(operator.le),
+    "gt": _guarded(operator.gt),
+    "ge": _guarded(operator.ge),
+    "truthy": lambda value, expected: bool(value),
+    "falsy": lambda value, expected: not value,
+}
+
+
+def _predicate(op: str, expected, default):
+    test = OPERATORS[op]
+    if default is None:
+        return lambda value: test(value, expected)
+    return lambda value: test(default if value is None else value, expected)
+
+
+def _resolve(value, parts):
+    for part in parts:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _compile_field_rule(rule: Dict):
+    op = rule.get("op")
+    if op not in OPERATORS:
+        raise ValueError(f"Rule {rule['issue']}: unknown op {op!r}")
+
+    expected = rule.get("value")
+    if op == "is" and not (expected is True or expected is False or expected is None):
+        raise ValueError(f"Rule {rule['issue']}: 'is' compares with true, false or null only")
+    if op in ("in", "not_in"):
+        if not isinstance(expected, list):
+            raise ValueError(f"Rule {rule['issue']}: '{op}' needs a list value")
+        expected = tuple(expected)
+
+    parts = tuple(str(rule["field"]).split("."))
+    if not all(parts):
+        raise ValueError(f"Rule {rule['issue']}: invalid field path {rule['field']!r}")
+
+    return parts[:-1], parts[-1], op, expected, rule.get("default")
+
+
+# Generated test per operator, on the field value `v` and the rule constant
+_EXPRESSIONS = {
+    "is": "v is {c}",
+    "eq": "v == {c}",
+    "ne": "v != {c}",
+    "in": "v in {c}",
+    "not_in": "v not in {c}",
+    "truthy": "v",
+    "falsy": "not v",
+}
+
+_COMPARISONS = {"lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+
+class RuleSet:
+    """
+    Compiled issue rules.
+
+    Attributes:
+        definitions: the rules as declared
+        issue_order: every issue the rules can report, in evaluation order
+        version:     content hash of the definitions
+    """
+
+    def __init__(self, definitions: List[Dict], source: str = None):
+        if not isinstance(definitions, list) or not definitions:
+            raise ValueError("Issue rules must be a non-empty list")
+
+        self.definitions = definitions
+        self.source = source
+        self.version = hashlib.sha256(json.dumps(definitions, sort_keys=True).encode()).hexdigest()[:12]
+        self.loaded_at = datetime.now(timezone.utc)
+
+        parents = {}
+        field_specs = []
+        self._field_rules = []       # (parent index, leaf, predicate, issue)
+        self._any_control = []       # (((field, value), ...), issue)
+        self._control_issues = {}    # control_id -> issue
+        self.kinds = {}
+
+        for rule in definitions:
+            issue = rule.get("issue") if isinstance(rule, dict) else None
+            if not issue or not isinstance(issue, str):
+                raise ValueError(f"Rule without an issue name: {rule!r}")
+            if issue in self.kinds:
+                raise ValueError(f"Duplicate rule for issue {issue}")
+
+            if "field" in rule:
+                parent, leaf, op, expected, default = _compile_field_rule(rule)
+                index = parents.setdefault(parent, len(parents))
+                self._field_rules.append((index, leaf, _predicate(op, expected, default), issue))
+                field_specs.append((index, leaf, op, expected, default, issue))
+                self.kinds[issue] = "field"
+            elif "any_control" in rule:
+                conditions = rule["any_control"]
+                if not isinstance(conditions, dict) or not conditions:
+                    raise ValueError(f"Rule {issue}: any_control needs field conditions")
+                self._any_control.append((tuple(conditions.items()), issue))
+                self.kinds[issue] = "any_control"
+            elif "control_id" in rule:
+                control_id = str(rule["control_id"])
+                if control_id in self._control_issues:
+                    raise ValueError(f"Duplicate rule for control {control_id}")
+                self._control_issues[control_id] = issue
+                self.kinds[issue] = "control"
+            else:
+                raise ValueError(f"Rule {issue}: needs one of field, any_control, control_id")
+
+        self._parents = list(parents)
+        self.issue_order = (
+            [issue for _, _, _, issue in self._field_rules]
+            + [issue for _, issue in self._any_control]
+            + list(self._control_issues.values())
+        )
+        self._evaluate = self._compile(field_specs)
+
+        # Profiling: sampled hosts, and per field rule / for the control pass: [total_ns, matches]
+        self._seen = itertools.count(1)
+        self._stats_lock = Lock()
+        self._sampled = 0
+        self._rule_stats = {issue: [0, 0] for issue in self.issue_order}
+        self._control_pass_ns = 0
+
+    def _compile(self, field_specs):
+        """Generates and compiles evaluate(scan) -> counts for these rules."""
+        namespace = {"_dict": dict, "_list": list, "_empty": {}, "_lookup": self._control_issues}
+
+        def const(value):
+            name = f"c{len(namespace)}"
+            namespace[name] = value
+            return name
+
+        lines = ["def evaluate(scan):", "    counts = {}"]
+
+        for i, parent in enumerate(self._parents):
+            lines.append(f"    p{i} = scan")
+            for part in parent:
+                lines.append(f"    p{i} = p{i}.get({const(part)}) if isinstance(p{i}, _dict) else None")
+            lines.append(f"    if not isinstance(p{i}, _dict): p{i} = _empty")
+
+        for index, leaf, op, expected, default, issue in field_specs:
+            lines.append(f"    v = p{index}.get({const(leaf)})")
+            if default is not None:
+                lines.append(f"    if v is None: v = {const(default)}")
+            if op in _COMPARISONS:
+                lines += [
+                    "    try:",
+                    f"        hit = v {_COMPARISONS[op]} {const(expected)}",
+                    "    except TypeError:",
+                    "        hit = False",
+                    f"    if hit: counts[{const(issue)}] = 1",
+                ]
+            else:
+                test = _EXPRESSIONS[op].format(c=const(expected) if "{c}" in _EXPRESSIONS[op] else "")
+                lines.append(f"    if {test}: counts[{const(issue)}] = 1")
+
+        if self._any_control or self._control_issues:
+            lines.append(f"    controls = scan.get({const(CONTROLS_PATH[0])}) if isinstance(scan, _dict) else None")
+            lines.append(f"    controls = controls.get({const(CONTROLS_PATH[1])}) if isinstance(controls, _dict) else None")
+            lines.append("    if isinstance(controls, _list):")
+            lines += [f"        a{j} = False" for j in range(len(self._any_control))]
+            lines.append("        found = {}")
+            lines.append("        for control in controls:")
+            for j, (conditions, _) in enumerate(self._any_control):
+                test = " and ".join(f"control.get({const(f)}) == {const(v)}" for f, v in conditions)
+                lines.append(f"            if not a{j} and {test}: a{j} = True")
+            if self._control_issues:
+                lines += [
+                    "            if control.get('status') == 'non-compliant':",
+                    "                issue = _lookup.get(control.get('control_id', ''))",
+                    "                if issue: found[issue] = found.get(issue, 0) + 1",
+                ]
+            for j, (_, issue) in enumerate(self._any_control):
+                lines.append(f"        if a{j}: counts[{const(issue)}] = 1")
+            lines.append("        counts.update(found)")
+
+        lines.append("    return counts")
+
+        exec(compile("\n".join(lines), f"<issue rules {self.version}>", "exec"), namespace)
+        return namespace["evaluate"]
+
+    # -------------------------------
+    # Evaluation
+    # -------------------------------
+
+    def host_issue_counts(self, scan: Dict) -> Dict[str, int]:
+        """
+        One host's contribution to each issue counter, in evaluation order.
+        Issues that do not apply to the host are omitted.
+        """
+        if ISSUE_RULES_PROFILE_EVERY and next(self._seen) % ISSUE_RULES_PROFILE_EVERY == 0:
+            return self._profiled_counts(scan)
+        return self._evaluate(scan)
+
+    def _count_controls(self, scan: Dict, counts: Dict[str, int]):
+        controls = _resolve(scan, CONTROLS_PATH)
+        if not isinstance(controls, list):
+            return
+
+        matched = set()
+        found = {}
+        lookup = self._control_issues
+        for control in controls:
+            for conditions, issue in self._any_control:
+                if issue not in matched and all(control.get(f) == v for f, v in conditions):
+                    matched.add(issue)
+            if control.get("status") == "non-compliant":
+                issue = lookup.get(control.get("control_id", ""))
+                if issue:
+                    found[issue] = found.get(issue, 0) + 1
+
+        for _, issue in self._any_control:
+            if issue in matched:
+                counts[issue] = 1
+        counts.update(found)
+
+    def _profiled_counts(self, scan: Dict) -> Dict[str, int]:
+        """
+        host_issue_counts with per-rule timing, rule by rule through the
+        compiled predicates instead of the generated function.
+        """
+        clock = time.perf_counter_ns
+        timings = []
+
+        counts = {}
+        start = clock()
+        parents = [_resolve(scan, parent) for parent in self._parents]
+        # Parent resolution is shared; spread its cost over the field rules
+        shared = (clock() - start) // max(len(self._field_rules), 1)
+        for index, leaf, predicate, issue in self._field_rules:
+            start = clock()
+            parent = parents[index]
+            if predicate(parent.get(leaf) if isinstance(parent, dict) else None):
+                counts[issue] = 1
+            timings.append((issue, clock() - start + shared))
+
+        start = clock()
+        if self._any_control or self._control_issues:
+            self._count_controls(scan, counts)
+        control_ns = clock() - start
+
+        with self._stats_lock:
+            self._sampled += 1
+            self._control_pass_ns += control_ns
+            for issue, elapsed in timings:
+                self._rule_stats[issue][0] += elapsed
+            for issue in counts:
+                self._rule_stats[issue][1] += 1
+        return counts
+
+    def stats(self) -> Dict:
+        """Per-rule cost and match rate over the profiled hosts."""
+        with self._stats_lock:
+            sampled = self._sampled
+            rule_stats = {issue: list(values) for issue, values in self._rule_stats.items()}
+            control_pass_ns = self._control_pass_ns
+
+        def avg(total):
+            return round(total / sampled, 1) if sampled else None
+
+        return {
+            "version": self.version,
+            "profile_every": ISSUE_RULES_PROFILE_EVERY,
+            "sampled_hosts": sampled,
+            "rules": [
+                {
+                    "issue": issue,
+                    "kind": self.kinds[issue],
+                    # control kinds are timed together in control_pass_avg_ns
+                    "avg_ns": avg(rule_stats[issue][0]) if self.kinds[issue] == "field" else None,
+                    "match_rate": round(rule_stats[issue][1] / sampled, 4) if sampled else None,
+                }
+                for issue in self.issue_order
+            ],
+            "control_pass_avg_ns": avg(control_pass_ns),
+        }
+
+
+# -------------------------------
+# Loading and hot reload
+# -------------------------------
+
+def load_rules(path: str = None) -> RuleSet:
+    """Reads and compiles a rule file. Raises OSError or ValueError."""
+    path = path or ISSUE_RULES_PATH
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("Issue rule file must be an object with a 'rules' list")
+    return RuleSet(data.get("rules"), path)
+
+
+_lock = Lock()
+_active = None
+_active_mtime = None
+_last_check = 0.0
+_last_error = None
+_builtin_version = None
+
+
+def active_rules() -> RuleSet:
+    """
+    The current rule set, reloaded if the rule file changed since the last
+    check (checked at most every ISSUE_RULES_RELOAD_SECONDS).
+    """
+    global _active, _active_mtime, _last_check, _last_error
+
+    now = time.monotonic()
+    if _active is not None and now - _last_check < ISSUE_RULES_RELOAD_SECONDS:
+        return _active
+
+    with _lock:
+        if _active is not None and now - _last_check < ISSUE_RULES_RELOAD_SECONDS:
+            return _active
+        _last_check = now
+
+        try:
+            mtime = os.stat(ISSUE_RULES_PATH).st_mtime_ns
+            if _active is None or mtime != _active_mtime:
+                _active_mtime = mtime
+                _active = load_rules(ISSUE_RULES_PATH)
+                _last_error = None
+        except (OSError, ValueError) as e:
+            if _active is None:
+                raise
+            _last_error = str(e)
+            print(f"[WARN] Issue rules reload failed, keeping version {_active.version}: {e}")
+
+        return _active
+
+
+def reload_rules() -> RuleSet:
+    """Reloads the rule file now. Raises ValueError if it does not load; the previous rules stay active."""
+    global _active, _active_mtime, _last_check, _last_error
+
+    with _lock:
+        try:
+            rules = load_rules(ISSUE_RULES_PATH)
+        except (OSError, ValueError) as e:
+            _last_error = str(e)
+            raise ValueError(f"Issue rules not reloaded: {e}")
+        _active, _active_mtime, _last_check, _last_error = (
+            rules, os.stat(ISSUE_RULES_PATH).st_mtime_ns, time.monotonic(), None
+        )
+        return rules
+
+
+def is_builtin(rules: RuleSet) -> bool:
+    """
+    Whether rules are the shipped default rule set, which the columnar and
+    mongo engines implement directly.
+    """
+    global _builtin_version
+    if _builtin_version is None:
+        _builtin_version = load_rules(DEFAULT_RULES_PATH).version
+    return rules.version == _builtin_version
+
+
+def rules_status() -> Dict:
+    rules = active_rules()
+    return {
+        "path": ISSUE_RULES_PATH,
+        "version": rules.version,
+        "loaded_at": rules.loaded_at,
+        "builtin": is_builtin(rules),
+        "last_reload_error": _last_error,
+        "rules": rules.definitions,
+        "stats": rules.stats(),
+    }
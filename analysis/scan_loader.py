@@ -0,0 +1,310 @@
+"""
+scan_loader.py
+
+Parallel, streaming reader for offline scan archives.
+
+Inputs are scan folders and files: *.json (one scan per file), *.jsonl and
+*.jsonl.gz (one scan per line). Sources are read in a stable (sorted) order
+and cut into units of SCAN_LOADER_BATCH_FILES files or
+SCAN_LOADER_BATCH_LINES lines, which a bounded thread or process pool parses
+(orjson when installed, else json). At most a few units per worker are in
+flight, and results come back in unit order, so memory stays bounded by the
+consumer, e.g. LatestScans, which keeps only the newest scan per host.
+"""
+
+import gzip
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_PARSER = "orjson"
+except ImportError:  # optional speed-up
+    import json
+    _loads = json.loads
+    JSON_PARSER = "json"
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+SCAN_LOADER_BATCH_FILES = int(os.getenv("SCAN_LOADER_BATCH_FILES", "64"))
+SCAN_LOADER_BATCH_LINES = int(os.getenv("SCAN_LOADER_BATCH_LINES", "2000"))
+
+# Units in flight per worker
+SCAN_LOADER_QUEUE_DEPTH = 4
+
+# Seconds between progress lines
+SCAN_LOADER_REPORT_SECONDS = 5
+
+SCAN_SUFFIXES = (".json", ".jsonl", ".jsonl.gz")
+
+
+# -------------------------------
+# Sources and units
+# -------------------------------
+
+def scan_sources(inputs: List[str]) -> List[str]:
+    """Scan files under the given folders / files, sorted per input."""
+    sources = []
+    for path in inputs:
+        if os.path.isdir(path):
+            found = []
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in files if name.endswith(SCAN_SUFFIXES))
+            sources.extend(sorted(found))
+        elif os.path.isfile(path):
+            sources.append(path)
+        else:
+            raise FileNotFoundError(f"Scan input not found: {path}")
+    return sources
+
+
+def _open_lines(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def unit_position(unit: Tuple) -> Tuple[str, Optional[int]]:
+    """
+    Where a unit ends, as a resume point for iter_units:
+    (last .json file, None) or (.jsonl file, next line number).
+    """
+    if unit[0] == "files":
+        return unit[1][-1], None
+    _, path, first, lines = unit
+    return path, first + len(lines)
+
+
+def iter_units(sources: List[str], resume: Tuple[str, Optional[int]] = None) -> Iterator[Tuple]:
+    """
+    Work units in source order:
+        ("files", [paths])                 consecutive .json files
+        ("lines", path, first_line, [raw]) a slice of a .jsonl / .jsonl.gz file
+    Line slices are read here (streaming) so a worker never holds a whole archive.
+
+    resume: a unit_position(); units up to and including it are skipped.
+    """
+    skip_lines = 0
+    if resume:
+        resume_path, resume_line = resume
+        if resume_path not in sources:
+            raise ValueError(f"Resume point not among the inputs: {resume_path}")
+        index = sources.index(resume_path)
+        if resume_line is None:
+            sources = sources[index + 1:]
+        else:
+            sources, skip_lines = sources[index:], resume_line - 1
+
+    batch = []
+    for path in sources:
+        if path.endswith(".json"):
+            batch.append(path)
+            if len(batch) >= SCAN_LOADER_BATCH_FILES:
+                yield ("files", batch)
+                batch = []
+            continue
+
+        if batch:
+            yield ("files", batch)
+            batch = []
+
+        with _open_lines(path) as f:
+            lines, first = [], skip_lines + 1
+            for number, line in enumerate(f, 1):
+                if number <= skip_lines:
+                    continue
+                lines.append(line)
+                if len(lines) >= SCAN_LOADER_BATCH_LINES:
+                    yield ("lines", path, first, lines)
+                    lines, first = [], number + 1
+            if lines:
+                yield ("lines", path, first, lines)
+        skip_lines = 0
+
+    if batch:
+        yield ("files", batch)
+
+
+def _load_scan(raw) -> Dict:
+    scan = _loads(raw)
+    if not isinstance(scan, dict):
+        raise ValueError(f"expected a JSON object, got {type(scan).__name__}")
+    return scan
+
+
+def parse_unit(unit: Tuple) -> Tuple[List[Dict], int, int, List[str]]:
+    """
+    Parses one unit (in a pool worker).
+
+    Returns:
+        (scans, files read, bytes read, error messages)
+    """
+    scans, errors, size = [], [], 0
+
+    if unit[0] == "files":
+        for path in unit[1]:
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                size += len(raw)
+                scans.append(_load_scan(raw))
+            except Exception as e:
+                errors.append(f"{os.path.basename(path)}: {e}")
+        return scans, len(unit[1]), size, errors
+
+    _, path, first, lines = unit
+    for number, line in enumerate(lines, first):
+        size += len(line)
+        if not line.strip():
+            continue
+        try:
+            scans.append(_load_scan(line))
+        except Exception as e:
+            errors.append(f"{os.path.basename(path)}:{number}: {e}")
+    # a .jsonl file counts once, with its first slice
+    return scans, 1 if first == 1 else 0, size, errors
+
+
+# -------------------------------
+# Streaming
+# -------------------------------
+
+class LoadStats:
+    """Throughput counters for one load, printed as progress lines."""
+
+    def __init__(self, report_every: float = SCAN_LOADER_REPORT_SECONDS, out=sys.stdout):
+        self.started = time.perf_counter()
+        self.files = self.scans = self.bytes = self.errors = 0
+        self._report_every = report_every
+        self._last_report = self.started
+        self._out = out
+
+    def add(self, files: int, scans: int, size: int, errors: int):
+        self.files += files
+        self.scans += scans
+        self.bytes += size
+        self.errors += errors
+        now = time.perf_counter()
+        if self._out and self._report_every and now - self._last_report >= self._report_every:
+            self._last_report = now
+            print(f"[INFO] {self.summary()}", file=self._out)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed(), 1e-9)
+        return (
+            f"{self.files} files, {self.scans} scans, {self.errors} errors in {elapsed:.1f}s "
+            f"({self.files / elapsed:.0f} files/s, {self.scans / elapsed:.0f} scans/s, "
+            f"{self.bytes / elapsed / 1e6:.1f} MB/s)"
+        )
+
+
+def stream_scans(
+    inputs: List[str],
+    workers: int = None,
+    processes: bool = False,
+    stats: Optional[LoadStats] = None,
+    resume: Tuple[str, Optional[int]] = None,
+) -> Iterator[Tuple[Tuple, List[Dict]]]:
+    """
+    Yields (unit, scans) for every unit of the inputs, in unit order, parsed
+    by a bounded pool (threads, or processes for parse-bound loads).
+    Unparseable files / lines are reported on stderr and skipped.
+    resume: skip the units up to a unit_position() (see iter_units).
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    stats = stats or LoadStats()
+    pool_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+    with pool_type(max_workers=workers) as pool:
+        pending = deque()
+        units = iter_units(scan_sources(inputs), resume)
+
+        def drain_one():
+            unit, future = pending.popleft()
+            scans, files, size, errors = future.result()
+            for error in errors:
+                print(f"[WARN] Failed to load {error}", file=sys.stderr)
+            stats.add(files, len(scans), size, len(errors))
+            return unit, scans
+
+        for unit in units:
+            if len(pending) >= workers * SCAN_LOADER_QUEUE_DEPTH:
+                yield drain_one()
+            pending.append((unit, pool.submit(parse_unit, unit)))
+
+        while pending:
+            yield drain_one()
+
+
+# -------------------------------
+# Latest scan per host
+# -------------------------------
+
+def scan_timestamp(scan: Dict) -> Optional[datetime]:
+    """The agent's metadata.scan_time_utc as an aware datetime, or None."""
+    value = (scan.get("metadata") or {}).get("scan_time_utc")
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class LatestScans:
+    """
+    Keeps only the newest scan per host (by metadata.scan_time_utc; on a tie
+    or without a time, the first one seen). Scans without a hostname are
+    each their own host, as in unique_host_scans.
+    """
+
+    def __init__(self):
+        self._latest = {}
+        self._anonymous = []
+        self.seen = 0
+
+    def add(self, scan: Dict):
+        self.seen += 1
+        hostname = scan.get("hostname") or (scan.get("system") or {}).get("hostname")
+        if not hostname:
+            self._anonymous.append(scan)
+            return
+
+        key = str(hostname).strip().lower()
+        ts = scan_timestamp(scan)
+        current = self._latest.get(key)
+        if current is None or (ts is not None and (current[0] is None or ts > current[0])):
+            self._latest[key] = (ts, scan)
+
+    def __len__(self):
+        return len(self._latest) + len(self._anonymous)
+
+    def scans(self) -> List[Dict]:
+        return [scan for _, scan in self._latest.values()] + self._anonymous
+
+
+def load_latest_scans(
+    inputs: List[str],
+    workers: int = None,
+    processes: bool = False,
+    stats: Optional[LoadStats] = None,
+) -> List[Dict]:
+    """Streams the inputs and returns the newest scan per host."""
+    latest = LatestScans()
+    for _, scans in stream_scans(inputs, workers, processes, stats):
+        for scan in scans:
+            latest.add(scan)
+    return latest.scans()
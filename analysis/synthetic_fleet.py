@@ -0,0 +1,80 @@
+"""
+synthetic_fleet.py
+
+Random, agent-shaped scans for tests and benchmarks of the systemic
+analysis engines.
+
+Fleets have several scans per host, mixed hostname casing and randomly
+missing sections / values, so every engine has to handle the same edge
+cases as with real agents. Generation is deterministic per seed.
+"""
+
+import random
+
+
+CIS_CONTROL_IDS = [
+    "1.1.1", "1.1.2", "1.2.1", "2.3.1", "9.1", "18.3.1", "18.5.1",
+    "18.9.1", "18.9.2", "13.1", "17.1.1", "18.9.3",
+]
+
+
+def _maybe(rng, value, p_missing=0.1):
+    return None if rng.random() < p_missing else value
+
+
+def generate_scan(rng, hostname):
+    """One agent-shaped scan with randomized posture."""
+    scan = {"hostname": hostname if rng.random() < 0.8 else None,
+            "system": {"hostname": hostname, "os": "Windows"}}
+
+    if rng.random() > 0.1:
+        scan["security_controls"] = {
+            "firewall_status": _maybe(rng, rng.random() < 0.3),
+            "antivirus_effective_status": rng.choice(["enabled", "disabled", "unknown", None]),
+        }
+    if rng.random() > 0.1:
+        scan["privilege_posture"] = {
+            "user_is_admin": _maybe(rng, rng.random() < 0.6),
+            "uac_enabled": _maybe(rng, rng.random() < 0.8),
+        }
+    if rng.random() > 0.1:
+        ports = [{"port": p} for p in rng.sample([135, 139, 445, 3389, 5985], rng.randint(0, 2))]
+        scan["exposure_posture"] = {
+            "rdp_enabled": _maybe(rng, rng.random() < 0.4),
+            "smbv1_enabled": _maybe(rng, rng.random() < 0.2),
+            "winrm_enabled": _maybe(rng, rng.random() < 0.3),
+            "remote_registry_enabled": rng.random() < 0.1,
+            "risky_listening_ports": ports,
+        }
+        scan["listening_ports_count"] = rng.randint(3, 40)
+        scan["risky_listening_ports"] = ports
+    scan["features"] = {
+        "av_enabled": rng.choice([0, 1]),
+        "firewall_any_off": rng.choice([0, 1]),
+        "software_count": rng.randint(10, 200),
+        "large_attack_surface": rng.choice([0, 1]),
+    }
+    if rng.random() > 0.15:
+        controls = [{
+            "control_id": cid,
+            "status": "non-compliant" if rng.random() < 0.35 else "compliant",
+            "severity_weight": rng.choice([1, 2, 3]),
+        } for cid in CIS_CONTROL_IDS]
+        score = {"non_compliant_count": sum(c["status"] == "non-compliant" for c in controls)}
+        if rng.random() > 0.1:
+            score["weighted_score"] = round(rng.uniform(30, 100), 2)
+        scan["cis_compliance"] = {"controls": controls, "compliance_score": score}
+    return scan
+
+
+def generate_fleet(seed, n_hosts, max_scans_per_host):
+    """Scans for n_hosts hosts, several per host with varying hostname casing, shuffled."""
+    rng = random.Random(seed)
+    scans = []
+    for h in range(n_hosts):
+        name = f"Host-{h:04d}"
+        for _ in range(rng.randint(1, max_scans_per_host)):
+            hostname = rng.choice([name, name.lower(), f"  {name.upper()} "])
+            scans.append(generate_scan(rng, hostname))
+    rng.shuffle(scans)
+    return scans
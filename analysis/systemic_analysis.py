@@ -3,7 +3,9 @@
 import json
 import os
 from collections import defaultdict
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from analysis.issue_rules import RuleSet, active_rules
 
 
 # -------------------------------
@@ -12,6 +14,47 @@ from typing import List, Dict
 
 DEFAULT_THRESHOLD = 0.7  # 70% endpoints → systemic
 
+CIS_LOW_COMPLIANCE_SCORE = 70  # Below 70% is concerning
+
+# The built-in rule set (issue_rules.json) mirrored as constants for the engines
+# that implement it directly (columnar, mongo pipeline, incremental ordering).
+
+# Specific high-impact CIS controls tracked as their own issues (control_id -> issue),
+# in the order the agent collects them
+CIS_CONTROL_ISSUES = {
+    "1.1.1": "cis_weak_password_policy",    # Password Length (High)
+    "2.3.1": "cis_guest_account_enabled",   # Guest Account (Critical)
+    "18.3.1": "cis_smbv1_enabled",          # SMBv1 (Critical)
+    "18.9.1": "cis_rdp_enabled",            # RDP Enabled (High)
+    "18.9.3": "cis_bitlocker_disabled",     # BitLocker (Critical)
+}
+
+# Every issue analyze_systemic_risk can report, in the order it checks them per host
+ISSUE_ORDER = [
+    "firewall_disabled",
+    "antivirus_not_confirmed",
+    "admin_user",
+    "uac_disabled",
+    "rdp_enabled",
+    "smbv1_enabled",
+    "winrm_enabled",
+    "risky_ports_exposed",
+    "cis_low_compliance",
+    "cis_critical_failures",
+    *CIS_CONTROL_ISSUES.values(),
+]
+
+# Group-by keys for segmented posture: key -> field paths tried in order.
+# "endpoint." paths read endpoint metadata the caller attaches under scan["endpoint"];
+# any other key is used as a field path into the scan itself (e.g. "system.domain").
+SEGMENT_FIELDS = {
+    "os": ["endpoint.os", "system.os", "os"],
+    "site": ["endpoint.site", "site"],
+    "tag": ["endpoint.tags", "tags"],
+}
+
+UNKNOWN_SEGMENT = "unknown"
+
 
 # -------------------------------
 # Utility Functions
@@ -21,6 +64,7 @@ def load_scan_files(scan_folder: str) -> List[Dict]:
     """
     Load all JSON scan files from a folder.
     Each file represents one endpoint scan.
+    For large archives use scan_loader.load_latest_scans (parallel, streaming).
     """
     scans = []
 
@@ -51,103 +95,120 @@ def _host_id(scan: Dict) -> str:
     return str(id(scan))
 
 
+def unique_host_scans(scan_results: List[Dict]) -> List[Dict]:
+    """
+    First scan per host, in input order, so each host is counted at most once.
+    """
+    host_to_scan: Dict[str, Dict] = {}
+    for scan in scan_results:
+        hid = _host_id(scan)
+        if hid not in host_to_scan:
+            host_to_scan[hid] = scan
+    return list(host_to_scan.values())
+
+
+def host_issue_counts(scan: Dict, rules: RuleSet = None) -> Dict[str, int]:
+    """
+    Returns one host's contribution to each issue counter, in check order.
+    Issues that do not apply to the host are omitted.
+    The checks are the issue rules (see issue_rules.py); default: the active ones.
+    """
+    return (rules or active_rules()).host_issue_counts(scan)
+
+
+def _field(scan: Dict, path: str):
+    value = scan
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def segment_values(scan: Dict, key: str) -> List[str]:
+    """
+    Segments of `key` the host belongs to (several for list fields such as tags),
+    or [UNKNOWN_SEGMENT] if none of the key's fields are set.
+    """
+    for path in SEGMENT_FIELDS.get(key, [key]):
+        value = _field(scan, path)
+        if isinstance(value, list):
+            values = sorted({str(v).strip() for v in value if v not in (None, "")})
+            if values:
+                return values
+        elif value not in (None, ""):
+            return [str(value).strip()]
+    return [UNKNOWN_SEGMENT]
+
+
+def segment_results(segment_counters: Dict, issue_order: List[str] = ISSUE_ORDER) -> List[Dict]:
+    """
+    {(key, value): (hosts, issue_counter)} -> compact per-segment results,
+    ordered by key then value; issues in issue_order.
+    A list (not a mapping) because segment values may contain any character.
+    """
+    return [
+        {
+            "key": key,
+            "value": value,
+            "total_hosts": hosts,
+            "issues": {i: counter[i] for i in issue_order if counter.get(i, 0) > 0},
+        }
+        for (key, value), (hosts, counter) in sorted(segment_counters.items())
+    ]
+
+
 def analyze_systemic_risk(
     scan_results: List[Dict],
-    threshold: float = DEFAULT_THRESHOLD
+    threshold: float = DEFAULT_THRESHOLD,
+    segment_by: Optional[List[str]] = None
 ) -> Dict:
     """
     Perform organization-level normalization of endpoint posture signals.
     Counts unique hosts only (same host with multiple scans is counted once).
+
+    With segment_by (keys of SEGMENT_FIELDS or scan field paths), per-segment
+    host and issue counts are collected in the same pass and returned under
+    "segments" (see segment_results).
     """
 
     if not scan_results:
         raise ValueError("No scan results provided")
 
-    # Group scans by host so we count each host at most once
-    host_to_scan: Dict[str, Dict] = {}
-    for scan in scan_results:
-        hid = _host_id(scan)
-        if hid not in host_to_scan:
-            host_to_scan[hid] = scan
-
-    unique_scans = list(host_to_scan.values())
+    unique_scans = unique_host_scans(scan_results)
     total_hosts = len(unique_scans)
+    rules = active_rules()
 
     issue_counter = defaultdict(int)
+    segment_counters = {}
 
     for scan in unique_scans:
-        # --- Security Controls ---
-        security_controls = scan.get("security_controls", {})
-        if security_controls.get("firewall_status") is False:
-            issue_counter["firewall_disabled"] += 1
-
-        if security_controls.get("antivirus_effective_status") in ["disabled", "unknown"]:
-            issue_counter["antivirus_not_confirmed"] += 1
-
-        # --- Privilege Posture ---
-        privilege = scan.get("privilege_posture", {})
-        if privilege.get("user_is_admin") is True:
-            issue_counter["admin_user"] += 1
-
-        if privilege.get("uac_enabled") is False:
-            issue_counter["uac_disabled"] += 1
-
-        # --- Exposure Posture ---
-        exposure = scan.get("exposure_posture", {})
-        if exposure.get("rdp_enabled") is True:
-            issue_counter["rdp_enabled"] += 1
-
-        if exposure.get("smbv1_enabled") is True:
-            issue_counter["smbv1_enabled"] += 1
-
-        if exposure.get("winrm_enabled") is True:
-            issue_counter["winrm_enabled"] += 1
-
-        if exposure.get("risky_listening_ports"):
-            issue_counter["risky_ports_exposed"] += 1
-
-        # --- CIS Compliance ---
-        cis = scan.get("cis_compliance", {})
-        cis_score = cis.get("compliance_score", {})
-        cis_controls = cis.get("controls", [])
-        
-        # Track CIS weighted score
-        weighted_score = cis_score.get("weighted_score", 0)
-        if weighted_score < 70:  # Below 70% is concerning
-            issue_counter["cis_low_compliance"] += 1
-        
-        # Track critical CIS failures
-        critical_failures = sum(
-            1 for c in cis_controls 
-            if c.get("status") == "non-compliant" and c.get("severity_weight") == 3
-        )
-        if critical_failures > 0:
-            issue_counter["cis_critical_failures"] += 1
-        
-        # Track specific high-impact CIS controls
-        for control in cis_controls:
-            if control.get("status") == "non-compliant":
-                cid = control.get("control_id", "")
-                
-                # Guest Account (Critical)
-                if cid == "2.3.1":
-                    issue_counter["cis_guest_account_enabled"] += 1
-                
-                # BitLocker (Critical)
-                elif cid == "18.9.3":
-                    issue_counter["cis_bitlocker_disabled"] += 1
-                
-                # SMBv1 (Critical)
-                elif cid == "18.3.1":
-                    issue_counter["cis_smbv1_enabled"] += 1
-                
-                # Password Length (High)
-                elif cid == "1.1.1":
-                    issue_counter["cis_weak_password_policy"] += 1
-                
-                # RDP Enabled (High)
-                elif cid == "18.9.1":
-                    issue_counter["cis_rdp_enabled"] += 1
+        counts = rules.host_issue_counts(scan)
+        for issue, count in counts.items():
+            issue_counter[issue] += count
+
+        for key in segment_by or ():
+            for value in segment_values(scan, key):
+                segment = segment_counters.setdefault((key, value), [0, defaultdict(int)])
+                segment[0] += 1
+                for issue, count in counts.items():
+                    segment[1][issue] += count
+
+    result = classify_issues(issue_counter, total_hosts, threshold)
+    if segment_by:
+        result["segments"] = segment_results(segment_counters, rules.issue_order)
+    return result
+
+
+def classify_issues(
+    issue_counter: Dict[str, int],
+    total_hosts: int,
+    threshold: float = DEFAULT_THRESHOLD
+) -> Dict:
+    """
+    Builds the posture result from per-issue affected-host counts.
+    Findings keep the order of issue_counter.
+    """
 
     # -------------------------------
     # Normalization: Deciding whether something is an exception or the norm.
@@ -157,6 +218,8 @@ def analyze_systemic_risk(
     isolated_issues = []
 
     for issue, count in issue_counter.items():
+        if count <= 0:
+            continue
         ratio = count / total_hosts
 
         finding = {
@@ -196,22 +259,36 @@ def analyze_systemic_risk(
 # -------------------------------
 
 def main():
+    import argparse
+    from analysis.scan_loader import LoadStats, load_latest_scans, JSON_PARSER
+
     # Path resolution relative to analysis/ folder
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    scans_folder = os.path.join(project_root, "scans\\ScanV2")       #relative path(to change)
-    output_file = os.path.join(project_root, "org_posture.json")
 
-    print("[INFO] Loading endpoint scan files...")
-    scan_results = load_scan_files(scans_folder)
-    print(f"[INFO] Loaded {len(scan_results)} endpoint scans")
+    parser = argparse.ArgumentParser(description="Offline organization posture analysis of scan files")
+    parser.add_argument("inputs", nargs="*",
+                        default=[os.path.join(project_root, "scans", "ScanV2")],
+                        help="scan folders or .json / .jsonl / .jsonl.gz files (default: scans/ScanV2)")
+    parser.add_argument("--output", default=os.path.join(project_root, "org_posture.json"))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None, help="parser pool size")
+    parser.add_argument("--processes", action="store_true",
+                        help="parse in worker processes instead of threads (parse-bound loads)")
+    args = parser.parse_args()
+
+    print(f"[INFO] Loading endpoint scans ({JSON_PARSER} parser)...")
+    stats = LoadStats()
+    scan_results = load_latest_scans(args.inputs, args.workers, args.processes, stats)
+    print(f"[INFO] Loaded {stats.summary()}")
+    print(f"[INFO] Latest scans kept for {len(scan_results)} hosts")
 
     print("[INFO] Performing systemic posture analysis...")
-    org_posture = analyze_systemic_risk(scan_results)
+    org_posture = analyze_systemic_risk(scan_results, args.threshold)
 
-    with open(output_file, "w", encoding="utf-8") as f:
+    with open(args.output, "w", encoding="utf-8") as f:
         json.dump(org_posture, f, indent=2)
 
-    print(f"[SUCCESS] Organization posture saved to {output_file}")
+    print(f"[SUCCESS] Organization posture saved to {args.output}")
 
 
 if __name__ == "__main__":
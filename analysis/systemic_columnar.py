@@ -0,0 +1,199 @@
+"""
+systemic_columnar.py
+
+Columnar engine for systemic analysis.
+
+The latest scan per host is flattened once into NumPy columns (one boolean
+column per host-level check, plus a host x tracked-CIS-control matrix of
+non-compliant entries); every issue count is then a vectorized reduction.
+
+analyze_systemic_risk_columnar() returns exactly what
+systemic_analysis.analyze_systemic_risk() returns, including finding order.
+Build FleetColumns once and call analyze() per threshold for what-if runs.
+With segment_by, each segment is a boolean host mask and its counts are the
+same reductions restricted to that mask.
+"""
+
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from analysis.systemic_analysis import (
+    CIS_CONTROL_ISSUES,
+    CIS_LOW_COMPLIANCE_SCORE,
+    DEFAULT_THRESHOLD,
+    ISSUE_ORDER,
+    classify_issues,
+    segment_results,
+    segment_values,
+    unique_host_scans,
+)
+
+
+# Host-level checks, in the order host_issue_counts applies them
+_HOST_CHECKS = [
+    "firewall_disabled",
+    "antivirus_not_confirmed",
+    "admin_user",
+    "uac_disabled",
+    "rdp_enabled",
+    "smbv1_enabled",
+    "winrm_enabled",
+    "risky_ports_exposed",
+    "cis_low_compliance",
+    "cis_critical_failures",
+]
+
+# Tracked CIS control_id -> matrix column
+_CONTROL_COLUMNS = {cid: i for i, cid in enumerate(CIS_CONTROL_ISSUES)}
+_CONTROL_ISSUES = list(CIS_CONTROL_ISSUES.values())
+
+
+def _bool_column(values, n: int) -> np.ndarray:
+    return np.fromiter(values, dtype=bool, count=n)
+
+
+class FleetColumns:
+    """
+    Columnar view of one scan per host.
+
+    Attributes:
+        total_hosts:    number of hosts (rows)
+        checks:         {issue: bool[total_hosts]} for the host-level checks
+        control_counts: int32[total_hosts, tracked controls], non-compliant entries per host
+        control_first:  int32[total_hosts, tracked controls], position of the first such
+                        entry in the host's control list (used only for finding order)
+        segments:       {(key, value): bool[total_hosts]} host membership per segment
+    """
+
+    def __init__(self, unique_scans: List[Dict], segment_by: Optional[List[str]] = None):
+        n = len(unique_scans)
+        self.total_hosts = n
+
+        self.segments = {}
+        for key in segment_by or ():
+            members = {}
+            for host, scan in enumerate(unique_scans):
+                for value in segment_values(scan, key):
+                    members.setdefault(value, []).append(host)
+            for value, hosts in members.items():
+                mask = np.zeros(n, dtype=bool)
+                mask[hosts] = True
+                self.segments[(key, value)] = mask
+
+        security = [s.get("security_controls", {}) for s in unique_scans]
+        privilege = [s.get("privilege_posture", {}) for s in unique_scans]
+        exposure = [s.get("exposure_posture", {}) for s in unique_scans]
+        cis = [s.get("cis_compliance", {}) for s in unique_scans]
+        controls = [c.get("controls", []) for c in cis]
+
+        weighted_score = np.fromiter(
+            (c.get("compliance_score", {}).get("weighted_score", 0) for c in cis), dtype=float, count=n
+        )
+
+        # Flatten the non-compliant control entries of every host into parallel arrays
+        nc_host, nc_position, nc_critical, nc_column = [], [], [], []
+        for host, host_controls in enumerate(controls):
+            for pos, ctrl in enumerate(host_controls):
+                if ctrl.get("status") == "non-compliant":
+                    nc_host.append(host)
+                    nc_position.append(pos)
+                    nc_critical.append(ctrl.get("severity_weight") == 3)
+                    nc_column.append(_CONTROL_COLUMNS.get(ctrl.get("control_id", ""), -1))
+
+        host_idx = np.array(nc_host, dtype=np.int64)
+        position = np.array(nc_position, dtype=np.int32)
+        critical = np.array(nc_critical, dtype=bool)
+        column = np.array(nc_column, dtype=np.int64)
+
+        critical_per_host = np.bincount(host_idx[critical], minlength=n)
+
+        self.checks = {
+            "firewall_disabled": _bool_column((x.get("firewall_status") is False for x in security), n),
+            "antivirus_not_confirmed": _bool_column(
+                (x.get("antivirus_effective_status") in ["disabled", "unknown"] for x in security), n
+            ),
+            "admin_user": _bool_column((x.get("user_is_admin") is True for x in privilege), n),
+            "uac_disabled": _bool_column((x.get("uac_enabled") is False for x in privilege), n),
+            "rdp_enabled": _bool_column((x.get("rdp_enabled") is True for x in exposure), n),
+            "smbv1_enabled": _bool_column((x.get("smbv1_enabled") is True for x in exposure), n),
+            "winrm_enabled": _bool_column((x.get("winrm_enabled") is True for x in exposure), n),
+            "risky_ports_exposed": _bool_column((bool(x.get("risky_listening_ports")) for x in exposure), n),
+            "cis_low_compliance": weighted_score < CIS_LOW_COMPLIANCE_SCORE,
+            "cis_critical_failures": critical_per_host > 0,
+        }
+
+        # Host x tracked-control matrix of non-compliant entries
+        k = len(_CONTROL_COLUMNS)
+        tracked = column >= 0
+        cells = host_idx[tracked] * k + column[tracked]
+        self.control_counts = np.bincount(cells, minlength=n * k).astype(np.int32).reshape(n, k)
+
+        # Entries are in (host, position) order, so a cell's first entry has its lowest position
+        self.control_first = np.full(n * k, np.iinfo(np.int32).max, dtype=np.int32)
+        first_cells, first_entries = np.unique(cells, return_index=True)
+        self.control_first[first_cells] = position[tracked][first_entries]
+        self.control_first = self.control_first.reshape(n, k)
+
+    @classmethod
+    def from_scans(cls, scan_results: List[Dict], segment_by: Optional[List[str]] = None) -> "FleetColumns":
+        """Deduplicates to the first scan per host, like analyze_systemic_risk."""
+        return cls(unique_host_scans(scan_results), segment_by)
+
+    def issue_counts(self) -> Dict[str, int]:
+        """
+        {issue: count} for issues with count > 0, in the order the dict engine
+        inserts them: first affected host, then check order within that host
+        (tracked controls by their position in the host's control list).
+        """
+        ranked = []
+
+        for rank, issue in enumerate(_HOST_CHECKS):
+            column = self.checks[issue]
+            count = int(np.count_nonzero(column))
+            if count:
+                ranked.append((int(column.argmax()), rank, issue, count))
+
+        totals = self.control_counts.sum(axis=0)
+        first_host = (self.control_counts > 0).argmax(axis=0)
+        for j, issue in enumerate(_CONTROL_ISSUES):
+            if totals[j]:
+                host = int(first_host[j])
+                rank = len(_HOST_CHECKS) + int(self.control_first[host, j])
+                ranked.append((host, rank, issue, int(totals[j])))
+
+        ranked.sort()
+        return {issue: count for _, _, issue, count in ranked}
+
+    def masked_counts(self, mask: np.ndarray) -> Dict[str, int]:
+        """{issue: count} over the hosts in mask, for issues with count > 0."""
+        counts = {issue: int(np.count_nonzero(self.checks[issue] & mask)) for issue in _HOST_CHECKS}
+        totals = self.control_counts[mask].sum(axis=0)
+        counts.update({issue: int(totals[j]) for j, issue in enumerate(_CONTROL_ISSUES)})
+        return {i: counts[i] for i in ISSUE_ORDER if counts.get(i, 0) > 0}
+
+    def segment_results(self) -> List[Dict]:
+        return segment_results({
+            segment: (int(np.count_nonzero(mask)), self.masked_counts(mask))
+            for segment, mask in self.segments.items()
+        })
+
+    def analyze(self, threshold: float = DEFAULT_THRESHOLD) -> Dict:
+        result = classify_issues(self.issue_counts(), self.total_hosts, threshold)
+        if self.segments:
+            result["segments"] = self.segment_results()
+        return result
+
+
+def analyze_systemic_risk_columnar(
+    scan_results: List[Dict],
+    threshold: float = DEFAULT_THRESHOLD,
+    segment_by: Optional[List[str]] = None
+) -> Dict:
+    """
+    Drop-in replacement for analyze_systemic_risk using the columnar engine.
+    """
+    if not scan_results:
+        raise ValueError("No scan results provided")
+
+    return FleetColumns.from_scans(scan_results, segment_by).analyze(threshold)
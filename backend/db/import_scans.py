@@ -0,0 +1,247 @@
+"""
+import_scans.py
+
+Command-line bulk importer for historical scans.
+
+Reads scan folders (e.g. scans/ScanV2) and .jsonl / .jsonl.gz archives in
+parallel (analysis/scan_loader.py), derives endpoint records the way
+POST /api/scans/ does (agent endpoint_id, else hostname) and writes scans in
+batches with unordered bulk_write / insert_many.
+
+Each scan gets a deterministic _id (its scan time + a content hash), so
+re-importing the same scan is a no-op. Scans without metadata.scan_time_utc
+are skipped: they have no place in the history and would otherwise become
+their host's newest scan. After every written batch the
+position in the inputs is saved to a checkpoint file; a rerun with the same
+inputs resumes from there. Once done, the incremental posture counters and
+the CIS control matrix are rebuilt from the imported scans.
+
+Usage:
+    python -m backend.db.import_scans scans/ScanV2 archive.jsonl.gz [--batch-size 1000]
+        [--workers N] [--processes] [--checkpoint FILE] [--restart] [--no-rebuild]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from analysis.scan_loader import LoadStats, stream_scans, unit_position, scan_timestamp
+from backend.db.mongo import DB_NAME, endpoints_collection, endpoint_scans_collection
+
+try:
+    import orjson
+
+    def _canonical(scan: dict) -> bytes:
+        return orjson.dumps(scan, option=orjson.OPT_SORT_KEYS, default=str)
+except ImportError:  # optional speed-up
+    def _canonical(scan: dict) -> bytes:
+        return json.dumps(scan, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+DEFAULT_CHECKPOINT = ".scan_import_checkpoint.json"
+
+# Duplicate key: the scan was imported before
+DUPLICATE_KEY = 11000
+
+
+def scan_object_id(scan: dict, scan_time: datetime) -> ObjectId:
+    """Deterministic _id: 4-byte scan time (like any ObjectId) + 8-byte content hash."""
+    seconds = int(scan_time.timestamp()) & 0xFFFFFFFF
+    digest = hashlib.blake2b(_canonical(scan), digest_size=8).digest()
+    return ObjectId(seconds.to_bytes(4, "big") + digest)
+
+
+# -------------------------------
+# Checkpoints
+# -------------------------------
+
+def load_checkpoint(path: str, inputs: list):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("inputs") != inputs:
+        raise SystemExit(f"[ERROR] Checkpoint {path} belongs to other inputs; use --restart or --checkpoint")
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)  # atomic: a crash leaves the old or the new checkpoint
+
+
+# -------------------------------
+# Batch writer
+# -------------------------------
+
+class ScanImporter:
+    """Writes batches of parsed scans with their endpoint records."""
+
+    def __init__(self):
+        self.hostname_ids = {}  # legacy endpoints: hostname -> endpoints _id
+        self.inserted = self.duplicates = self.skipped = self.endpoints = 0
+
+    def _legacy_endpoint_ids(self, scans_by_host: dict):
+        """Upserts hostname-only endpoints and maps hostname -> _id."""
+        missing = [h for h in scans_by_host if h not in self.hostname_ids]
+        if not missing:
+            return
+
+        result = endpoints_collection().bulk_write([
+            UpdateOne(
+                {"hostname": hostname},
+                {"$setOnInsert": {"os": os_name}, "$max": {"last_seen": last_seen}},
+                upsert=True,
+            )
+            for hostname, (os_name, last_seen) in scans_by_host.items() if hostname in missing
+        ], ordered=False)
+        self.endpoints += result.upserted_count
+
+        for doc in endpoints_collection().find({"hostname": {"$in": missing}}, {"hostname": 1}):
+            self.hostname_ids.setdefault(doc["hostname"], doc["_id"])
+
+    def write(self, scans: list):
+        records, agent_endpoints, legacy_endpoints = [], {}, {}
+
+        for scan in scans:
+            system_info = scan.get("system") or {}
+            hostname = scan.get("hostname") or system_info.get("hostname")
+            os_name = scan.get("os") or system_info.get("os")
+            scan_time = scan_timestamp(scan)
+            if not hostname or not os_name or scan_time is None:
+                self.skipped += 1  # no hostname / os is rejected by the upload route too
+                continue
+
+            agent_endpoint_id = scan.get("endpoint_id")
+            if agent_endpoint_id:
+                latest = agent_endpoints.get(agent_endpoint_id)
+                if latest is None or scan_time >= latest[2]:
+                    agent_endpoints[agent_endpoint_id] = (hostname, os_name, scan_time)
+            else:
+                latest = legacy_endpoints.get(hostname)
+                legacy_endpoints[hostname] = (os_name, max(scan_time, latest[1]) if latest else scan_time)
+
+            records.append({
+                "_id": scan_object_id(scan, scan_time),
+                "endpoint_id": agent_endpoint_id,
+                "hostname": hostname,
+                "scan_time": scan_time,
+                "scan_data": scan,
+            })
+
+        if agent_endpoints:
+            # hostname / os from the batch's newest scan, unless the endpoint was
+            # seen later (an old archive never overwrites a live endpoint)
+            operations = []
+            for endpoint_id, (hostname, os_name, scan_time) in agent_endpoints.items():
+                operations.append(UpdateOne(
+                    {"endpoint_id": endpoint_id},
+                    {"$setOnInsert": {"hostname": hostname, "os": os_name}, "$max": {"last_seen": scan_time}},
+                    upsert=True,
+                ))
+                operations.append(UpdateOne(
+                    {"endpoint_id": endpoint_id, "last_seen": {"$lte": scan_time}},
+                    {"$set": {"hostname": hostname, "os": os_name}},
+                ))
+            result = endpoints_collection().bulk_write(operations, ordered=False)
+            self.endpoints += result.upserted_count
+
+        if legacy_endpoints:
+            self._legacy_endpoint_ids(legacy_endpoints)
+
+        for record in records:
+            hostname = record.pop("hostname")
+            if record["endpoint_id"] is None:
+                record["endpoint_id"] = self.hostname_ids[hostname]
+
+        if not records:
+            return
+        try:
+            result = endpoint_scans_collection().insert_many(records, ordered=False)
+            self.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            other = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+            if other:
+                raise
+            self.duplicates += len(errors)
+            self.inserted += e.details.get("nInserted", 0)
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import scan folders / JSONL archives into MongoDB")
+    parser.add_argument("inputs", nargs="+", help="scan folders or .json / .jsonl / .jsonl.gz files")
+    parser.add_argument("--batch-size", type=int, default=1000, help="scans per bulk write")
+    parser.add_argument("--workers", type=int, default=None, help="parser pool size")
+    parser.add_argument("--processes", action="store_true", help="parse in worker processes instead of threads")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="resume file")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--no-rebuild", action="store_true",
+                        help="skip rebuilding posture counters and the CIS matrix afterwards")
+    args = parser.parse_args()
+
+    inputs = [os.path.abspath(path) for path in args.inputs]
+    checkpoint = None if args.restart else load_checkpoint(args.checkpoint, inputs)
+    resume = tuple(checkpoint["position"]) if checkpoint else None
+    if resume:
+        print(f"[INFO] Resuming after {resume[0]}" + (f" line {resume[1] - 1}" if resume[1] else ""))
+
+    print(f"[INFO] Importing into database '{DB_NAME}'...")
+    stats = LoadStats()
+    importer = ScanImporter()
+    started = time.perf_counter()
+
+    batch, position = [], None
+
+    def flush():
+        importer.write(batch)
+        save_checkpoint(args.checkpoint, {
+            "inputs": inputs,
+            "position": position,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        })
+        batch.clear()
+
+    for unit, scans in stream_scans(inputs, args.workers, args.processes, stats, resume):
+        batch.extend(scans)
+        position = unit_position(unit)
+        if len(batch) >= args.batch_size:
+            flush()
+    if position is not None:
+        flush()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"[INFO] Read {stats.summary()}")
+    print(
+        f"[SUCCESS] {importer.inserted} scans imported ({importer.inserted / elapsed:.0f} scans/s), "
+        f"{importer.duplicates} already present, {importer.skipped} without hostname/os/scan time, "
+        f"{importer.endpoints} new endpoints"
+    )
+
+    if not args.no_rebuild and importer.inserted:
+        from backend.services.posture_counters import verify_posture_counters
+        from backend.services.cis_matrix import rebuild_cis_matrix
+        verify_posture_counters()
+        print(f"[SUCCESS] Rebuilt posture counters and CIS matrix ({rebuild_cis_matrix()} hosts)")
+
+    if stats.errors:
+        print(f"[WARN] {stats.errors} files / lines could not be parsed (see above)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ This file intentionally avoids:
 - Interpretation logic
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -33,6 +35,45 @@ from backend.routes.interpretation_read import router as interpretation_read_rou
 from backend.routes.agent_jobs import router as agent_jobs_router
 from backend.routes.job_scheduler import router as job_scheduler_router
 from backend.routes.agent_register import router as agent_register_router
+from backend.routes.tasks import router as tasks_router
+from backend.routes.rules import router as rules_router
+from backend.routes.cis import router as cis_router
+from backend.routes.explanations import router as explanations_router
+from backend.services.job_sweeper import job_sweeper
+from backend.services.posture_counters import posture_verifier
+from backend.services.cis_matrix import cis_matrix_rebuilder
+from backend.services.task_queue import shutdown_pool
+from backend.services.auto_analysis import auto_analysis, AUTO_ANALYSIS_ENABLED
+from backend.services.llm_explanations import explainer
+from backend.services.ml_service import warm_load_models
+from backend.services.model_retraining import model_retrainer, ML_RETRAIN_ENABLED
+
+
+# -------------------------------
+# Background Tasks
+# -------------------------------
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts background workers with the app and stops them on shutdown.
+    """
+    warm_load_models()  # saved model version, so the first predict does not train
+    job_sweeper.start()
+    posture_verifier.start()  # first run builds the counters from existing scans
+    cis_matrix_rebuilder.start()  # likewise for the CIS control matrix
+    if AUTO_ANALYSIS_ENABLED:
+        auto_analysis.start()
+    if ML_RETRAIN_ENABLED:
+        model_retrainer.start()
+    yield
+    model_retrainer.stop()
+    auto_analysis.stop()
+    explainer.stop()  # started on first explanation request
+    cis_matrix_rebuilder.stop()
+    posture_verifier.stop()
+    job_sweeper.stop()
+    shutdown_pool()
 
 
 # -------------------------------
@@ -42,7 +83,8 @@ from backend.routes.agent_register import router as agent_register_router
 app = FastAPI(
     title="Organizational Security Posture API",
     description="Backend API for posture analysis and interpretation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -60,17 +102,6 @@ app.add_middleware(
 )
 
 
-# -------------------------------
-# Rate Limiting Configuration
-# -------------------------------
-from backend.limiter import limiter
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-
 # -------------------------------
 # Health & Sanity Endpoints
 # -------------------------------
@@ -135,6 +166,10 @@ app.include_router(agent_jobs_router)
 app.include_router(job_scheduler_router)
 app.include_router(agent_register_router)
 app.include_router(ml_router)
+app.include_router(tasks_router)
+app.include_router(rules_router)
+app.include_router(cis_router)
+app.include_router(explanations_router)
 
 
 # if __name__ == "__main__":
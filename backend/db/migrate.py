@@ -0,0 +1,47 @@
+"""
+migrate.py
+
+Command-line entry point to apply database migrations.
+
+Applies the declarative index set (mongo.INDEX_SPECS), which the API also
+applies at startup. With --rebuild-rollups, also recomputes the posture
+trend buckets from the stored snapshots; with --rebuild-cis-matrix, the
+host x CIS-control matrix from the stored scans.
+
+Usage:
+    python -m backend.db.migrate [--rebuild-rollups] [--rebuild-cis-matrix]
+"""
+
+import sys
+
+from backend.db.mongo import DB_NAME, ensure_indexes
+
+
+def main():
+    print(f"[INFO] Applying indexes to database '{DB_NAME}'...")
+    applied = ensure_indexes()
+
+    failed = False
+    for collection, result in applied.items():
+        if isinstance(result, str):
+            failed = True
+            print(f"[WARN] {collection}: {result}")
+        else:
+            print(f"[INFO] {collection}: {', '.join(result)}")
+
+    if failed:
+        raise SystemExit(1)
+
+    print("[SUCCESS] Indexes are up to date")
+
+    if "--rebuild-rollups" in sys.argv[1:]:
+        from backend.services.posture_rollups import rebuild_rollups
+        print(f"[SUCCESS] Rebuilt posture rollups from {rebuild_rollups()} snapshots")
+
+    if "--rebuild-cis-matrix" in sys.argv[1:]:
+        from backend.services.cis_matrix import rebuild_cis_matrix
+        print(f"[SUCCESS] Rebuilt CIS control matrix for {rebuild_cis_matrix()} hosts")
+
+
+if __name__ == "__main__":
+    main()
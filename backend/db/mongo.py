@@ -17,7 +17,7 @@ It is imported by backend routes and services.
 """
 
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel
 from pymongo.errors import ConnectionFailure
 from dotenv import load_dotenv
 
@@ -77,11 +77,107 @@ REQUIRED_COLLECTIONS = [
 ]
 
 
+# Declarative index set for the hot query paths.
+# Each route/service query should be served by one of these (see test_query_plans.py).
+INDEX_SPECS = {
+    "endpoints": [
+        # register / heartbeat / scan upload / job scheduler lookups
+        IndexModel([("endpoint_id", ASCENDING)], name="endpoint_id_idx"),
+        # legacy scan upload path (agents without endpoint_id)
+        IndexModel([("hostname", ASCENDING)], name="hostname_idx"),
+    ],
+    "endpoint_scans": [
+        # per-endpoint scan history and latest scan (scan_time desc)
+        IndexModel(
+            [("endpoint_id", ASCENDING), ("scan_time", DESCENDING)],
+            name="endpoint_scan_time_idx"
+        ),
+        # fleet-wide newest-first walk in systemic analysis
+        IndexModel([("scan_time", DESCENDING)], name="scan_time_idx"),
+    ],
+    "agent_jobs": [
+        # agent polling and duplicate-job checks
+        IndexModel(
+            [("endpoint_id", ASCENDING), ("status", ASCENDING), ("expires_at", ASCENDING)],
+            name="endpoint_status_expiry_idx"
+        ),
+        # expiry sweeps over pending/disconnected jobs
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="status_expiry_idx"),
+        IndexModel([("job_id", ASCENDING)], name="job_id_idx"),
+        # Jobs page (newest first)
+        IndexModel([("created_at", DESCENDING)], name="created_at_idx"),
+        # retention deletes by the job sweeper
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_idx"),
+    ],
+    "org_posture_snapshots": [
+        IndexModel([("generated_at", DESCENDING)], name="generated_at_idx"),
+    ],
+    "org_interpretations": [
+        IndexModel([("generated_at", DESCENDING)], name="generated_at_idx"),
+        IndexModel([("posture_snapshot_id", ASCENDING)], name="posture_snapshot_id_idx"),
+        # memoized interpretation lookup (interpretation_runner.py)
+        IndexModel([("posture_hash", ASCENDING)], name="posture_hash_idx"),
+    ],
+    "rate_limit_buckets": [
+        # buckets are looked up by _id; drop idle ones
+        IndexModel([("expires_at", ASCENDING)], name="bucket_ttl_index", expireAfterSeconds=0),
+    ],
+    "posture_rollups": [
+        # trend queries: one granularity over a time range
+        IndexModel([("granularity", ASCENDING), ("bucket_start", ASCENDING)], name="granularity_bucket_idx"),
+    ],
+    "analysis_tasks": [
+        # task status polling
+        IndexModel([("task_id", ASCENDING)], name="task_id_idx", unique=True),
+        # drop finished tasks after retention
+        IndexModel([("expires_at", ASCENDING)], name="task_ttl_index", expireAfterSeconds=0),
+    ],
+    "cis_host_controls": [
+        # failing hosts of one CIS control, paged by host
+        IndexModel([("failing", ASCENDING), ("_id", ASCENDING)], name="failing_host_idx"),
+    ],
+}
+
+
+# Indexes from earlier releases that must be removed before INDEX_SPECS is applied
+OBSOLETE_INDEXES = {
+    # job cleanup moved to backend/services/job_sweeper.py
+    "agent_jobs": ["job_ttl_index"],
+}
+
+
+def ensure_indexes() -> dict:
+    """
+    Drops OBSOLETE_INDEXES, then applies INDEX_SPECS. create_indexes is a no-op for indexes that already exist
+    with the same definition, so this is safe to run on every startup.
+
+    Returns:
+        {collection: [index names]} for indexes that were applied,
+        plus {collection: error string} for collections that failed.
+    """
+    for name, index_names in OBSOLETE_INDEXES.items():
+        for index_name in index_names:
+            try:
+                if index_name in db[name].index_information():
+                    db[name].drop_index(index_name)
+            except Exception:
+                pass
+
+    applied = {}
+    for name, models in INDEX_SPECS.items():
+        try:
+            applied[name] = db[name].create_indexes(models)
+        except Exception as e:
+            # e.g. an index with the same name but different options already exists
+            applied[name] = f"error: {e}"
+    return applied
+
+
 def ensure_database_exists():
     """
     Ensure the database and required collections exist.
     MongoDB creates the database and a collection on first write; we do one insert+delete per collection.
-    Also creates necessary indexes including TTL index for job expiration.
+    Also applies the declarative index set (INDEX_SPECS).
     """
     for name in REQUIRED_COLLECTIONS:
         try:
@@ -90,18 +186,8 @@ def ensure_database_exists():
             coll.delete_one({"_init": 1})
         except Exception:
             pass
-    
-    # Create TTL index on agent_jobs collection
-    # MongoDB will automatically delete documents 300 seconds (5 min) after expires_at
-    try:
-        db["agent_jobs"].create_index(
-            "expires_at",
-            expireAfterSeconds=300,
-            name="job_ttl_index"
-        )
-    except Exception as e:
-        # Index might already exist, that's fine
-        pass
+
+    ensure_indexes()
 
 
 # -------------------------------
@@ -130,3 +216,36 @@ def org_interpretations_collection():
 def agent_jobs_collection():
     return db["agent_jobs"]
 
+
+def rate_limit_buckets_collection():
+    return db["rate_limit_buckets"]
+
+def analysis_tasks_collection():
+    return db["analysis_tasks"]
+
+def task_leases_collection():
+    return db["task_leases"]
+
+def auto_analysis_state_collection():
+    return db["auto_analysis_state"]
+
+def posture_snapshot_chain_collection():
+    return db["posture_snapshot_chain"]
+
+def posture_rollups_collection():
+    return db["posture_rollups"]
+
+def posture_counters_collection():
+    return db["posture_counters"]
+
+def posture_host_contributions_collection():
+    return db["posture_host_contributions"]
+
+def cis_host_controls_collection():
+    return db["cis_host_controls"]
+
+def cis_control_counters_collection():
+    return db["cis_control_counters"]
+
+def llm_explanations_collection():
+    return db["llm_explanations"]
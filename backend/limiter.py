@@ -1,4 +1,167 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+limiter.py
 
-limiter = Limiter(key_func=get_remote_address)
+Rate limiting for agent-facing routes.
+
+Limits are token buckets keyed on endpoint identity (not client IP), so agents
+behind NAT or a reverse proxy each get their own budget. Bucket state lives in
+MongoDB and is updated atomically, so every uvicorn worker shares the same counters.
+
+The identity is the endpoint_id the request acts on (path parameter or JSON
+body), and only if it names a registered endpoint; anything else shares the
+client IP's bucket. The X-Endpoint-ID header is client-supplied and never
+used, so rotating it (or inventing endpoint ids) does not buy fresh buckets.
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+from functools import wraps
+
+from bson import ObjectId
+from fastapi import HTTPException, Request
+from limits import parse
+from pymongo import ReturnDocument
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+# Rates use limits notation ("5/minute"); burst is the bucket capacity.
+SCAN_UPLOAD_RATE_LIMIT = os.getenv("SCAN_UPLOAD_RATE_LIMIT", "5/minute")
+SCAN_UPLOAD_BURST = int(os.getenv("SCAN_UPLOAD_BURST", "5"))
+
+JOB_POLL_RATE_LIMIT = os.getenv("JOB_POLL_RATE_LIMIT", "1/30seconds")
+JOB_POLL_BURST = int(os.getenv("JOB_POLL_BURST", "2"))
+
+# Check-in replaces heartbeat + poll + ack; allow a quick follow-up after a job
+CHECKIN_RATE_LIMIT = os.getenv("CHECKIN_RATE_LIMIT", "2/30seconds")
+CHECKIN_BURST = int(os.getenv("CHECKIN_BURST", "4"))
+
+# Registration creates identities, so it is limited per client IP
+REGISTER_RATE_LIMIT = os.getenv("REGISTER_RATE_LIMIT", "30/minute")
+REGISTER_BURST = int(os.getenv("REGISTER_BURST", "30"))
+
+# Idle buckets are removed by the TTL index this long after their last use
+BUCKET_IDLE_TTL_SECONDS = 3600
+
+
+def is_registered_endpoint(endpoint_id: str) -> bool:
+    """True if endpoint_id names a stored endpoint (agent UUID, or legacy ObjectId)."""
+    from backend.db.mongo import endpoints_collection
+
+    query = {"endpoint_id": endpoint_id}
+    if ObjectId.is_valid(endpoint_id):
+        query = {"$or": [query, {"_id": ObjectId(endpoint_id)}]}
+    return endpoints_collection().find_one(query, {"_id": 1}) is not None
+
+
+def endpoint_identity(request: Request, endpoint_id=None) -> str:
+    """
+    Rate-limit key for a request: the endpoint_id it acts on if that is a
+    registered endpoint, else the client IP.
+    """
+    endpoint_id = str(endpoint_id or "").strip()
+    if endpoint_id and is_registered_endpoint(endpoint_id):
+        return f"endpoint:{endpoint_id}"
+    return f"ip:{request.client.host if request.client else '127.0.0.1'}"
+
+
+class TokenBucketLimiter:
+    """
+    Token-bucket limiter backed by the rate_limit_buckets collection.
+
+    Each bucket refills at `rate` tokens per second up to `burst` tokens;
+    a request takes one token or is rejected with 429.
+    """
+
+    def __init__(self, key_func=endpoint_identity):
+        self.key_func = key_func
+
+    def consume(self, key: str, rate: float, burst: int):
+        """
+        Atomically refills and takes one token from the bucket `key`.
+
+        Returns:
+            (allowed, retry_after_seconds)
+        """
+        from backend.db.mongo import rate_limit_buckets_collection
+
+        now = datetime.now(timezone.utc)
+
+        # Single round trip: refill from elapsed time, then take a token if one is available
+        bucket = rate_limit_buckets_collection().find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        burst,
+                        {"$add": [
+                            {"$ifNull": ["$tokens", burst]},
+                            {"$multiply": [
+                                {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+                                rate
+                            ]}
+                        ]}
+                    ]},
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=BUCKET_IDLE_TTL_SECONDS),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if bucket.get("allowed"):
+            return True, 0.0
+        return False, max(0.0, (1 - bucket.get("tokens", 0)) / rate)
+
+    def limit(self, rate_limit: str, burst: int = None, scope: str = None, body: str = None):
+        """
+        Route decorator: @endpoint_limiter.limit("5/minute", burst=5).
+        The decorated route must accept `request: Request`.
+
+        The bucket belongs to the route's {endpoint_id} path parameter, or to
+        the endpoint_id of the dict argument named `body` (the JSON body);
+        without either it is per client IP (see endpoint_identity).
+        """
+        item = parse(rate_limit)
+        rate = item.amount / item.get_expiry()
+        capacity = burst or item.amount
+
+        def decorator(func):
+            bucket_scope = scope or f"{func.__module__}.{func.__name__}"
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if request is not None:
+                    endpoint_id = kwargs.get("endpoint_id")
+                    if body is not None and isinstance(kwargs.get(body), dict):
+                        endpoint_id = kwargs[body].get("endpoint_id")
+                    try:
+                        key = f"{bucket_scope}:{self.key_func(request, endpoint_id)}"
+                        allowed, retry_after = self.consume(key, rate, capacity)
+                    except Exception:
+                        # Fail open: never block agents because the limiter store is unavailable
+                        allowed, retry_after = True, 0.0
+
+                    if not allowed:
+                        raise HTTPException(
+                            status_code=429,
+                            detail=f"Rate limit exceeded: {rate_limit} (burst {capacity})",
+                            headers={"Retry-After": str(int(retry_after) + 1)},
+                        )
+
+                return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+endpoint_limiter = TokenBucketLimiter()
@@ -1,52 +1,154 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Body, Request
 from datetime import datetime, timezone, timedelta
+import os
 import uuid
 
-from backend.db.mongo import agent_jobs_collection
-from backend.limiter import limiter
+from bson import ObjectId
+
+from backend.db.mongo import agent_jobs_collection, endpoints_collection
+from backend.services.job_sweeper import sweep_jobs
+from backend.limiter import (
+    endpoint_limiter,
+    JOB_POLL_RATE_LIMIT,
+    JOB_POLL_BURST,
+    CHECKIN_RATE_LIMIT,
+    CHECKIN_BURST,
+)
 
 router = APIRouter(prefix="/api/agent", tags=["Agent Jobs"])
 
+# Suggested delays returned by /checkin. Must stay below the 45s "agent active" window.
+CHECKIN_INTERVAL_SECONDS = int(os.getenv("CHECKIN_INTERVAL_SECONDS", "30"))
+JOB_ACK_POLL_SECONDS = int(os.getenv("JOB_ACK_POLL_SECONDS", "1"))
 
-@router.get("/jobs/{endpoint_id}")
-@limiter.limit("1/30seconds")  # Max 1 request per 30 seconds
-def get_pending_job(request: Request, endpoint_id: str):
+# Scan sections an agent can re-collect on their own for a RUN_PARTIAL_SCAN job.
+# Names match the top-level keys the agent writes into its scan JSON.
+PARTIAL_SCAN_SECTIONS = (
+    "privilege_posture",
+    "exposure_posture",
+    "cis_compliance",
+)
+
+
+def validate_scan_sections(sections):
     """
-    Agent polls for pending jobs assigned to it.
-    Returns ONE non-expired job at a time. endpoint_id must match what was stored (UUID or legacy id).
+    Normalizes a requested list of scan sections.
+    Returns None for a full scan, otherwise a de-duplicated list of known sections.
+    Raises ValueError for unknown section names.
     """
-    endpoint_id = (endpoint_id or "").strip()
-    if not endpoint_id:
-        return {"status": "no_job"}
+    if not sections:
+        return None
+
+    unknown = [s for s in sections if s not in PARTIAL_SCAN_SECTIONS]
+    if unknown:
+        raise ValueError(
+            f"Unknown scan section(s): {', '.join(map(str, unknown))}. "
+            f"Allowed: {', '.join(PARTIAL_SCAN_SECTIONS)}"
+        )
+
+    return [s for s in PARTIAL_SCAN_SECTIONS if s in sections]
 
-    now = datetime.now(timezone.utc)
 
+def find_pending_job(endpoint_id: str, now: datetime):
+    """
+    Returns the agent's oldest non-expired pending job, or None.
+    Matches endpoint_id as stored (UUID string) or as ObjectId for legacy endpoints.
+    """
     # Find non-expired pending job
     job = agent_jobs_collection().find_one({
         "endpoint_id": endpoint_id,
         "status": "pending",
         "expires_at": {"$gt": now}  # Only non-expired jobs
-    })
-    
+    }, sort=[("created_at", 1)])
+
     if not job:
         # Also try matching as ObjectId for legacy endpoints
-        from bson import ObjectId
         if ObjectId.is_valid(endpoint_id):
             job = agent_jobs_collection().find_one({
                 "endpoint_id": ObjectId(endpoint_id),
                 "status": "pending",
                 "expires_at": {"$gt": now}
-            })
-    
-    if not job:
-        return {"status": "no_job"}
+            }, sort=[("created_at", 1)])
 
-    return {
+    return job
+
+
+def job_response(job: dict) -> dict:
+    """
+    The job fields an agent needs to run it.
+    """
+    response = {
         "job_id": job.get("job_id"),
         "job_type": job.get("job_type", "RUN_SCAN")
     }
+    if job.get("sections"):
+        response["sections"] = job["sections"]
+
+    return response
 
 
+@router.get("/jobs/{endpoint_id}")
+@endpoint_limiter.limit(JOB_POLL_RATE_LIMIT, burst=JOB_POLL_BURST)  # per endpoint, shared across workers
+def get_pending_job(request: Request, endpoint_id: str):
+    """
+    Agent polls for pending jobs assigned to it.
+    Returns ONE non-expired job at a time. endpoint_id must match what was stored (UUID or legacy id).
+    """
+    endpoint_id = (endpoint_id or "").strip()
+    if not endpoint_id:
+        return {"status": "no_job"}
+
+    job = find_pending_job(endpoint_id, datetime.now(timezone.utc))
+
+    if not job:
+        return {"status": "no_job"}
+
+    return job_response(job)
+
+
+@router.post("/checkin")
+@endpoint_limiter.limit(CHECKIN_RATE_LIMIT, burst=CHECKIN_BURST, body="payload")  # per endpoint, shared across workers
+def agent_checkin(request: Request, payload: dict = Body(...)):
+    """
+    Combined agent cycle: heartbeat + completion acks + job poll in one call.
+
+    Expected input:
+    - endpoint_id
+    - completed_job_ids (optional): jobs finished since the last check-in
+
+    Returns the next pending job (if any) and a suggested delay before the next check-in.
+    """
+    endpoint_id = str(payload.get("endpoint_id") or "").strip()
+    if not endpoint_id:
+        return {"status": "error", "message": "Missing endpoint_id"}
+
+    now = datetime.now(timezone.utc)
+
+    # Liveness
+    endpoints_collection().update_one(
+        {"endpoint_id": endpoint_id},
+        {"$set": {"last_seen": now}}
+    )
+
+    # Acks (scoped to this endpoint's jobs)
+    completed_job_ids = [str(j) for j in payload.get("completed_job_ids") or [] if j]
+    acknowledged = 0
+    if completed_job_ids:
+        result = agent_jobs_collection().update_many(
+            {"job_id": {"$in": completed_job_ids}, "endpoint_id": endpoint_id},
+            {"$set": {"status": "completed", "completed_at": now}}
+        )
+        acknowledged = result.modified_count
+
+    job = find_pending_job(endpoint_id, now)
+
+    return {
+        "status": "alive",
+        "acknowledged": acknowledged,
+        "job": job_response(job) if job else None,
+        # Check back soon after a job so its completion is acknowledged promptly
+        "next_poll_seconds": JOB_ACK_POLL_SECONDS if job else CHECKIN_INTERVAL_SECONDS
+    }
 
 
 @router.post("/jobs/{job_id}/complete")
@@ -71,44 +173,42 @@ def mark_job_complete(job_id: str):
 @router.post("/jobs/cleanup-expired")
 def cleanup_expired_jobs():
     """
-    Mark expired pending jobs as 'expired'.
-    This can be called periodically or manually to clean up stale jobs.
+    Runs one job sweep immediately: marks expired open jobs as 'expired'
+    and deletes jobs past retention. The background sweeper does this on a fixed cadence.
     """
-    now = datetime.now(timezone.utc)
-    
-    result = agent_jobs_collection().update_many(
-        {
-            "status": "pending",
-            "expires_at": {"$lt": now}
-        },
-        {
-            "$set": {
-                "status": "expired",
-                "expired_at": now
-            }
-        }
-    )
-    
+    result = sweep_jobs()
+
     return {
         "status": "ok",
-        "expired_count": result.modified_count
+        **result
     }
 
 
 # job scanning
-def create_scan_job(endpoint_id: str):
-    """Creates a new scan job with 5-minute expiration."""
-    from datetime import timedelta
-    
-    now = datetime.now(timezone.utc)
-    expires_at = now + timedelta(minutes=5)
-    
-    agent_jobs_collection().insert_one({
+def build_scan_job(endpoint_id: str, status: str, now: datetime, expires_at: datetime, sections=None) -> dict:
+    """
+    Builds an agent_jobs document.
+    With sections, the job is a RUN_PARTIAL_SCAN limited to those collectors.
+    """
+    job = {
         "job_id": str(uuid.uuid4()),
         "endpoint_id": endpoint_id,
-        "job_type": "RUN_SCAN",
-        "status": "pending",
+        "job_type": "RUN_PARTIAL_SCAN" if sections else "RUN_SCAN",
+        "status": status,
         "created_at": now,
         "expires_at": expires_at,
         "completed_at": None
-    })
+    }
+    if sections:
+        job["sections"] = list(sections)
+    return job
+
+
+def create_scan_job(endpoint_id: str, sections=None):
+    """Creates a new scan job with 5-minute expiration."""
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=5)
+
+    job = build_scan_job(endpoint_id, "pending", now, expires_at, sections)
+    agent_jobs_collection().insert_one(job)
+    return job
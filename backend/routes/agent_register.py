@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Request
 from datetime import datetime, timezone
 from backend.db.mongo import endpoints_collection
+from backend.limiter import endpoint_limiter, REGISTER_RATE_LIMIT, REGISTER_BURST
 
 router = APIRouter(prefix="/api/agent", tags=["Agent Registration"])
 
 
 @router.post("/register")
-def register_agent(payload: dict = Body(...)):
+@endpoint_limiter.limit(REGISTER_RATE_LIMIT, burst=REGISTER_BURST)  # per client IP: registering creates identities
+def register_agent(request: Request, payload: dict = Body(...)):
     endpoint_id = payload.get("endpoint_id")
 
     if not endpoint_id:
@@ -2,32 +2,38 @@
 analysis.py
 
 API route to trigger systemic analysis.
+Analysis runs as a background task (see backend/services/task_queue.py);
+poll GET /api/tasks/{task_id} for the resulting posture_snapshot_id.
 """
 
 from fastapi import APIRouter, HTTPException
 
-from backend.services.systemic_runner import run_and_store_systemic_analysis
+from backend.services.systemic_runner import ENGINES
+from backend.services.task_queue import submit_task
 
 router = APIRouter(prefix="/api/analyze", tags=["Analysis"])
 
 
-@router.post("/")
-def trigger_systemic_analysis():
+@router.post("/", status_code=202)
+def trigger_systemic_analysis(engine: str = None):
     """
-    Triggers organization-level systemic analysis.
+    Queues organization-level systemic analysis and returns its task id.
+    Optional ?engine= overrides SYSTEMIC_ENGINE.
     """
 
+    if engine is not None and engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown systemic analysis engine: {engine}")
+
     try:
-        snapshot_id = run_and_store_systemic_analysis()
+        task_id, joined = submit_task("analysis", {"engine": engine})
 
         return {
-            "status": "success",
-            "message": "Systemic analysis completed",
-            "posture_snapshot_id": snapshot_id
+            "status": "accepted",
+            "message": "Systemic analysis already in progress; joined it" if joined else "Systemic analysis queued",
+            "task_id": task_id,
+            "joined": joined,
+            "status_url": f"/api/tasks/{task_id}"
         }
 
-    except ValueError as ve:
-        raise HTTPException(status_code=400, detail=str(ve))
-
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,37 @@
+"""
+cis.py
+
+Read-only API routes for fleet-wide CIS control results,
+answered from the host x control matrix (see services/cis_matrix.py).
+"""
+
+from fastapi import APIRouter, HTTPException, Query
+
+from backend.services.cis_matrix import control_failure_rates, failing_endpoints
+
+router = APIRouter(prefix="/api/cis", tags=["CIS"])
+
+
+@router.get("/controls")
+def get_cis_controls():
+    """
+    Returns every CIS control reported by the fleet with its failing /
+    compliant host counts and failure rates, most failing first.
+    """
+    return control_failure_rates()
+
+
+# control ids may contain "/" (e.g. "9.1.2/4/6"), hence the path converter
+@router.get("/controls/{control_id:path}/endpoints")
+def get_cis_control_endpoints(
+    control_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Lists the hosts whose latest scan reports the control as non-compliant.
+    """
+    try:
+        return failing_endpoints(control_id, skip, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
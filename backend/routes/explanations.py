@@ -0,0 +1,134 @@
+"""
+explanations.py
+
+API routes for LLM explanations of endpoint findings
+(cached and batched, see services/llm_explanations.py).
+"""
+
+import asyncio
+
+from bson import ObjectId
+from fastapi import APIRouter, Body, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from backend.db.mongo import endpoint_scans_collection
+from backend.services.llm_explanations import explainer, explanation_inputs
+from backend.services.ml_service import predict_risk_batch
+
+router = APIRouter(prefix="/api/explanations", tags=["Explanations"])
+
+# Endpoints per batch request
+MAX_BATCH_ENDPOINTS = 500
+
+
+def _latest_scans(endpoint_ids: list) -> dict:
+    """
+    Latest scan per endpoint in one query, keyed by the endpoint id string.
+    Scans may be stored by string endpoint_id (UUID) or by ObjectId (legacy).
+    """
+    keys = []
+    for endpoint_id in set(endpoint_ids):
+        keys.append(endpoint_id)
+        if ObjectId.is_valid(endpoint_id):
+            keys.append(ObjectId(endpoint_id))
+
+    latest = {}
+    for group in endpoint_scans_collection().aggregate([
+        {"$match": {"endpoint_id": {"$in": keys}}},
+        {"$sort": {"endpoint_id": 1, "scan_time": -1}},
+        {"$group": {"_id": "$endpoint_id", "scan": {"$first": "$$ROOT"}}},
+        # newest first, for an endpoint stored under both forms
+        {"$sort": {"scan.scan_time": -1}},
+    ], allowDiskUse=True):
+        latest.setdefault(str(group["_id"]), group["scan"])
+    return latest
+
+
+def _submit(endpoint_ids: list) -> list:
+    """
+    Looks up each endpoint's latest scan and queues its explanation.
+    Returns (endpoint_id, scan, future or None, cached) per endpoint.
+    """
+    latest = _latest_scans(endpoint_ids)
+    scans = [latest.get(endpoint_id) for endpoint_id in endpoint_ids]
+    found = [scan for scan in scans if scan]
+
+    # ML anomaly assessment for scans that carry none (one vectorized pass)
+    need_ml = [scan for scan in found if not scan.get("scan_data", {}).get("anomaly_assessment")]
+    predictions = dict(zip(
+        (id(scan) for scan in need_ml),
+        predict_risk_batch([scan.get("scan_data", {}) for scan in need_ml]) if need_ml else [],
+    ))
+
+    futures = iter(explainer.explain_many([
+        explanation_inputs(scan.get("scan_data", {}), predictions.get(id(scan))) for scan in found
+    ]))
+
+    submitted = []
+    for endpoint_id, scan in zip(endpoint_ids, scans):
+        future = next(futures) if scan else None
+        submitted.append((endpoint_id, scan, future, future.done() if future else False))
+    return submitted
+
+
+async def _explain(endpoint_ids: list) -> list:
+    submitted = await run_in_threadpool(_submit, endpoint_ids)
+    results = await asyncio.gather(
+        *(asyncio.wrap_future(future) for _, _, future, _ in submitted if future),
+        return_exceptions=True,
+    )
+
+    results = iter(results)
+    explanations = []
+    for endpoint_id, scan, future, cached in submitted:
+        if scan is None:
+            explanations.append({"endpoint_id": endpoint_id, "error": "No scans found for this endpoint"})
+            continue
+        result = next(results)
+        if isinstance(result, Exception):
+            explanations.append({"endpoint_id": endpoint_id, "error": str(result)})
+            continue
+        explanations.append({
+            "endpoint_id": endpoint_id,
+            "scan_id": str(scan["_id"]),
+            "scan_time": scan.get("scan_time"),
+            "cached": cached,
+            **result,
+        })
+    return explanations
+
+
+@router.post("/batch")
+async def explain_endpoints(payload: dict = Body(...)):
+    """
+    Explains the latest scan of each endpoint in {"endpoint_ids": [...]}.
+    Unchanged endpoints are answered from the cache; the rest are generated in batches.
+    """
+    endpoint_ids = payload.get("endpoint_ids")
+    if not isinstance(endpoint_ids, list) or not endpoint_ids:
+        raise HTTPException(status_code=400, detail="endpoint_ids must be a non-empty list")
+    if len(endpoint_ids) > MAX_BATCH_ENDPOINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ENDPOINTS} endpoints per request")
+
+    explanations = await _explain([str(e) for e in endpoint_ids])
+    return {"count": len(explanations), "explanations": explanations}
+
+
+@router.get("/stats")
+def get_explanation_stats():
+    """
+    Returns cache hits, joined and generated explanations, batch sizes and LLM time.
+    """
+    return explainer.stats()
+
+
+@router.post("/{endpoint_id}")
+async def explain_endpoint(endpoint_id: str):
+    """
+    Explains the latest scan of an endpoint (from the cache if its findings are unchanged).
+    """
+    explanation = (await _explain([endpoint_id]))[0]
+    if "error" in explanation:
+        status = 404 if explanation["error"].startswith("No scans") else 500
+        raise HTTPException(status_code=status, detail=explanation["error"])
+    return explanation
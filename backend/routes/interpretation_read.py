@@ -6,6 +6,7 @@ Read-only API routes for interpretation results.
 
 from fastapi import APIRouter
 from backend.db.mongo import org_interpretations_collection
+from backend.services.interpretation_runner import resolve_interpretation
 
 router = APIRouter(prefix="/api/interpret", tags=["Interpretation (Read)"])
 
@@ -30,5 +31,5 @@ def get_latest_interpretation():
     return {
         "interpretation_id": str(interpretation["_id"]),
         "generated_at": interpretation.get("generated_at"),
-        "interpretation": interpretation.get("interpretation")
+        "interpretation": resolve_interpretation(interpretation)
     }
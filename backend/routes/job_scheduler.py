@@ -1,8 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Body, HTTPException
 from datetime import datetime, timezone, timedelta
-import uuid
 
 from backend.db.mongo import agent_jobs_collection, endpoints_collection
+from backend.routes.agent_jobs import build_scan_job, validate_scan_sections
+from backend.services.job_sweeper import OPEN_JOB_STATUSES
 
 router = APIRouter(prefix="/api/jobs", tags=["Job Scheduler"])
 
@@ -12,13 +13,9 @@ router = APIRouter(prefix="/api/jobs", tags=["Job Scheduler"])
 def list_jobs():
     """
     Returns all jobs (pending and completed) from agent_jobs, newest first.
+    Read-only: stale open jobs are reported as 'expired' here and marked so by the job sweeper.
     """
-    # Auto-cleanup expired jobs first
     now = datetime.now(timezone.utc)
-    agent_jobs_collection().update_many(
-        {"status": {"$in": ["pending", "disconnected"]}, "expires_at": {"$lt": now}},
-        {"$set": {"status": "expired", "expired_at": now}}
-    )
 
     try:
         cursor = agent_jobs_collection().find()
@@ -55,30 +52,73 @@ def list_jobs():
                     except Exception:
                         pass
 
+        status = j.get("status", "pending")
+        expires_at = j.get("expires_at")
+        if status in OPEN_JOB_STATUSES and isinstance(expires_at, datetime):
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at < now:
+                status = "expired"
+
         out.append({
             "job_id": j.get("job_id"),
             "endpoint_id": str(eid or ""),
             "hostname": hostname,
             "agent_active": agent_active,
             "job_type": j.get("job_type", "RUN_SCAN"),
-            "status": j.get("status", "pending"),
+            "sections": j.get("sections"),
+            "status": status,
             "created_at": j.get("created_at"),
         })
     return {"jobs": out}
 
 
+def _initial_job_status(ep: dict, now: datetime) -> str:
+    """
+    'pending' if the endpoint's agent was seen within the last 45 seconds, else 'disconnected'.
+    """
+    try:
+        last_seen = ep.get("last_seen")
+        if not last_seen:
+            return "disconnected"
+        if isinstance(last_seen, str):
+            last_seen = datetime.fromisoformat(last_seen.replace("Z", "+00:00"))
+        if last_seen.tzinfo is None:
+            last_seen = last_seen.replace(tzinfo=timezone.utc)
+
+        delta = now - last_seen
+        # Active only if seen within last 45 seconds (strict)
+        if timedelta(0) < delta < timedelta(seconds=45):
+            return "pending"
+        return "disconnected"
+    except Exception:
+        return "disconnected"
+
+
+def _requested_sections(payload) -> list:
+    """
+    Reads optional {"sections": [...]} from a scheduling request body.
+    Returns None for a full RUN_SCAN.
+    """
+    sections = (payload or {}).get("sections")
+    if sections is not None and not isinstance(sections, list):
+        raise HTTPException(status_code=400, detail="sections must be a list")
+    try:
+        return validate_scan_sections(sections)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+
 @router.post("/scan/all")
-def schedule_scan_all():
+def schedule_scan_all(payload: dict = Body(None)):
     """
-    Schedule RUN_SCAN job for all registered endpoints.
+    Schedule a scan job for all registered endpoints.
     Run the agent first so it registers an endpoint; then this creates jobs for each.
+
+    Optional body {"sections": ["cis_compliance", ...]} schedules a RUN_PARTIAL_SCAN
+    that only re-runs those collectors.
     """
-    # Auto-cleanup expired jobs first
-    now = datetime.now(timezone.utc)
-    agent_jobs_collection().update_many(
-        {"status": {"$in": ["pending", "disconnected"]}, "expires_at": {"$lt": now}},
-        {"$set": {"status": "expired", "expired_at": now}}
-    )
+    sections = _requested_sections(payload)
 
     try:
         endpoints = list(endpoints_collection().find())
@@ -95,23 +135,7 @@ def schedule_scan_all():
             continue
             
         # Determine initial status based on agent activity
-        status = "pending"
-        try:
-            last_seen = ep.get("last_seen")
-            if last_seen:
-                if isinstance(last_seen, str):
-                    last_seen = datetime.fromisoformat(last_seen.replace("Z", "+00:00"))
-                if last_seen.tzinfo is None:
-                    last_seen = last_seen.replace(tzinfo=timezone.utc)
-                
-                delta = now - last_seen
-                # Active only if seen within last 45 seconds (strict)
-                if not (timedelta(0) < delta < timedelta(seconds=45)):
-                    status = "disconnected"
-            else:
-                status = "disconnected"
-        except Exception:
-            status = "disconnected"
+        status = _initial_job_status(ep, now)
 
         # Check if there is already a pending job for this endpoint to avoid duplicates
         # We only check for PENDING jobs. If there is a "disconnected" job, we might want to schedule a new one?
@@ -126,15 +150,9 @@ def schedule_scan_all():
             continue
             
         try:
-            agent_jobs_collection().insert_one({
-                "job_id": str(uuid.uuid4()),
-                "endpoint_id": str(eid),
-                "job_type": "RUN_SCAN",
-                "status": status,
-                "created_at": now,
-                "expires_at": expires_at,
-                "completed_at": None
-            })
+            agent_jobs_collection().insert_one(
+                build_scan_job(str(eid), status, now, expires_at, sections)
+            )
             count += 1
         except Exception:
             continue
@@ -144,3 +162,44 @@ def schedule_scan_all():
         "jobs_created": count,
         "message": f"Scheduled {count} job(s) for {len(endpoints)} endpoint(s)." if count else "No endpoints registered. Run the agent first so it registers, then try Scan All again."
     }
+
+
+@router.post("/scan/{endpoint_id}")
+def schedule_scan_endpoint(endpoint_id: str, payload: dict = Body(None)):
+    """
+    Schedule a scan job for a single endpoint.
+
+    Optional body {"sections": [...]} limits the job to the named collectors
+    (e.g. only "cis_compliance" for a re-check after remediation).
+    """
+    sections = _requested_sections(payload)
+
+    endpoint_id = (endpoint_id or "").strip()
+    ep = endpoints_collection().find_one({"endpoint_id": endpoint_id})
+    if not ep:
+        raise HTTPException(status_code=404, detail="Endpoint not found")
+
+    now = datetime.now(timezone.utc)
+    existing_job = agent_jobs_collection().find_one({
+        "endpoint_id": endpoint_id,
+        "status": {"$in": ["pending", "disconnected"]},
+        "expires_at": {"$gt": now}
+    })
+    if existing_job:
+        return {
+            "status": "exists",
+            "job_id": existing_job.get("job_id"),
+            "message": "A scan job is already queued for this endpoint."
+        }
+
+    job = build_scan_job(
+        endpoint_id, _initial_job_status(ep, now), now, now + timedelta(minutes=2), sections
+    )
+    agent_jobs_collection().insert_one(job)
+
+    return {
+        "status": "scheduled",
+        "job_id": job["job_id"],
+        "job_type": job["job_type"],
+        "sections": sections
+    }
@@ -1,19 +1,27 @@
 
 from fastapi import APIRouter, HTTPException
-from backend.services.ml_service import train_models, predict_risk
+from backend.services import ml_service, model_registry
+from backend.services.ml_service import predict_risk
+from backend.services.task_queue import submit_task
 from backend.db.mongo import endpoint_scans_collection, endpoints_collection
 from bson import ObjectId
 
 router = APIRouter(prefix="/api/ml", tags=["ML"])
 
-@router.post("/train")
+@router.post("/train", status_code=202)
 def trigger_training():
     """
-    Triggers model retraining.
+    Queues model retraining; poll GET /api/tasks/{task_id} for the result.
     """
     try:
-        result = train_models()
-        return result
+        task_id, joined = submit_task("training")
+        return {
+            "status": "accepted",
+            "message": "Model training already in progress; joined it" if joined else "Model training queued",
+            "task_id": task_id,
+            "joined": joined,
+            "status_url": f"/api/tasks/{task_id}"
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -46,3 +54,49 @@ def get_endpoint_risk(endpoint_id: str):
         return analysis
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/models")
+def list_models():
+    """
+    Lists the saved model versions (newest first) with their metadata,
+    the active version and the one this worker is serving.
+    """
+    state = model_registry.active_state()
+    return {
+        "active_version": state.get("version"),
+        "loaded_version": getattr(ml_service.current_bundle(), "version", None),
+        "history": state.get("history", []),
+        "versions": model_registry.list_versions(),
+    }
+
+@router.post("/models/rollback")
+def rollback_model():
+    """
+    Re-activates the previously active model version.
+    """
+    try:
+        # Load first: a version that cannot serve is never activated
+        ml_service.load_models(model_registry.rollback_target())
+        metadata = model_registry.rollback_version()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "active_version": metadata["version"], "metadata": metadata}
+
+@router.post("/models/{version}/activate")
+def activate_model(version: str):
+    """
+    Makes a saved model version the active one (other workers follow
+    within ML_MODEL_SYNC_SECONDS).
+    """
+    try:
+        # Load first: a version that cannot serve is never activated
+        metadata = ml_service.load_models(version)
+        model_registry.activate_version(version)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "active_version": version, "metadata": metadata}
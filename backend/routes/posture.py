@@ -4,8 +4,14 @@ posture.py
 Read-only API routes for organization posture snapshots.
 """
 
-from fastapi import APIRouter
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
 from backend.db.mongo import org_posture_snapshots_collection
+from backend.services.posture_snapshots import load_posture_data, diff_snapshots
+from backend.services.posture_rollups import posture_trends
+from backend.services.posture_whatif import evaluate_threshold, sweep_thresholds
+from backend.services.posture_segments import list_segments, segment_posture
 
 router = APIRouter(prefix="/api/posture", tags=["Posture"])
 
@@ -30,7 +36,7 @@ def get_latest_posture():
     return {
         "snapshot_id": str(snapshot["_id"]),
         "generated_at": snapshot.get("generated_at"),
-        "posture_data": snapshot.get("posture_data")
+        "posture_data": load_posture_data(snapshot)
     }
 
 
@@ -42,7 +48,7 @@ def list_all_postures():
 
     snapshots = []
 
-    for snap in org_posture_snapshots_collection().find().sort("generated_at", -1):
+    for snap in org_posture_snapshots_collection().find({}, {"generated_at": 1}).sort("generated_at", -1):
         snapshots.append({
             "snapshot_id": str(snap["_id"]),
             "generated_at": snap.get("generated_at")
@@ -52,3 +58,104 @@ def list_all_postures():
         "total_snapshots": len(snapshots),
         "snapshots": snapshots
     }
+
+
+@router.get("/diff")
+def get_posture_diff(
+    from_id: str = Query(..., alias="from"),
+    to_id: str = Query(..., alias="to")
+):
+    """
+    Returns what changed between two posture snapshots: host total,
+    per-issue affected-host counts, ML risk and CIS overview fields.
+    """
+
+    try:
+        return diff_snapshots(from_id, to_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/trends")
+def get_posture_trends(
+    issue: str = None,
+    granularity: str = "day",
+    start: datetime = None,
+    end: datetime = None
+):
+    """
+    Returns hourly or daily posture trend points from pre-aggregated rollups.
+    With ?issue=, each point includes that issue's affected-host counts.
+    """
+
+    try:
+        return posture_trends(issue, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/whatif")
+def get_posture_whatif(threshold: float = Query(..., ge=0, le=1)):
+    """
+    Reclassifies the latest snapshot's issues at another systemic threshold
+    from its stored per-issue counts (no re-analysis).
+    """
+
+    try:
+        return evaluate_threshold(threshold)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/whatif/sweep")
+def get_posture_whatif_sweep(thresholds: str = "0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9"):
+    """
+    Systemic / isolated split of the latest snapshot for each threshold
+    in ?thresholds= (comma-separated, each between 0 and 1).
+    """
+
+    try:
+        values = [float(t) for t in thresholds.split(",") if t.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="thresholds must be comma-separated numbers")
+    if not values or any(not 0 <= t <= 1 for t in values):
+        raise HTTPException(status_code=400, detail="thresholds must be between 0 and 1")
+
+    try:
+        return sweep_thresholds(values)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/segments")
+def get_posture_segments(
+    key: str = None,
+    threshold: float = Query(None, ge=0, le=1)
+):
+    """
+    Per-segment (OS, site, tag, ...) host totals and systemic / isolated
+    issue counts from the latest snapshot. Filter with ?key=os.
+    """
+
+    try:
+        return list_segments(key, threshold)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/segments/detail")
+def get_posture_segment(
+    key: str,
+    value: str,
+    threshold: float = Query(None, ge=0, le=1)
+):
+    """
+    Full posture of one segment (?key=os&value=Windows) from the latest snapshot.
+    """
+
+    try:
+        return segment_posture(key, value, threshold)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
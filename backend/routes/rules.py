@@ -0,0 +1,34 @@
+"""
+rules.py
+
+API routes for the declarative issue rules used by systemic analysis.
+"""
+
+from fastapi import APIRouter, HTTPException
+
+from analysis.issue_rules import reload_rules, rules_status
+
+router = APIRouter(prefix="/api/rules", tags=["Rules"])
+
+
+@router.get("/")
+def get_issue_rules():
+    """
+    Returns the active issue rules, their version and per-rule evaluation
+    cost / match rate sampled in this API process.
+    """
+    return rules_status()
+
+
+@router.post("/reload")
+def reload_issue_rules():
+    """
+    Reloads the rule file now instead of waiting for the change check.
+    On an invalid file the previous rules stay active.
+    """
+    try:
+        rules = reload_rules()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"status": "reloaded", "version": rules.version, "issues": rules.issue_order}
@@ -6,12 +6,15 @@ API routes for receiving endpoint scan data from agents.
 Responsibilities:
 - Accept raw scan JSON
 - Associate scan with endpoint
+- Merge partial scans (a subset of sections) into the endpoint's latest scan
 - Store scan in MongoDB
+- Fold the scan into the incremental posture counters and the CIS control matrix
+- Count the scan towards the next auto-analysis run
 
 This module does NOT:
 - Perform analysis
 - Perform interpretation
-- Modify scan contents
+- Modify collected section contents
 """
 
 from fastapi import APIRouter, HTTPException, Request
@@ -21,13 +24,39 @@ from backend.db.mongo import (
     endpoints_collection,
     endpoint_scans_collection
 )
-from backend.limiter import limiter
+from backend.limiter import endpoint_limiter, SCAN_UPLOAD_RATE_LIMIT, SCAN_UPLOAD_BURST
+from backend.services.posture_counters import apply_scan
+from backend.services.cis_matrix import apply_scan_controls
+from backend.services.auto_analysis import note_scan_ingested
 
 router = APIRouter(prefix="/api/scans", tags=["Scans"])
 
 
+def merge_partial_scan(latest_scan_data: dict, partial_scan: dict) -> dict:
+    """
+    Overlays a partial scan onto the endpoint's latest full scan data.
+
+    Only the sections named in partial_scan["partial_sections"] (plus identity
+    fields and metadata) are replaced; everything else is carried over so the
+    stored scan still describes the whole endpoint.
+    """
+    merged = dict(latest_scan_data or {})
+    sections = partial_scan.get("partial_sections") or []
+
+    for section in sections:
+        if section in partial_scan:
+            merged[section] = partial_scan[section]
+
+    for key in ("endpoint_id", "hostname", "os", "system", "metadata"):
+        if partial_scan.get(key) is not None:
+            merged[key] = partial_scan[key]
+
+    merged["partial_sections"] = list(sections)
+    return merged
+
+
 @router.post("/")
-@limiter.limit("5/minute")  # Max 5 scans per minute
+@endpoint_limiter.limit(SCAN_UPLOAD_RATE_LIMIT, burst=SCAN_UPLOAD_BURST, body="scan")  # per endpoint, shared across workers
 def upload_scan(request: Request, scan: dict):
     """
     Receives raw scan data from an endpoint agent.
@@ -38,9 +67,28 @@ def upload_scan(request: Request, scan: dict):
     Behavior:
     - Creates or updates endpoint record
     - Stores scan data as-is
+    - Rejects a partial scan (409) when the endpoint has no earlier scan to
+      merge it into, since the counters, the CIS matrix and auto-analysis
+      treat every stored scan as the host's full latest state
     """
 
     try:
+        # Partial scans only carry the re-collected sections; fold them into the
+        # endpoint's latest state before storing.
+        if scan.get("partial_sections"):
+            latest = None
+            if scan.get("endpoint_id"):
+                latest = endpoint_scans_collection().find_one(
+                    {"endpoint_id": scan["endpoint_id"]},
+                    sort=[("scan_time", -1)]
+                )
+            if not latest or not latest.get("scan_data"):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Partial scan needs an earlier full scan of this endpoint; send a full scan first"
+                )
+            scan = merge_partial_scan(latest["scan_data"], scan)
+
         system_info = scan.get("system", {})
         hostname = scan.get("hostname") or system_info.get("hostname")
         os_name = scan.get("os") or system_info.get("os")
@@ -97,11 +145,30 @@ def upload_scan(request: Request, scan: dict):
 
         endpoint_scans_collection().insert_one(scan_record)
 
+        try:
+            apply_scan(scan_record["scan_data"], scan_record["scan_time"])
+        except Exception as e:
+            # The scan is stored; the periodic verifier repairs the counters
+            print(f"[WARN] Posture counter update failed: {e}")
+
+        try:
+            apply_scan_controls(scan_record["scan_data"], scan_record["scan_time"], scan_record["endpoint_id"])
+        except Exception as e:
+            # The periodic rebuild repairs the matrix
+            print(f"[WARN] CIS control matrix update failed: {e}")
+
+        try:
+            note_scan_ingested(scan_record["scan_time"])
+        except Exception as e:
+            print(f"[WARN] Auto-analysis bookkeeping failed: {e}")
+
         return {
             "status": "success",
-            "message": "Scan stored successfully",
+            "message": "Partial scan merged and stored" if scan.get("partial_sections") else "Scan stored successfully",
             "endpoint_id": agent_endpoint_id or str(endpoint.get("_id", ""))
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -17,7 +17,7 @@ from fastapi import APIRouter, HTTPException
 from bson import ObjectId
 
 from backend.db.mongo import endpoint_scans_collection
-from backend.services.ml_service import predict_risk
+from backend.services.ml_service import predict_risk_batch
 
 router = APIRouter(prefix="/api/scans", tags=["Scans (Read)"])
 
@@ -32,16 +32,19 @@ def get_scans_for_endpoint(endpoint_id: str):
     else:
         query = {"endpoint_id": endpoint_id}
 
-    scans_cursor = endpoint_scans_collection().find(query).sort("scan_time", -1)
+    scan_docs = list(endpoint_scans_collection().find(query).sort("scan_time", -1))
+
+    # Score all of the endpoint's scans in one batch
+    assessments = predict_risk_batch([scan.get("scan_data", {}) for scan in scan_docs])
 
     scans = []
 
-    for scan in scans_cursor:
+    for scan, assessment in zip(scan_docs, assessments):
         scans.append({
             "scan_id": str(scan["_id"]),
             "scan_time": scan.get("scan_time"),
             "scan_data": scan.get("scan_data"),
-            "ml_assessment": predict_risk(scan.get("scan_data", {}))
+            "ml_assessment": assessment
         })
 
     return {
@@ -0,0 +1,25 @@
+"""
+tasks.py
+
+Read-only API route for background task status (analysis, ML training).
+"""
+
+from fastapi import APIRouter, HTTPException
+
+from backend.services.task_queue import get_task
+
+router = APIRouter(prefix="/api/tasks", tags=["Tasks"])
+
+
+@router.get("/{task_id}")
+def get_task_status(task_id: str):
+    """
+    Returns a task's status (queued, running, completed, failed), its result
+    or error, and queue wait / runtime / peak memory once known.
+    """
+    task = get_task(task_id)
+
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return task
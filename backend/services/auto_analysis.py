@@ -0,0 +1,121 @@
+"""
+auto_analysis.py
+
+Debounced systemic analysis driven by ingest volume.
+
+Every stored scan bumps a shared counter (auto_analysis_state). A periodic
+check queues one analysis task once AUTO_ANALYSIS_SCAN_COUNT new scans have
+arrived or the oldest pending scan is AUTO_ANALYSIS_MAX_DELAY_SECONDS old,
+whichever comes first, and never sooner than AUTO_ANALYSIS_MIN_INTERVAL_SECONDS
+after the previous auto run. The trigger is claimed atomically in MongoDB, so
+bursts and multiple uvicorn workers still produce a single run. Claimed scans
+are put back when no new run picks them up (the submit joined a run that was
+already going, or failed), so they trigger the next one.
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+from backend.db.mongo import auto_analysis_state_collection
+from backend.services.periodic import PeriodicTask
+from backend.services.task_queue import submit_task
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+AUTO_ANALYSIS_ENABLED = os.getenv("AUTO_ANALYSIS_ENABLED", "true").lower() in ("1", "true", "yes")
+AUTO_ANALYSIS_SCAN_COUNT = int(os.getenv("AUTO_ANALYSIS_SCAN_COUNT", "50"))
+AUTO_ANALYSIS_MAX_DELAY_SECONDS = int(os.getenv("AUTO_ANALYSIS_MAX_DELAY_SECONDS", "300"))
+AUTO_ANALYSIS_MIN_INTERVAL_SECONDS = int(os.getenv("AUTO_ANALYSIS_MIN_INTERVAL_SECONDS", "120"))
+AUTO_ANALYSIS_CHECK_SECONDS = int(os.getenv("AUTO_ANALYSIS_CHECK_SECONDS", "5"))
+
+STATE_ID = "org"
+
+
+def note_scan_ingested(now: datetime = None):
+    """Records one newly stored scan (called by the scan upload route)."""
+    now = now or datetime.now(timezone.utc)
+    auto_analysis_state_collection().update_one(
+        {"_id": STATE_ID},
+        {
+            "$inc": {"pending_scans": 1},
+            "$min": {"first_pending_at": now},
+            "$set": {"last_scan_at": now},
+        },
+        upsert=True,
+    )
+
+
+def claim_auto_analysis(now: datetime = None):
+    """
+    Atomically takes the pending scans if a run is due.
+    Only one caller (across all workers) gets them per run.
+
+    Returns:
+        the claimed {"pending_scans", "first_pending_at"}, or None
+    """
+    now = now or datetime.now(timezone.utc)
+    claimed = auto_analysis_state_collection().find_one_and_update(
+        {
+            "_id": STATE_ID,
+            "pending_scans": {"$gt": 0},
+            "$and": [
+                # enough scans, or the oldest one has waited long enough
+                {"$or": [
+                    {"pending_scans": {"$gte": AUTO_ANALYSIS_SCAN_COUNT}},
+                    {"first_pending_at": {"$lte": now - timedelta(seconds=AUTO_ANALYSIS_MAX_DELAY_SECONDS)}},
+                ]},
+                # and the previous run is far enough back
+                {"$or": [
+                    {"last_run_at": {"$exists": False}},
+                    {"last_run_at": {"$lte": now - timedelta(seconds=AUTO_ANALYSIS_MIN_INTERVAL_SECONDS)}},
+                ]},
+            ],
+        },
+        {
+            "$set": {"pending_scans": 0, "last_run_at": now},
+            "$unset": {"first_pending_at": ""},
+        },
+        projection={"_id": 0, "pending_scans": 1, "first_pending_at": 1},
+    )
+    return claimed
+
+
+def rearm_auto_analysis(claimed: dict):
+    """Puts claimed scans back so they count towards the next run."""
+    auto_analysis_state_collection().update_one(
+        {"_id": STATE_ID},
+        {
+            "$inc": {"pending_scans": claimed.get("pending_scans", 0)},
+            "$min": {"first_pending_at": claimed.get("first_pending_at") or datetime.now(timezone.utc)},
+        },
+        upsert=True,
+    )
+
+
+def run_auto_analysis_if_due():
+    """Queues a systemic analysis task when the debounce conditions are met."""
+    claimed = claim_auto_analysis()
+    if claimed is None:
+        return None
+
+    try:
+        task_id, joined = submit_task("analysis")
+    except Exception:
+        rearm_auto_analysis(claimed)
+        raise
+
+    if joined:
+        # The running analysis started before these scans arrived
+        rearm_auto_analysis(claimed)
+
+    auto_analysis_state_collection().update_one(
+        {"_id": STATE_ID},
+        {"$set": {"last_task_id": task_id}},
+    )
+    return task_id
+
+
+auto_analysis = PeriodicTask("auto-analysis", run_auto_analysis_if_due, AUTO_ANALYSIS_CHECK_SECONDS)
@@ -0,0 +1,384 @@
+"""
+cis_matrix.py
+
+Host x CIS-control failure matrix maintained on each ingest.
+
+Each host's latest scan is one row in cis_host_controls: the control ids it
+reported as non-compliant (`failing`, multikey-indexed) and as compliant.
+Per-control totals (failing / compliant hosts, name, severity) live in one
+cis_control_counters document, updated with a single $inc from the
+difference between the host's old and new row. Fleet failure rates are then
+one document read and the failing hosts of a control one index lookup;
+neither touches endpoint_scans.
+
+rebuild_cis_matrix() recomputes rows and totals from endpoint_scans
+(backfill / repair); it runs periodically, in one uvicorn worker at a time.
+Like ingest, it only swaps in a row when no newer scan is counted and $incs
+the exact difference, so a scan ingested during a rebuild is never
+overwritten.
+"""
+
+import os
+from datetime import datetime, timezone
+from threading import Lock
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend.db.mongo import (
+    endpoint_scans_collection,
+    cis_host_controls_collection,
+    cis_control_counters_collection,
+)
+from backend.services.periodic import PeriodicTask
+from backend.services.posture_counters import host_key
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+COUNTERS_ID = "org"
+
+CIS_MATRIX_REBUILD_INTERVAL_SECONDS = int(os.getenv("CIS_MATRIX_REBUILD_INTERVAL_SECONDS", "3600"))
+
+# Controls whose name / severity this process has already written to the
+# counters document; ingest writes metadata only for controls not in here
+_known_controls = set()
+_known_controls_lock = Lock()
+
+
+def control_key(control_id: str) -> str:
+    """Field name for a control id (ids contain dots, which MongoDB field names cannot)."""
+    return str(control_id).replace(".", "．")
+
+
+def host_row(sdata: dict) -> dict:
+    """
+    One host's matrix row from its scan:
+    {"failing": [ids], "compliant": [ids], "controls": {id: {name, severity_weight}}}.
+    A control reported more than once counts once; any non-compliant entry makes it failing.
+    """
+    failing, compliant, meta = [], [], {}
+    controls = (sdata.get("cis_compliance") or {}).get("controls") or []
+
+    for control in controls:
+        control_id = control.get("control_id")
+        if not control_id:
+            continue
+        control_id = str(control_id)
+        meta.setdefault(control_id, {"name": control.get("name"), "severity_weight": control.get("severity_weight")})
+        if control.get("status") == "non-compliant":
+            if control_id not in failing:
+                failing.append(control_id)
+        elif control.get("status") == "compliant":
+            if control_id not in compliant:
+                compliant.append(control_id)
+
+    compliant = [c for c in compliant if c not in failing]
+    return {"failing": failing, "compliant": compliant, "controls": meta}
+
+
+def _row_counts(row: dict) -> dict:
+    counts = {}
+    for control_id in row.get("failing", []):
+        counts[f"controls.{control_key(control_id)}.failing"] = 1
+    for control_id in row.get("compliant", []):
+        counts[f"controls.{control_key(control_id)}.compliant"] = 1
+    return counts
+
+
+def _control_meta(controls: dict) -> dict:
+    meta = {}
+    for control_id, info in controls.items():
+        key = control_key(control_id)
+        meta[f"controls.{key}.control_id"] = control_id
+        meta[f"controls.{key}.name"] = info.get("name")
+        meta[f"controls.{key}.severity_weight"] = info.get("severity_weight")
+    return meta
+
+
+def _new_controls(controls: dict) -> dict:
+    """The controls not yet known to this process (and marks them known)."""
+    with _known_controls_lock:
+        new = {c: info for c, info in controls.items() if control_key(c) not in _known_controls}
+        _known_controls.update(control_key(c) for c in new)
+    return new
+
+
+def _row_delta(old, new) -> dict:
+    """Counter changes for replacing row old with new (either may be None)."""
+    old_counts = _row_counts(old) if old is not None else {}
+    new_counts = _row_counts(new) if new is not None else {}
+
+    delta = {}
+    for field in set(old_counts) | set(new_counts):
+        change = new_counts.get(field, 0) - old_counts.get(field, 0)
+        if change:
+            delta[field] = change
+    if old is None and new is not None:
+        delta["total_hosts"] = 1
+    elif old is not None and new is None:
+        delta["total_hosts"] = -1
+    return delta
+
+
+def _update_counters(delta: dict, controls: dict = None):
+    """$incs delta onto the totals; writes metadata of controls this process has not seen yet."""
+    update = {}
+    meta = _control_meta(_new_controls(controls or {}))
+    if delta:
+        update["$inc"] = delta
+    if delta or meta:
+        update["$set"] = {"updated_at": datetime.now(timezone.utc), **meta}
+        cis_control_counters_collection().update_one({"_id": COUNTERS_ID}, update, upsert=True)
+
+
+def _row_document(scan_time, sdata: dict, endpoint_id, row: dict) -> dict:
+    return {
+        "scan_time": scan_time,
+        "hostname": sdata.get("hostname") or (sdata.get("system") or {}).get("hostname"),
+        "endpoint_id": str(endpoint_id) if endpoint_id is not None else None,
+        "failing": row["failing"],
+        "compliant": row["compliant"],
+    }
+
+
+def _swap_row(key: str, document: dict, controls: dict) -> bool:
+    """
+    Makes document the host's row unless a newer scan is already counted,
+    and adds the difference to the totals.
+    Returns False if a newer scan is counted.
+    """
+    scan_time = document["scan_time"]
+    try:
+        previous = cis_host_controls_collection().find_one_and_update(
+            {"_id": key, "$or": [{"scan_time": {"$lte": scan_time}}, {"scan_time": {"$exists": False}}]},
+            {"$set": document},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        return False  # a newer scan for this host is already in the matrix
+
+    _update_counters(_row_delta(previous, document), controls)
+    return True
+
+
+# -------------------------------
+# Ingest path
+# -------------------------------
+
+def apply_scan_controls(sdata: dict, scan_time: datetime, endpoint_id=None) -> bool:
+    """
+    Replaces the host's matrix row with the one from a newly stored scan.
+    Returns False if the scan has no hostname or is older than the host's current row.
+    """
+    key = host_key(sdata)
+    if not key:
+        return False
+
+    row = host_row(sdata)
+    return _swap_row(key, _row_document(scan_time, sdata, endpoint_id, row), row["controls"])
+
+
+# -------------------------------
+# Full recompute
+# -------------------------------
+
+def _latest_scans() -> dict:
+    """{host: scan} for the latest scan of every host."""
+    latest = {}
+    for scan in endpoint_scans_collection().find({}, {"endpoint_id": 1, "scan_time": 1, "scan_data": 1}).sort("scan_time", -1):
+        key = host_key(scan.get("scan_data", {}))
+        if key and key not in latest:
+            latest[key] = scan
+    return latest
+
+
+def _insert_rows(documents: dict) -> dict:
+    """
+    Inserts the rows of hosts that had none ({host: row document}), skipping
+    hosts an ingest added meanwhile. Returns the rows that were inserted.
+    """
+    rows = cis_host_controls_collection()
+    keys, skipped = list(documents), set()
+    for start in range(0, len(keys), 1000):
+        batch = keys[start:start + 1000]
+        try:
+            rows.insert_many([{"_id": key, **documents[key]} for key in batch], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            skipped.update(batch[error["index"]] for error in errors)
+    return {key: document for key, document in documents.items() if key not in skipped}
+
+
+def _reconcile_totals():
+    """
+    Applies any difference between the totals and the sum of the stored rows
+    as one $inc. Skipped if an ingest updated the totals meanwhile; the next
+    rebuild retries.
+    """
+    current = cis_control_counters_collection().find_one({"_id": COUNTERS_ID}) or {}
+
+    summed = {"total_hosts": 0}
+    for doc in cis_host_controls_collection().find({}, {"failing": 1, "compliant": 1}):
+        summed["total_hosts"] += 1
+        for field, value in _row_counts(doc).items():
+            summed[field] = summed.get(field, 0) + value
+
+    running = {"total_hosts": current.get("total_hosts", 0)}
+    for key, entry in (current.get("controls") or {}).items():
+        for status in ("failing", "compliant"):
+            running[f"controls.{key}.{status}"] = entry.get(status, 0)
+
+    residual = {}
+    for field in set(running) | set(summed):
+        change = summed.get(field, 0) - running.get(field, 0)
+        if change:
+            residual[field] = change
+
+    if residual:
+        cis_control_counters_collection().update_one(
+            {"_id": COUNTERS_ID, "updated_at": current.get("updated_at")},
+            {"$inc": residual, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=not current,
+        )
+
+
+def rebuild_cis_matrix() -> int:
+    """
+    Recomputes every row and the per-control totals from the latest scan per
+    host and repairs what differs, without overwriting concurrent ingests:
+    changed rows go through the same conditional swap as ingest, rows of new
+    hosts are bulk-inserted (skipping any an ingest added meanwhile) and rows
+    of hosts without scans are removed only if unchanged since the read.
+    Returns the number of hosts.
+    """
+    latest = _latest_scans()
+    rows = cis_host_controls_collection()
+    stored = {doc["_id"]: doc for doc in rows.find()}
+
+    controls, missing = {}, {}
+    for key, scan in latest.items():
+        sdata = scan.get("scan_data", {})
+        row = host_row(sdata)
+        for control_id, info in row["controls"].items():
+            controls.setdefault(control_id, info)
+
+        document = _row_document(scan.get("scan_time"), sdata, scan.get("endpoint_id"), row)
+        current = stored.get(key)
+        if current is None:
+            missing[key] = document
+        elif any(current.get(field) != value for field, value in document.items()):
+            _swap_row(key, document, {})
+
+    delta = {}
+    for document in _insert_rows(missing).values():
+        for field, change in _row_delta(None, document).items():
+            delta[field] = delta.get(field, 0) + change
+    _update_counters(delta)
+
+    for key, doc in stored.items():
+        if key in latest:
+            continue
+        removed = rows.find_one_and_delete({"_id": key, "scan_time": doc.get("scan_time")})
+        if removed:
+            _update_counters(_row_delta(removed, None))
+
+    _reconcile_totals()
+
+    # Names / severities as the hosts currently report them
+    now = datetime.now(timezone.utc)
+    cis_control_counters_collection().update_one(
+        {"_id": COUNTERS_ID},
+        {"$set": {**_control_meta(controls), "rebuilt_at": now}},
+        upsert=True,
+    )
+    with _known_controls_lock:
+        _known_controls.update(control_key(control_id) for control_id in controls)
+
+    return len(latest)
+
+
+cis_matrix_rebuilder = PeriodicTask(
+    "cis-matrix-rebuild", rebuild_cis_matrix, CIS_MATRIX_REBUILD_INTERVAL_SECONDS, lease=True
+)
+
+
+# -------------------------------
+# Read path
+# -------------------------------
+
+def _counters() -> dict:
+    doc = cis_control_counters_collection().find_one({"_id": COUNTERS_ID})
+    if not doc:
+        # Never built (fresh deployment): backfill from the stored scans first
+        rebuild_cis_matrix()
+        doc = cis_control_counters_collection().find_one({"_id": COUNTERS_ID}) or {}
+    return doc
+
+
+def control_failure_rates() -> dict:
+    """
+    Every reported control with its failing / compliant host counts,
+    most failing first. failure_rate is over the hosts that reported the
+    control, fleet_failure_rate over all hosts.
+    """
+    doc = _counters()
+    total_hosts = doc.get("total_hosts", 0)
+
+    controls = []
+    for entry in (doc.get("controls") or {}).values():
+        failing, compliant = entry.get("failing", 0), entry.get("compliant", 0)
+        evaluated = failing + compliant
+        if not evaluated:
+            continue
+        controls.append({
+            "control_id": entry.get("control_id"),
+            "name": entry.get("name"),
+            "severity_weight": entry.get("severity_weight"),
+            "failing_hosts": failing,
+            "compliant_hosts": compliant,
+            "evaluated_hosts": evaluated,
+            "failure_rate": round(failing / evaluated, 4),
+            "fleet_failure_rate": round(failing / total_hosts, 4) if total_hosts else None,
+        })
+
+    controls.sort(key=lambda c: (-c["failing_hosts"], -(c["severity_weight"] or 0), str(c["control_id"])))
+
+    return {
+        "total_hosts": total_hosts,
+        "updated_at": doc.get("updated_at"),
+        "controls": controls,
+    }
+
+
+def failing_endpoints(control_id: str, skip: int = 0, limit: int = 100) -> dict:
+    """Hosts whose latest scan reports control_id as non-compliant (index lookup on `failing`)."""
+    entry = (_counters().get("controls") or {}).get(control_key(control_id))
+    if entry is None:
+        raise LookupError(f"CIS control not found: {control_id}")
+
+    cursor = cis_host_controls_collection().find(
+        {"failing": control_id},
+        {"hostname": 1, "endpoint_id": 1, "scan_time": 1},
+    ).sort("_id", 1).skip(skip).limit(limit)
+
+    return {
+        "control_id": control_id,
+        "name": entry.get("name"),
+        "severity_weight": entry.get("severity_weight"),
+        "failing_hosts": entry.get("failing", 0),
+        "endpoints": [
+            {
+                "host": doc["_id"],
+                "hostname": doc.get("hostname"),
+                "endpoint_id": doc.get("endpoint_id"),
+                "scan_time": doc.get("scan_time"),
+            }
+            for doc in cursor
+        ],
+    }
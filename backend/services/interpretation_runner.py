@@ -2,8 +2,15 @@
 interpretation_runner.py
 
 Service layer to run interpretation on a posture snapshot.
+
+Interpretations are memoized by a hash of the posture fields the
+interpretation reads (posture_hash). A snapshot whose hash was interpreted
+before gets a small record pointing at that interpretation
+(interpretation_id) instead of a new one.
 """
 
+import hashlib
+import json
 from datetime import datetime, timezone
 from bson import ObjectId
 
@@ -13,38 +20,101 @@ from backend.db.mongo import (
 )
 
 from analysis.interpretation import generate_interpretation
+from backend.services.posture_snapshots import load_posture_data
+
+
+# Bump when analysis/interpretation.py changes its output for the same posture
+INTERPRETATION_VERSION = 1
+
+
+def interpretation_inputs(posture_data: dict) -> dict:
+    """
+    The posture fields generate_interpretation() reads.
+    Keep in sync with analysis/interpretation.py.
+    """
+    summary = posture_data.get("summary", {})
+    cis_overview = posture_data.get("cis_compliance_overview") or {}
+
+    def issues(key):
+        return [[i.get("issue"), i.get("classification")] for i in posture_data.get(key, [])]
+
+    return {
+        "version": INTERPRETATION_VERSION,
+        "total_hosts_analyzed": summary.get("total_hosts_analyzed"),
+        "systemic_issues": issues("systemic_issues"),
+        "isolated_issues": issues("isolated_issues"),
+        "cis": [
+            cis_overview.get("average_compliance_score", 0),
+            cis_overview.get("endpoints_with_critical_failures", 0),
+        ] if cis_overview else None,
+        "ml_risk_overview": posture_data.get("ml_risk_overview", {}),
+    }
 
 
-def run_and_store_interpretation(posture_snapshot_id: str):
+def posture_hash(posture_data: dict) -> str:
+    """Canonical hash of interpretation_inputs()."""
+    canonical = json.dumps(interpretation_inputs(posture_data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def run_and_store_interpretation(posture_snapshot_id: str, posture_data: dict = None):
     """
     Runs interpretation on a given posture snapshot
     and stores the interpretation result.
+
+    posture_data: the snapshot's posture when the caller already holds it
+    (skips reading the snapshot back).
     """
 
     if not ObjectId.is_valid(posture_snapshot_id):
         raise ValueError("Invalid posture_snapshot_id")
 
-    snapshot = org_posture_snapshots_collection().find_one(
-        {"_id": ObjectId(posture_snapshot_id)}
-    )
+    if posture_data is None:
+        snapshot = org_posture_snapshots_collection().find_one(
+            {"_id": ObjectId(posture_snapshot_id)}
+        )
 
-    if not snapshot:
-        raise ValueError("Posture snapshot not found")
+        if not snapshot:
+            raise ValueError("Posture snapshot not found")
 
-    posture_data = snapshot.get("posture_data")
+        posture_data = load_posture_data(snapshot)
 
     if not posture_data:
         raise ValueError("Invalid posture snapshot data")
 
-    # Run interpretation logic
-    interpretation_result = generate_interpretation(posture_data)
+    digest = posture_hash(posture_data)
+    interpretations = org_interpretations_collection()
 
-    interpretation_record = {
-        "posture_snapshot_id": snapshot["_id"],
-        "generated_at": datetime.now(timezone.utc),
-        "interpretation": interpretation_result
-    }
+    # Same posture as an earlier snapshot: point at its interpretation
+    existing = interpretations.find_one({"posture_hash": digest}, {"_id": 1})
 
-    result = org_interpretations_collection().insert_one(interpretation_record)
+    if existing:
+        interpretation_record = {
+            "posture_snapshot_id": ObjectId(posture_snapshot_id),
+            "generated_at": datetime.now(timezone.utc),
+            "interpretation_id": existing["_id"]
+        }
+    else:
+        # Run interpretation logic
+        interpretation_record = {
+            "posture_snapshot_id": ObjectId(posture_snapshot_id),
+            "generated_at": datetime.now(timezone.utc),
+            "posture_hash": digest,
+            "interpretation": generate_interpretation(posture_data)
+        }
+
+    result = interpretations.insert_one(interpretation_record)
 
     return str(result.inserted_id)
+
+
+def resolve_interpretation(record: dict) -> dict:
+    """The interpretation of a stored record, following an interpretation_id reference."""
+    if record.get("interpretation_id") is None:
+        return record.get("interpretation")
+
+    original = org_interpretations_collection().find_one(
+        {"_id": record["interpretation_id"]},
+        {"interpretation": 1}
+    )
+    return original.get("interpretation") if original else None
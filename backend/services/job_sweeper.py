@@ -0,0 +1,57 @@
+"""
+job_sweeper.py
+
+Background sweeper for agent_jobs.
+
+Responsibilities:
+- Mark stale pending/disconnected jobs as 'expired'
+- Delete jobs once they are past the retention window
+
+Runs on a fixed cadence in a daemon thread started with the API, so read
+routes (e.g. the Jobs page polling /api/jobs) never write to agent_jobs.
+Every uvicorn worker starts the thread; a lease lets only one of them sweep
+per interval.
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+from backend.db.mongo import agent_jobs_collection
+from backend.services.periodic import PeriodicTask
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+JOB_SWEEP_INTERVAL_SECONDS = int(os.getenv("JOB_SWEEP_INTERVAL_SECONDS", "15"))
+
+# Jobs are deleted this long after expires_at (previously done by a TTL index)
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "300"))
+
+OPEN_JOB_STATUSES = ["pending", "disconnected"]
+
+
+def sweep_jobs(now: datetime = None) -> dict:
+    """
+    One sweep: expire stale open jobs, then delete jobs past retention.
+    Returns counts of expired and deleted jobs.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    expired = agent_jobs_collection().update_many(
+        {"status": {"$in": OPEN_JOB_STATUSES}, "expires_at": {"$lt": now}},
+        {"$set": {"status": "expired", "expired_at": now}}
+    )
+
+    deleted = agent_jobs_collection().delete_many(
+        {"expires_at": {"$lt": now - timedelta(seconds=JOB_RETENTION_SECONDS)}}
+    )
+
+    return {
+        "expired_count": expired.modified_count,
+        "deleted_count": deleted.deleted_count
+    }
+
+
+job_sweeper = PeriodicTask("job-sweeper", sweep_jobs, JOB_SWEEP_INTERVAL_SECONDS, lease=True)
@@ -0,0 +1,312 @@
+"""
+llm_explanations.py
+
+Cached, batched LLM explanations of an endpoint's findings.
+
+An explanation depends only on its grounded inputs: system, risk
+assessment (score, level, breakdown), anomaly assessment, risk flags and
+features (see explanation_inputs). The canonical hash of those inputs is
+the _id of its llm_explanations document, so an unchanged endpoint is never
+explained twice, and requests for inputs already being generated join that
+generation instead of starting another.
+
+Cache misses go through an in-process queue. A dispatcher thread groups up
+to LLM_BATCH_SIZE prompts, waiting at most LLM_BATCH_WAIT_MS for a batch to
+fill, and runs at most LLM_CONCURRENCY client calls at once; while all
+slots are busy the next batch keeps filling. Callers get a Future (async
+routes await it with asyncio.wrap_future).
+
+Clients expose generate(prompt) and optionally generate_batch(prompts).
+The default is StubLLMClient, a deterministic local stand-in
+(LLM_STUB_LATENCY_MS simulates per-call latency for offline benchmarks).
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+from agent.llm_dummy import DummyLLMClient
+from agent.llm_explainer import build_prompt
+from backend.db.mongo import llm_explanations_collection
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+LLM_BATCH_WAIT_MS = int(os.getenv("LLM_BATCH_WAIT_MS", "50"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+LLM_STUB_LATENCY_MS = int(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+
+# Bump when build_prompt changes, so cached explanations of the old prompt are not reused
+PROMPT_VERSION = 1
+
+
+# -------------------------------
+# Grounded inputs
+# -------------------------------
+
+def explanation_inputs(scan_data: dict, prediction: dict = None) -> dict:
+    """
+    The data an explanation may use, in build_prompt's scan shape.
+    prediction (predict_risk output) supplies the anomaly assessment for
+    scans that carry none; its score is rounded so retraining noise does not
+    change the inputs.
+    """
+    system = scan_data.get("system") or {}
+    anomaly = scan_data.get("anomaly_assessment")
+    if not anomaly and prediction:
+        anomaly = {
+            "is_anomalous": prediction.get("is_anomaly"),
+            "anomaly_score": round(prediction.get("anomaly_score") or 0.0, 2),
+        }
+
+    return {
+        "system": {
+            "hostname": scan_data.get("hostname") or system.get("hostname"),
+            "os": scan_data.get("os") or system.get("os"),
+        },
+        "risk_assessment": scan_data.get("risk_assessment") or {},
+        "anomaly_assessment": anomaly or {},
+        "risk_flags": scan_data.get("risk_flags") or [],
+        "features": scan_data.get("features") or {},
+    }
+
+
+def inputs_hash(inputs: dict) -> str:
+    canonical = json.dumps(
+        {"prompt_version": PROMPT_VERSION, **inputs}, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# -------------------------------
+# Clients
+# -------------------------------
+
+class StubLLMClient(DummyLLMClient):
+    """
+    Deterministic local client: the dummy explanation tagged with a digest
+    of the prompt, so equal prompts give equal text. No network.
+    """
+
+    model = "local-stub"
+
+    def __init__(self, latency_ms: int = LLM_STUB_LATENCY_MS):
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    def generate(self, prompt):
+        return self.generate_batch([prompt])[0]
+
+    def generate_batch(self, prompts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)  # one round trip per call, whatever the batch size
+        return [
+            super(StubLLMClient, self).generate(prompt)
+            + f"\n(Generated by {self.model}, prompt {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]})\n"
+            for prompt in prompts
+        ]
+
+
+# -------------------------------
+# Service
+# -------------------------------
+
+class ExplanationService:
+    """Cache lookup, in-flight de-duplication and batched generation."""
+
+    def __init__(self, client=None, batch_size: int = LLM_BATCH_SIZE,
+                 batch_wait_ms: int = LLM_BATCH_WAIT_MS, concurrency: int = LLM_CONCURRENCY):
+        self.client = client or StubLLMClient()
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.concurrency = max(1, concurrency)
+
+        self._queue = queue.Queue()
+        self._inflight = {}  # input hash -> Future
+        self._completed = 0  # batches written to the cache
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._counts = {"requests": 0, "cache_hits": 0, "joined": 0, "generated": 0,
+                        "failed": 0, "batches": 0, "llm_seconds": 0.0}
+
+    @property
+    def model(self) -> str:
+        return getattr(self.client, "model", type(self.client).__name__)
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="llm-explain")
+            self._thread = threading.Thread(target=self._dispatch, name="llm-explain-dispatch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._pool:
+            self._pool.shutdown(wait=True)
+        # Anything still queued will not be generated
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._fail(pending, RuntimeError("Explanation service stopped"))
+
+    def explain_many(self, inputs_list: list) -> list:
+        """
+        One Future per inputs dict, resolving to
+        {"input_hash", "explanation", "model", "generated_at"}.
+        Cached inputs come back already resolved.
+        """
+        self.start()
+        keys = [inputs_hash(inputs) for inputs in inputs_list]
+        cached, lookup = {}, set(keys)
+
+        while True:
+            completed = self._completed
+            cached.update(
+                (doc["_id"], doc) for doc in llm_explanations_collection().find({"_id": {"$in": list(lookup)}})
+            )
+            with self._lock:
+                # A batch finished during the lookup: its results may be missing from `cached`
+                if self._completed != completed:
+                    lookup = {key for key in keys if key not in cached and key not in self._inflight}
+                    continue
+
+                futures, queued = [], {}
+                self._counts["requests"] += len(keys)
+                for key, inputs in zip(keys, inputs_list):
+                    if key in cached:
+                        self._counts["cache_hits"] += 1
+                        future = Future()
+                        future.set_result(_result(cached[key]))
+                    elif key in self._inflight or key in queued:
+                        self._counts["joined"] += 1
+                        future = self._inflight.get(key) or queued[key]
+                    else:
+                        future = self._inflight[key] = queued[key] = Future()
+                        self._queue.put((key, build_prompt(inputs), future))
+                    futures.append(future)
+                return futures
+
+    def explain(self, inputs: dict) -> Future:
+        return self.explain_many([inputs])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            counts["inflight"] = len(self._inflight)
+        batches = counts["batches"]
+        return {
+            **counts,
+            "llm_seconds": round(counts["llm_seconds"], 3),
+            "avg_batch_size": round((counts["generated"] + counts["failed"]) / batches, 2) if batches else None,
+            "model": self.model,
+            "batch_size": self.batch_size,
+            "batch_wait_ms": round(self.batch_wait * 1000),
+            "concurrency": self.concurrency,
+        }
+
+    # ---- dispatcher / workers ----
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # Fill the batch for up to batch_wait
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Wait for a free client slot; meanwhile the next batch keeps filling
+            while not self._slots.acquire(timeout=0.5):
+                if self._stop.is_set():
+                    self._fail(batch, RuntimeError("Explanation service stopped"))
+                    return
+            self._pool.submit(self._generate, batch)
+
+    def _generate(self, batch: list):
+        try:
+            prompts = [prompt for _, prompt, _ in batch]
+            started = time.perf_counter()
+            if hasattr(self.client, "generate_batch"):
+                texts = list(self.client.generate_batch(prompts))
+            else:
+                texts = [self.client.generate(prompt) for prompt in prompts]
+            elapsed = time.perf_counter() - started
+            if len(texts) != len(batch):
+                raise RuntimeError(f"LLM client returned {len(texts)} explanations for {len(batch)} prompts")
+
+            now = datetime.now(timezone.utc)
+            docs = [
+                {"_id": key, "explanation": text, "model": self.model, "generated_at": now}
+                for (key, _, _), text in zip(batch, texts)
+            ]
+            llm_explanations_collection().bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False
+            )
+
+            with self._lock:
+                self._counts["generated"] += len(batch)
+                self._counts["batches"] += 1
+                self._counts["llm_seconds"] += elapsed
+                self._completed += 1
+                for key, _, _ in batch:
+                    self._inflight.pop(key, None)
+            for (_, _, future), doc in zip(batch, docs):
+                future.set_result(_result(doc))
+        except Exception as e:
+            print(f"[WARN] LLM explanation batch failed: {e}")
+            with self._lock:
+                self._counts["batches"] += 1
+            self._fail(batch, e)
+        finally:
+            self._slots.release()
+
+    def _fail(self, batch: list, error: Exception):
+        with self._lock:
+            self._counts["failed"] += len(batch)
+            for key, _, _ in batch:
+                self._inflight.pop(key, None)
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+def _result(doc: dict) -> dict:
+    return {
+        "input_hash": doc["_id"],
+        "explanation": doc.get("explanation"),
+        "model": doc.get("model"),
+        "generated_at": doc.get("generated_at"),
+    }
+
+
+# Process-wide service; started on first use, stopped with the app
+explainer = ExplanationService()
@@ -0,0 +1,92 @@
+"""
+ml_features.py
+
+Feature extraction for the ML models (see ml_service.py).
+
+FEATURE_COLUMNS is the model's feature schema; ML_FIELDS lists the scan_data
+fields extract_features reads, so queries that only feed the models
+(training cursor, systemic analysis ML pipeline) can project just those.
+"""
+
+
+FEATURE_COLUMNS = [
+    'listening_ports_count', 
+    'risky_ports_count', 
+    'remote_registry_enabled', 
+    'winrm_enabled',
+    'rdp_enabled',
+    'av_enabled',
+    'firewall_any_off',
+    'software_count',
+    'large_attack_surface',
+    # CIS Compliance Features
+    'cis_weighted_score',
+    'cis_critical_failures',
+    'cis_total_failures'
+]
+
+def extract_features(scan_data):
+    features = {}
+
+    # ===== NETWORK FEATURES =====
+    features['listening_ports_count'] = scan_data.get(
+        'listening_ports_count', 0
+    )
+
+    risky_ports = scan_data.get('risky_listening_ports', [])
+    features['risky_ports_count'] = len(risky_ports) if isinstance(risky_ports, list) else 0
+
+    # ===== EXPOSURE POSTURE =====
+    exposure = scan_data.get('exposure_posture', {})
+
+    features['remote_registry_enabled'] = 1 if exposure.get('remote_registry_enabled') else 0
+    features['winrm_enabled'] = 1 if exposure.get('winrm_enabled') else 0
+    features['rdp_enabled'] = 1 if exposure.get('rdp_enabled') else 0
+
+    # ===== SECURITY FEATURES =====
+    sec = scan_data.get('features', {})
+
+    features['av_enabled'] = 1 if sec.get('av_enabled') else 0
+    features['firewall_any_off'] = 1 if sec.get('firewall_any_off') else 0
+
+    # ===== ATTACK SURFACE =====
+    features['software_count'] = sec.get('software_count', 0)
+    features['large_attack_surface'] = 1 if sec.get('large_attack_surface') else 0
+
+    # ===== CIS COMPLIANCE FEATURES =====
+    cis = scan_data.get('cis_compliance', {})
+    score_data = cis.get('compliance_score', {})
+    
+    features['cis_weighted_score'] = score_data.get('weighted_score', 0)
+    features['cis_critical_failures'] = sum(
+        1 for c in cis.get('controls', []) 
+        if c.get('status') == 'non-compliant' and c.get('severity_weight') == 3
+    )
+    features['cis_total_failures'] = score_data.get('non_compliant_count', 0)
+
+    return features
+
+def get_feature_vector(scan_data):
+    """
+    Extracts features and returns ordered list of values.
+    """
+    feats = extract_features(scan_data)
+    return [feats.get(c, 0) for c in FEATURE_COLUMNS]
+
+
+# scan_data fields read by extract_features (keep in sync with it)
+ML_FIELDS = [
+    "listening_ports_count",
+    "risky_listening_ports",
+    "exposure_posture.remote_registry_enabled",
+    "exposure_posture.winrm_enabled",
+    "exposure_posture.rdp_enabled",
+    "features.av_enabled",
+    "features.firewall_any_off",
+    "features.software_count",
+    "features.large_attack_surface",
+    "cis_compliance.compliance_score.weighted_score",
+    "cis_compliance.compliance_score.non_compliant_count",
+    "cis_compliance.controls.status",
+    "cis_compliance.controls.severity_weight",
+]
@@ -3,88 +3,158 @@ import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.cluster import KMeans
-from backend.db.mongo import endpoint_scans_collection
-import pickle
+from backend.services.ml_features import FEATURE_COLUMNS, ML_FIELDS, extract_features, get_feature_vector
+from backend.services import model_registry
+from datetime import datetime, timezone
+from threading import Lock
 import os
+import time
+import sklearn
 
-# Global models (in-memory for MVP)
-MODEL_IF = None
-MODEL_KM = None
-# Path to save/load models if needed, but for now in-memory is fine
-# or we can save to disk to persist across reloads.
-MODEL_PATH = "ml_models.pkl"
-
-FEATURE_COLUMNS = [
-    'listening_ports_count', 
-    'risky_ports_count', 
-    'remote_registry_enabled', 
-    'winrm_enabled',
-    'rdp_enabled',
-    'av_enabled',
-    'firewall_any_off',
-    'software_count',
-    'large_attack_surface',
-    # CIS Compliance Features
-    'cis_weighted_score',
-    'cis_critical_failures',
-    'cis_total_failures'
-]
-
-def extract_features(scan_data):
-    features = {}
-
-    # ===== NETWORK FEATURES =====
-    features['listening_ports_count'] = scan_data.get(
-        'listening_ports_count', 0
-    )
-
-    risky_ports = scan_data.get('risky_listening_ports', [])
-    features['risky_ports_count'] = len(risky_ports) if isinstance(risky_ports, list) else 0
-
-    # ===== EXPOSURE POSTURE =====
-    exposure = scan_data.get('exposure_posture', {})
-
-    features['remote_registry_enabled'] = 1 if exposure.get('remote_registry_enabled') else 0
-    features['winrm_enabled'] = 1 if exposure.get('winrm_enabled') else 0
-    features['rdp_enabled'] = 1 if exposure.get('rdp_enabled') else 0
-
-    # ===== SECURITY FEATURES =====
-    sec = scan_data.get('features', {})
-
-    features['av_enabled'] = 1 if sec.get('av_enabled') else 0
-    features['firewall_any_off'] = 1 if sec.get('firewall_any_off') else 0
-
-    # ===== ATTACK SURFACE =====
-    features['software_count'] = sec.get('software_count', 0)
-    features['large_attack_surface'] = 1 if sec.get('large_attack_surface') else 0
-
-    # ===== CIS COMPLIANCE FEATURES =====
-    cis = scan_data.get('cis_compliance', {})
-    score_data = cis.get('compliance_score', {})
-    
-    features['cis_weighted_score'] = score_data.get('weighted_score', 0)
-    features['cis_critical_failures'] = sum(
-        1 for c in cis.get('controls', []) 
-        if c.get('status') == 'non-compliant' and c.get('severity_weight') == 3
-    )
-    features['cis_total_failures'] = score_data.get('non_compliant_count', 0)
+# Training rows: newest scan per endpoint, or every stored scan
+ML_TRAIN_ALL_SCANS = os.getenv("ML_TRAIN_ALL_SCANS", "false").lower() in ("1", "true", "yes")
+ML_TRAIN_CHUNK_ROWS = int(os.getenv("ML_TRAIN_CHUNK_ROWS", "5000"))
+BASELINE_SAMPLES = 20
+
+# How often a process checks whether another one activated a different version
+ML_MODEL_SYNC_SECONDS = float(os.getenv("ML_MODEL_SYNC_SECONDS", "30"))
+_last_sync = 0.0
 
-    return features
 
-def get_training_data():
+class ModelBundle:
     """
-    Fetches all scans and converts to DataFrame.
+    One consistent set of serving models: the Isolation Forest, the KMeans
+    risk clustering and its cluster -> risk level mapping, plus their
+    registry version and metadata. Never mutated: retraining, loading or
+    rollback builds a new bundle and publishes it with one reference swap,
+    so a predict always scores with a matching pair.
     """
-    scans = list(endpoint_scans_collection().find({}, {"scan_data": 1, "_id": 0}))
-    if not scans:
-        return pd.DataFrame()
-    
-    data = []
-    for s in scans:
-        if 'scan_data' in s:
-            data.append(extract_features(s['scan_data']))
-            
-    return pd.DataFrame(data)
+
+    def __init__(self, isolation_forest, kmeans, mapping, version=None, metadata=None):
+        self.isolation_forest = isolation_forest
+        self.kmeans = kmeans
+        self.mapping = mapping
+        self.version = version  # None: not saved in the registry
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_registry(cls, models, metadata):
+        return cls(models["isolation_forest"], models["kmeans"]["model"], models["kmeans"]["mapping"],
+                   metadata["version"], metadata)
+
+    def registry_models(self):
+        return {"isolation_forest": self.isolation_forest, "kmeans": {"model": self.kmeans, "mapping": self.mapping}}
+
+    @property
+    def trained_at(self):
+        created_at = self.metadata.get("created_at")
+        return datetime.fromisoformat(created_at) if created_at else None
+
+
+# The serving bundle (in-memory); trained models are also saved as versions in
+# the on-disk registry (model_registry.py) and loaded from there at startup
+MODEL_BUNDLE = None
+
+# One training per process at a time; serving never waits on it, except for
+# callers that arrive before there is any model at all (_first_model_lock)
+_training_lock = Lock()
+_first_model_lock = Lock()
+
+
+def current_bundle():
+    return MODEL_BUNDLE
+
+
+def publish_bundle(bundle):
+    """Makes bundle the serving one (a single reference assignment, atomic for readers)."""
+    global MODEL_BUNDLE
+    MODEL_BUNDLE = bundle
+
+def _scans_collection():
+    # Imported on use: serving from a loaded bundle needs no database
+    from backend.db.mongo import endpoint_scans_collection
+    return endpoint_scans_collection()
+
+def _training_row_count(all_scans):
+    if all_scans:
+        return _scans_collection().count_documents({})
+    counted = next(_scans_collection().aggregate([
+        {"$group": {"_id": "$endpoint_id"}},
+        {"$count": "rows"},
+    ], allowDiskUse=True), {})
+    return counted.get("rows", 0)
+
+def load_training_matrix(all_scans=None, extra_rows=0):
+    """
+    Streams the training features into a preallocated float32 matrix
+    (columns in FEATURE_COLUMNS order), one row per endpoint from its newest
+    scan (all_scans / ML_TRAIN_ALL_SCANS: one row per stored scan).
+
+    The cursor projects only the fields extract_features reads (ML_FIELDS)
+    and rows are converted in chunks of ML_TRAIN_CHUNK_ROWS, so memory stays
+    at the matrix plus one chunk. extra_rows spare rows are left at the end
+    (for the synthetic baseline). Missing values become 0; scans whose
+    features are not numeric are skipped.
+
+    Returns:
+        (X, real_rows): X has real_rows scan rows followed by extra_rows spare rows
+    """
+    all_scans = ML_TRAIN_ALL_SCANS if all_scans is None else all_scans
+    width = len(FEATURE_COLUMNS)
+    capacity = _training_row_count(all_scans)
+    X = np.empty((capacity + extra_rows, width), dtype=np.float32)
+    filled, skipped, chunk = 0, 0, []
+
+    def flush():
+        nonlocal X, capacity, filled, skipped
+        try:
+            rows = np.asarray(chunk, dtype=np.float32).reshape(len(chunk), width)
+        except (TypeError, ValueError):
+            # Some vector holds a non-numeric value: keep the rows that convert
+            good = []
+            for vector in chunk:
+                try:
+                    good.append(np.asarray(vector, dtype=np.float32))
+                except (TypeError, ValueError):
+                    skipped += 1
+            rows = np.array(good, dtype=np.float32).reshape(len(good), width)
+        np.nan_to_num(rows, copy=False, nan=0.0)  # None values
+
+        if filled + len(rows) > capacity:
+            # Scans stored since the row count: grow once, generously
+            capacity = max(filled + len(rows), capacity * 2)
+            grown = np.empty((capacity + extra_rows, width), dtype=np.float32)
+            grown[:filled] = X[:filled]
+            X = grown
+
+        X[filled:filled + len(rows)] = rows
+        filled += len(rows)
+        chunk.clear()
+
+    projection = {"_id": 0, "endpoint_id": 1}
+    projection.update({f"scan_data.{field}": 1 for field in ML_FIELDS})
+    cursor = _scans_collection().find({}, projection, batch_size=ML_TRAIN_CHUNK_ROWS)
+    if not all_scans:
+        # endpoint_scan_time_idx order: each endpoint's newest scan comes first
+        cursor = cursor.sort([("endpoint_id", 1), ("scan_time", -1)])
+
+    previous = object()
+    for doc in cursor:
+        if "scan_data" not in doc:
+            continue
+        if not all_scans:
+            if doc.get("endpoint_id") == previous:
+                continue
+            previous = doc.get("endpoint_id")
+        chunk.append(get_feature_vector(doc["scan_data"]))
+        if len(chunk) >= ML_TRAIN_CHUNK_ROWS:
+            flush()
+    if chunk:
+        flush()
+
+    if skipped:
+        print(f"[WARN] Skipped {skipped} scans with non-numeric ML features")
+    return X[:filled + extra_rows], filled
 
 def generate_synthetic_baseline(n_samples=20):
     """
@@ -112,52 +182,22 @@ def generate_synthetic_baseline(n_samples=20):
     
     return pd.DataFrame(baseline)
 
-def get_feature_vector(scan_data):
+def build_models():
     """
-    Extracts features and returns ordered list of values.
+    Trains Isolation Forest and KMeans into a new, unpublished ModelBundle.
+    Raises ValueError if there is nothing to train on.
     """
-    feats = extract_features(scan_data)
-    return [feats.get(c, 0) for c in FEATURE_COLUMNS]
+    # Real data, with room for the synthetic baseline after it
+    X, real_samples = load_training_matrix(extra_rows=BASELINE_SAMPLES)
 
-def train_models():
-    """
-    Retrains Isolation Forest and KMeans.
-    Returns status dict.
-    """
-    global MODEL_IF, MODEL_KM
-    
-    # Get real data
-    df_real = get_training_data()
-    
-    # Get synthetic baseline
-    df_baseline = generate_synthetic_baseline(n_samples=20)
-    
-    # Combine
-    if df_real.empty:
-        df = df_baseline
-    else:
-        # We need to make sure df_real has all FEATURE_COLUMNS
-        for col in FEATURE_COLUMNS:
-            if col not in df_real.columns:
-                df_real[col] = 0
-        
-        # Select only feature columns to align with baseline
-        df_real = df_real[FEATURE_COLUMNS]
-        df_baseline = df_baseline[FEATURE_COLUMNS] 
-        
-        df = pd.concat([df_real, df_baseline], ignore_index=True)
-    
-    # Handle missing values if any
-    df = df.fillna(0)
-    
-    X = df.values
+    # Synthetic baseline
+    X[real_samples:] = generate_synthetic_baseline(n_samples=BASELINE_SAMPLES)[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
     
     # Train Isolation Forest
     # contamination='auto' -> 0.1 default in older sklearn, 'auto' in newer.
     # Let's use 'auto' if possible, or fixed 0.1 for stability.
     clf = IsolationForest(contamination='auto', random_state=42)
     clf.fit(X)
-    MODEL_IF = clf
     
     # Predict anomalies to get scores
     scores = clf.decision_function(X)
@@ -168,7 +208,7 @@ def train_models():
     n_clusters = min(3, n_samples)
     
     if n_clusters < 1:
-         return {"status": "error", "message": "Insufficient data"}
+         raise ValueError("Insufficient data")
          
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     kmeans.fit(scores.reshape(-1, 1))
@@ -181,8 +221,6 @@ def train_models():
     # Actually, if is_anomaly is true, risk should be elevated. 
     # But let's stick to the cluster logic.
     
-    risk_labels = ["High", "Medium", "Low"] # Associated with indices 0, 1, 2 (lowest score to highest)
-    
     # Create mapping: cluster_idx -> Label
     # sorted_indices[0] is index of cluster with lowest score (most anomalous) -> "High"
     # But if we only have 2 clusters?
@@ -200,47 +238,163 @@ def train_models():
     else:
         risk_mapping[sorted_indices[0]] = "Low" # Only 1 cluster -> assume normal
         
-    MODEL_KM = {
-        "model": kmeans,
-        "mapping": risk_mapping
-    }
-    
-    return {"status": "success", "message": f"Trained on {len(df)} samples"}
+    return ModelBundle(clf, kmeans, risk_mapping, metadata={
+        "created_at": datetime.now(timezone.utc).isoformat(),  # replaced by the registry's on save
+        "feature_columns": FEATURE_COLUMNS,
+        "training_samples": len(X),
+        "real_samples": real_samples,
+        "baseline_samples": len(X) - real_samples,
+        "training_rows": "all scans" if ML_TRAIN_ALL_SCANS else "newest scan per endpoint",
+        "n_clusters": n_clusters,
+        "risk_mapping": {str(int(k)): v for k, v in risk_mapping.items()},
+        "sklearn_version": sklearn.__version__,
+    })
 
-def predict_risk(scan_data):
+def train_models():
     """
-    Predicts anomaly and risk for a single scan.
-    Returns dict with anomaly_score, risk_level.
+    Retrains Isolation Forest and KMeans, saves them as a new registry
+    version, makes it the active one and publishes it for serving.
+    Predicts keep using the previous bundle until the swap.
+    Returns status dict.
     """
-    global MODEL_IF, MODEL_KM
-    
-    # Auto-train attempt
-    if MODEL_IF is None:
+    with _training_lock:
+        try:
+            bundle = build_models()
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+
+        # Persist as a new version (serving continues in memory if this fails)
         try:
-            res = train_models()
-            if res.get('status') == 'error':
-                 # Fallback if training failed (e.g. no data)
-                 return {"risk": "Unknown", "anomaly_score": 0.0, "is_anomaly": False, "details": res['message']}
+            version = model_registry.save_version(bundle.registry_models(), bundle.metadata)
+            bundle = ModelBundle.from_registry(bundle.registry_models(), model_registry.read_metadata(version))
         except Exception as e:
-             return {"risk": "Error", "anomaly_score": 0.0, "is_anomaly": False, "details": str(e)}
+            print(f"[WARN] Could not save trained models to the registry: {e}")
+
+        publish_bundle(bundle)
+
+    return {
+        "status": "success",
+        "message": f"Trained on {bundle.metadata['training_samples']} samples",
+        "version": bundle.version,
+    }
+
+def load_models(version=None):
+    """
+    Loads a registry version (default: the active one) as the serving models.
+    Returns its metadata, or None if the registry has no active version.
+    """
+    global _last_sync
+
+    version = version or model_registry.active_version()
+    if version is None:
+        return None
+
+    models, metadata = model_registry.load_version(version, FEATURE_COLUMNS)
+    publish_bundle(ModelBundle.from_registry(models, metadata))
+    _last_sync = time.monotonic()
+    return metadata
+
+def warm_load_models():
+    """
+    Loads the active registry version at startup, so the first predict
+    does not have to train. Never raises.
+    """
+    try:
+        metadata = load_models()
+    except Exception as e:
+        print(f"[WARN] Could not load the active ML model version: {e}")
+        return None
+    if metadata is None:
+        print("[INFO] No saved ML models; they are trained on first use")
+    else:
+        print(f"[INFO] Loaded ML model version {metadata['version']} "
+              f"({metadata.get('training_samples')} training samples)")
+    return metadata
+
+def sync_active_version(force=False):
+    """Follows a version activated by another worker (select / rollback / training)."""
+    global _last_sync
+    if not force and MODEL_BUNDLE is not None and time.monotonic() - _last_sync < ML_MODEL_SYNC_SECONDS:
+        return
+    _last_sync = time.monotonic()
+    try:
+        active = model_registry.active_version()
+        if active is not None and active != getattr(MODEL_BUNDLE, "version", None):
+            load_models(active)
+    except Exception as e:
+        print(f"[WARN] Could not load the active ML model version: {e}")
+
+def _serving_bundle(train=True):
+    """
+    The bundle to score with, as (bundle, None), or (None, fallback result
+    to report for every scan). Only the very first model is trained here,
+    on the caller's thread, and never with train=False; later retraining
+    runs in the background.
+    """
+    # Saved models first (cold start), or a version activated elsewhere
+    sync_active_version()
+
+    bundle = MODEL_BUNDLE
+    if bundle is not None:
+        return bundle, None
+    if not train:
+        # The background retrainer produces the first model (model_retraining.py)
+        return None, {"risk": "Unknown", "anomaly_score": 0.0, "is_anomaly": False, "details": "Model not trained"}
+
+    # Auto-train attempt; concurrent first callers wait for one training
+    with _first_model_lock:
+        if MODEL_BUNDLE is None:
+            try:
+                res = train_models()
+                if res.get('status') == 'error':
+                     # Fallback if training failed (e.g. no data)
+                     return None, {"risk": "Unknown", "anomaly_score": 0.0, "is_anomaly": False, "details": res['message']}
+            except Exception as e:
+                 return None, {"risk": "Error", "anomaly_score": 0.0, "is_anomaly": False, "details": str(e)}
 
     # Check again if model exists (training might have failed silently or insufficient data)
-    if MODEL_IF is None:
-        return {"risk": "Unknown", "anomaly_score": 0.0, "is_anomaly": False, "details": "Model not trained"}
+    bundle = MODEL_BUNDLE
+    if bundle is None:
+        return None, {"risk": "Unknown", "anomaly_score": 0.0, "is_anomaly": False, "details": "Model not trained"}
 
-    # Extract features in correct order
-    vector = get_feature_vector(scan_data)
-    X_new = np.array([vector])
-    
-    # Anomaly Score
-    score = MODEL_IF.decision_function(X_new)[0]
-    is_anomaly = MODEL_IF.predict(X_new)[0] == -1
-    
-    # Risk Level
-    # Pure ML Approach with Synthetic Baseline
-    cluster = MODEL_KM["model"].predict([[score]])[0]
-    risk_level = MODEL_KM["mapping"].get(cluster, "Unknown")
-    
+    return bundle, None
+
+def _feature_matrix(scans):
+    """
+    Feature vectors for scans, stacked into one matrix.
+    Returns (vectors, X, errors): X holds the rows that converted cleanly,
+    errors maps the index of every other scan to its error message.
+    """
+    vectors, errors = [], {}
+    for i, scan_data in enumerate(scans):
+        try:
+            vectors.append(get_feature_vector(scan_data))
+        except Exception as e:
+            vectors.append(None)
+            errors[i] = str(e)
+
+    rows = [v for v in vectors if v is not None]
+    try:
+        X = np.array(rows, dtype=float).reshape(len(rows), len(FEATURE_COLUMNS))
+    except (TypeError, ValueError):
+        # Some vector holds a non-numeric value: find it row by row
+        clean = []
+        for i, v in enumerate(vectors):
+            if v is None:
+                continue
+            try:
+                clean.append(np.array(v, dtype=float))
+            except (TypeError, ValueError) as e:
+                vectors[i] = None
+                errors[i] = str(e)
+        X = np.array(clean, dtype=float).reshape(len(clean), len(FEATURE_COLUMNS))
+
+    return vectors, X, errors
+
+def _risk_result(vector, score, is_anomaly, risk_level):
+    """
+    Builds the per-scan result returned by predict_risk from model outputs.
+    """
     # Details generation for UX
     details = []
     
@@ -287,3 +441,49 @@ def predict_risk(scan_data):
         "details": detail_str,
         "breakdown": analysis_breakdown
     }
+
+def predict_risk_batch(scans, train=True):
+    """
+    Predicts anomaly and risk for many scans in one vectorized pass
+    (one decision_function and one KMeans.predict over the whole feature matrix).
+    Returns a list of results in input order, each as predict_risk would return it.
+    With train=False, a missing model gives "Unknown" instead of training one.
+    """
+    # One bundle for the whole batch, however often it is swapped meanwhile
+    bundle, fallback = _serving_bundle(train)
+    if fallback is not None:
+        return [dict(fallback) for _ in scans]
+
+    vectors, X, errors = _feature_matrix(scans)
+
+    results = []
+    if len(X):
+        # Anomaly Score; IsolationForest.predict is exactly decision_function < 0
+        scores = bundle.isolation_forest.decision_function(X)
+        anomalies = scores < 0
+
+        # Risk Level
+        # Pure ML Approach with Synthetic Baseline
+        clusters = bundle.kmeans.predict(scores.reshape(-1, 1))
+        mapping = bundle.mapping
+
+        results = [
+            _risk_result(vector, score, is_anomaly, mapping.get(cluster, "Unknown"))
+            for vector, score, is_anomaly, cluster in zip(
+                (v for v in vectors if v is not None), scores, anomalies, clusters
+            )
+        ]
+
+    scored = iter(results)
+    return [
+        {"risk": "Error", "anomaly_score": 0.0, "is_anomaly": False, "details": errors[i]}
+        if i in errors else next(scored)
+        for i in range(len(scans))
+    ]
+
+def predict_risk(scan_data):
+    """
+    Predicts anomaly and risk for a single scan.
+    Returns dict with anomaly_score, risk_level.
+    """
+    return predict_risk_batch([scan_data])[0]
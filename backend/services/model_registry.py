@@ -0,0 +1,215 @@
+"""
+model_registry.py
+
+Versioned on-disk store for the trained ML models (see ml_service.py).
+
+Each training run is saved as its own version directory under ML_MODEL_DIR:
+
+    ml_models/
+        20261019T101500Z-3fa2c1/
+            models.pkl       pickled {"isolation_forest": ..., "kmeans": ...}
+            metadata.json    feature schema, training size, timestamp, checksum
+        active.json          {"version": ..., "history": [previously active versions]}
+
+A version is written to a temporary directory and renamed into place, and
+active.json is replaced atomically, so readers never see a half-written
+model. Versions whose feature schema differs from the running code's
+FEATURE_COLUMNS cannot be loaded or activated. The newest ML_MODEL_KEEP
+versions (and the active one) are kept; older ones are pruned after a save.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ML_MODEL_DIR = os.getenv("ML_MODEL_DIR", os.path.join(PROJECT_ROOT, "ml_models"))
+ML_MODEL_KEEP = int(os.getenv("ML_MODEL_KEEP", "10"))
+
+MODELS_FILE = "models.pkl"
+METADATA_FILE = "metadata.json"
+ACTIVE_FILE = "active.json"
+
+# Activation history kept for rollback
+HISTORY_LIMIT = 20
+
+
+def _version_dir(version: str) -> str:
+    # Version ids are generated here; refuse anything that could escape the registry
+    if not version or os.path.basename(version) != version or version.startswith("."):
+        raise LookupError(f"Model version not found: {version}")
+    return os.path.join(ML_MODEL_DIR, version)
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+# -------------------------------
+# Versions
+# -------------------------------
+
+def save_version(models: Dict, metadata: Dict, activate: bool = True) -> str:
+    """
+    Stores models as a new version (and makes it the active one).
+    Returns the version id.
+    """
+    os.makedirs(ML_MODEL_DIR, exist_ok=True)
+    created_at = datetime.now(timezone.utc)
+    version = f"{created_at:%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:6]}"
+
+    payload = pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL)
+    metadata = {
+        **metadata,
+        "version": version,
+        "created_at": created_at.isoformat(),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "size_bytes": len(payload),
+    }
+
+    tmp = os.path.join(ML_MODEL_DIR, f".tmp-{version}")
+    os.makedirs(tmp)
+    try:
+        with open(os.path.join(tmp, MODELS_FILE), "wb") as f:
+            f.write(payload)
+        _write_json(os.path.join(tmp, METADATA_FILE), metadata)
+        os.rename(tmp, _version_dir(version))
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if activate:
+        activate_version(version)
+    prune_versions()
+    return version
+
+
+def read_metadata(version: str) -> Dict:
+    path = os.path.join(_version_dir(version), METADATA_FILE)
+    if not os.path.exists(path):
+        raise LookupError(f"Model version not found: {version}")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions() -> List[Dict]:
+    """Metadata of every stored version, newest first."""
+    if not os.path.isdir(ML_MODEL_DIR):
+        return []
+    versions = []
+    for name in os.listdir(ML_MODEL_DIR):
+        if name.startswith(".") or not os.path.isdir(os.path.join(ML_MODEL_DIR, name)):
+            continue
+        try:
+            versions.append(read_metadata(name))
+        except (LookupError, ValueError, OSError):
+            continue  # not a version directory, or unreadable metadata
+    versions.sort(key=lambda m: m.get("created_at", ""), reverse=True)
+    return versions
+
+
+def load_version(version: str, feature_columns: List[str]) -> Tuple[Dict, Dict]:
+    """
+    Loads a version's models, checking its checksum and feature schema.
+    Returns (models, metadata).
+    """
+    metadata = read_metadata(version)
+    if metadata.get("feature_columns") != list(feature_columns):
+        raise ValueError(
+            f"Model version {version} was trained on a different feature schema "
+            f"({len(metadata.get('feature_columns') or [])} columns, expected {len(feature_columns)})"
+        )
+
+    with open(os.path.join(_version_dir(version), MODELS_FILE), "rb") as f:
+        payload = f.read()
+    if hashlib.sha256(payload).hexdigest() != metadata.get("sha256"):
+        raise ValueError(f"Model version {version} is corrupt (checksum mismatch)")
+
+    return pickle.loads(payload), metadata
+
+
+def prune_versions(keep: int = None):
+    """Removes all but the newest `keep` versions, never the active one."""
+    keep = ML_MODEL_KEEP if keep is None else keep
+    active = active_version()
+    for metadata in list_versions()[keep:]:
+        if metadata["version"] != active:
+            shutil.rmtree(_version_dir(metadata["version"]), ignore_errors=True)
+
+
+# -------------------------------
+# Active version
+# -------------------------------
+
+def _read_active() -> Dict:
+    path = os.path.join(ML_MODEL_DIR, ACTIVE_FILE)
+    if not os.path.exists(path):
+        return {"version": None, "history": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def active_version() -> Optional[str]:
+    return _read_active().get("version")
+
+
+def active_state() -> Dict:
+    """{"version", "history", "updated_at"} as stored in active.json."""
+    return _read_active()
+
+
+def activate_version(version: str) -> Dict:
+    """Makes a stored version the active one; the previous one can be rolled back to."""
+    metadata = read_metadata(version)
+    state = _read_active()
+    history = state.get("history", [])
+    if state.get("version") and state["version"] != version:
+        history = (history + [state["version"]])[-HISTORY_LIMIT:]
+
+    os.makedirs(ML_MODEL_DIR, exist_ok=True)
+    _write_json(os.path.join(ML_MODEL_DIR, ACTIVE_FILE), {
+        "version": version,
+        "history": history,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    })
+    return metadata
+
+
+def rollback_target() -> str:
+    """The version rollback_version() would re-activate."""
+    for version in reversed(_read_active().get("history", [])):
+        if os.path.exists(os.path.join(_version_dir(version), METADATA_FILE)):
+            return version
+    raise LookupError("No previous model version to roll back to")
+
+
+def rollback_version() -> Dict:
+    """
+    Re-activates the most recently replaced version that still exists
+    (skipping pruned ones). Returns its metadata.
+    """
+    version = rollback_target()
+    state = _read_active()
+    history = state.get("history", [])
+    history = history[:len(history) - 1 - history[::-1].index(version)]
+
+    _write_json(os.path.join(ML_MODEL_DIR, ACTIVE_FILE), {
+        "version": version,
+        "history": history,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    })
+    return read_metadata(version)
@@ -0,0 +1,73 @@
+"""
+model_retraining.py
+
+Background retraining of the ML models.
+
+A periodic check queues a training task (task_queue.py, so it runs in the
+process pool, never on a request thread) when the serving models are older
+than ML_RETRAIN_INTERVAL_SECONDS, when ML_RETRAIN_NEW_SCANS scans have been
+stored since they were trained, or when there is no model at all.
+The training task's single-flight lease makes concurrent checks from several
+uvicorn workers share one run. Its result is saved to the model registry and
+published with one bundle swap (ml_service.publish_bundle); other workers
+follow the newly active version.
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+from backend.services import ml_service
+from backend.services.periodic import PeriodicTask
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+ML_RETRAIN_ENABLED = os.getenv("ML_RETRAIN_ENABLED", "true").lower() in ("1", "true", "yes")
+ML_RETRAIN_INTERVAL_SECONDS = int(os.getenv("ML_RETRAIN_INTERVAL_SECONDS", str(24 * 3600)))
+ML_RETRAIN_NEW_SCANS = int(os.getenv("ML_RETRAIN_NEW_SCANS", "500"))
+ML_RETRAIN_CHECK_SECONDS = int(os.getenv("ML_RETRAIN_CHECK_SECONDS", "300"))
+
+
+def _new_scans_since(trained_at: datetime, limit: int) -> int:
+    # Imported on use (as is task_queue): the retraining policy itself needs no database
+    from backend.db.mongo import endpoint_scans_collection
+    return endpoint_scans_collection().count_documents({"scan_time": {"$gt": trained_at}}, limit=limit)
+
+
+def retrain_reason(now: datetime = None):
+    """Why the models should be retrained now, or None."""
+    now = now or datetime.now(timezone.utc)
+
+    # Pick up a version another worker trained or activated meanwhile
+    ml_service.sync_active_version(force=True)
+    bundle = ml_service.current_bundle()
+    trained_at = bundle.trained_at if bundle else None
+
+    if trained_at is None:
+        return "no model"
+    if now - trained_at >= timedelta(seconds=ML_RETRAIN_INTERVAL_SECONDS):
+        return "scheduled"
+
+    new_scans = _new_scans_since(trained_at, ML_RETRAIN_NEW_SCANS)
+    if new_scans >= ML_RETRAIN_NEW_SCANS:
+        return f"{new_scans}+ new scans"
+    return None
+
+
+def retrain_if_due():
+    """Queues a training task when retrain_reason() gives one."""
+    from backend.services.task_queue import submit_task
+
+    reason = retrain_reason()
+    if reason is None:
+        return None
+
+    task_id, joined = submit_task("training", {"reason": reason})
+    if not joined:
+        print(f"[INFO] Model retraining queued ({reason}): task {task_id}")
+    return task_id
+
+
+model_retrainer = PeriodicTask("model-retrain", retrain_if_due, ML_RETRAIN_CHECK_SECONDS)
@@ -0,0 +1,80 @@
+"""
+periodic.py
+
+Minimal fixed-cadence background worker used by the API process
+(job sweeper, posture counter verification, ...).
+
+Fleet-wide jobs run with lease=True: every uvicorn worker starts the task,
+but each run first takes a lease in task_leases (task_queue.acquire_lease),
+so only one worker runs it per interval.
+"""
+
+import os
+import socket
+import threading
+import uuid
+
+
+class PeriodicTask:
+    """
+    Runs `func` every `interval` seconds in a daemon thread until stopped.
+    The first run happens right after start(); failures are logged and retried next tick.
+
+    With lease=True a run is skipped while another worker holds the lease.
+    The lease is kept alive while `func` runs and held for one more interval
+    after it finishes.
+    """
+
+    def __init__(self, name: str, func, interval: float, lease: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.lease_key = f"periodic:{name}" if lease else None
+        self._holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=min(self.interval, 5))
+
+    def run_once(self) -> bool:
+        """Runs `func` unless another worker holds the lease. Returns whether it ran."""
+        if self.lease_key is None:
+            self.func()
+            return True
+
+        # Imported on use: task_queue runs its own lease heartbeats on PeriodicTask
+        from backend.services.task_queue import TASK_LEASE_SECONDS, acquire_lease, renew_lease
+
+        acquired, _ = acquire_lease(self.lease_key, self._holder)
+        if not acquired:
+            return False
+
+        heartbeat = PeriodicTask(
+            f"lease-{self.name}", lambda: renew_lease(self.lease_key, self._holder), TASK_LEASE_SECONDS / 3
+        )
+        heartbeat.start()
+        try:
+            self.func()
+        finally:
+            heartbeat.stop()
+            # No worker runs it again within the next interval
+            renew_lease(self.lease_key, self._holder, self.interval)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[WARN] {self.name} failed: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,334 @@
+"""
+posture_counters.py
+
+Incremental systemic posture maintained on each ingest.
+
+Running fleet totals (host count, per-issue affected hosts, CIS aggregates,
+ML risk counts) live in a single posture_counters document. Each host's
+current contribution is kept in posture_host_contributions; when a host's
+latest scan changes, the old contribution is subtracted and the new one added
+with one $inc. A posture snapshot is then a single document read.
+
+verify_posture_counters() recomputes everything from endpoint_scans, reports
+drift against the running totals and repairs them; it runs periodically,
+in one uvicorn worker at a time (lease in task_leases).
+Repairs go through the same conditional swap + $inc as ingest, so a scan
+ingested while the verifier runs is never overwritten.
+"""
+
+import os
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend.db.mongo import (
+    endpoint_scans_collection,
+    posture_counters_collection,
+    posture_host_contributions_collection,
+)
+from backend.services.ml_service import predict_risk_batch
+from backend.services.periodic import PeriodicTask
+from backend.services.systemic_runner import (
+    host_contribution,
+    new_ml_stats,
+    new_cis_stats,
+    cis_overview,
+)
+from analysis.issue_rules import active_rules
+from analysis.systemic_analysis import classify_issues, DEFAULT_THRESHOLD
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+COUNTERS_ID = "org"
+
+POSTURE_VERIFY_INTERVAL_SECONDS = int(os.getenv("POSTURE_VERIFY_INTERVAL_SECONDS", "3600"))
+
+# Float totals (CIS score sums) may differ by rounding only
+DRIFT_TOLERANCE = 1e-6
+
+
+def host_key(sdata: dict):
+    """Normalized hostname, matching the systemic engines; None if the scan has none."""
+    hostname = sdata.get("hostname") or (sdata.get("system") or {}).get("hostname")
+    if not hostname:
+        return None
+    return str(hostname).strip().lower()
+
+
+def _flatten(counters: dict) -> dict:
+    """{"issues": {...}, "cis": {...}, "ml": {...}} -> {"issues.x": n, ...} (plus total_hosts)."""
+    flat = {}
+    if "total_hosts" in counters:
+        flat["total_hosts"] = counters["total_hosts"]
+    for group in ("issues", "cis", "ml"):
+        for name, value in (counters.get(group) or {}).items():
+            flat[f"{group}.{name}"] = value
+    return flat
+
+
+def _contribution_delta(old: dict, new: dict) -> dict:
+    """Counter changes for replacing contribution old with new (either may be None)."""
+    old_flat = _flatten(old) if old is not None else {}
+    new_flat = _flatten(new) if new is not None else {}
+
+    delta = {}
+    for field in set(old_flat) | set(new_flat):
+        change = new_flat.get(field, 0) - old_flat.get(field, 0)
+        if change:
+            delta[field] = change
+    if old is None and new is not None:
+        delta["total_hosts"] = 1
+    elif old is not None and new is None:
+        delta["total_hosts"] = -1
+    return delta
+
+
+def _inc_counters(delta: dict):
+    if delta:
+        posture_counters_collection().update_one(
+            {"_id": COUNTERS_ID},
+            {"$inc": delta, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+
+def _swap_contribution(key: str, scan_time: datetime, contribution: dict) -> bool:
+    """
+    Makes contribution the host's counted one unless a newer scan is already
+    counted, and adds the difference to the totals.
+    Returns False if a newer scan is counted.
+    """
+    try:
+        # Swap in the new contribution and get the old one back atomically
+        previous = posture_host_contributions_collection().find_one_and_update(
+            {"_id": key, "$or": [{"scan_time": {"$lte": scan_time}}, {"scan_time": {"$exists": False}}]},
+            {"$set": {"scan_time": scan_time, "contribution": contribution}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        return False  # a newer scan for this host is already counted
+
+    _inc_counters(_contribution_delta(previous.get("contribution", {}) if previous else None, contribution))
+    return True
+
+
+# -------------------------------
+# Ingest path
+# -------------------------------
+
+def apply_scan(sdata: dict, scan_time: datetime) -> bool:
+    """
+    Folds a newly stored scan into the running totals.
+    Returns False if the scan has no hostname or is older than the host's counted scan.
+    """
+    key = host_key(sdata)
+    if not key:
+        return False
+
+    # Serving model only: the ingest path never trains (no model yet -> "Unknown",
+    # counted once the verifier re-scores the host)
+    try:
+        risk_res = predict_risk_batch([sdata], train=False)[0]
+    except Exception:
+        risk_res = {}
+    return _swap_contribution(key, scan_time, host_contribution(sdata, risk_res))
+
+
+# -------------------------------
+# Snapshot read
+# -------------------------------
+
+def posture_from_counters(threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    Builds the posture result from the running totals (one document read).
+    Findings are listed in the active issue rules' order.
+    """
+    doc = posture_counters_collection().find_one({"_id": COUNTERS_ID})
+    if not doc:
+        # Never built (fresh deployment): establish the baseline first
+        verify_posture_counters()
+        doc = posture_counters_collection().find_one({"_id": COUNTERS_ID}) or {}
+
+    total_hosts = doc.get("total_hosts", 0)
+    if not total_hosts:
+        raise ValueError("No scans available for analysis")
+
+    issues = doc.get("issues") or {}
+    posture_result = classify_issues(
+        {issue: issues[issue] for issue in active_rules().issue_order if issues.get(issue, 0) > 0},
+        total_hosts,
+        threshold
+    )
+
+    ml = doc.get("ml") or {}
+    posture_result["ml_risk_overview"] = {k: ml.get(k, 0) for k in new_ml_stats()}
+
+    cis = doc.get("cis") or {}
+    posture_result["cis_compliance_overview"] = cis_overview({k: cis.get(k, 0) for k in new_cis_stats()})
+
+    return posture_result
+
+
+# -------------------------------
+# Full recompute / drift check
+# -------------------------------
+
+def compute_fleet_counters():
+    """
+    Recomputes every host's contribution from the latest scan per host.
+    Returns (totals, {host: (scan_time, contribution)}).
+    """
+    totals = {"total_hosts": 0, "issues": {}, "cis": new_cis_stats(), "ml": new_ml_stats()}
+    latest = {}
+
+    for scan in endpoint_scans_collection().find().sort("scan_time", -1):
+        sdata = scan.get("scan_data", {})
+        key = host_key(sdata)
+        if key and key not in latest:
+            latest[key] = (scan.get("scan_time"), sdata)
+
+    # Score every host's latest scan in one batch, with the serving model only
+    # (training happens in the task pool; the first model comes from model_retrainer)
+    try:
+        risk_results = predict_risk_batch([sdata for _, sdata in latest.values()], train=False)
+    except Exception:
+        risk_results = [{}] * len(latest)
+
+    hosts = {}
+    for (key, (scan_time, sdata)), risk_res in zip(latest.items(), risk_results):
+        contribution = host_contribution(sdata, risk_res)
+        hosts[key] = (scan_time, contribution)
+
+        totals["total_hosts"] += 1
+        for issue, count in contribution["issues"].items():
+            totals["issues"][issue] = totals["issues"].get(issue, 0) + count
+        for group in ("cis", "ml"):
+            for name, value in contribution[group].items():
+                totals[group][name] += value
+
+    return totals, hosts
+
+
+def _insert_contributions(hosts: dict) -> list:
+    """
+    Inserts the contributions of hosts that had none ({host: (scan_time,
+    contribution)}), skipping hosts an ingest added meanwhile.
+    Returns the contributions that were inserted.
+    """
+    contributions = posture_host_contributions_collection()
+    keys, skipped = list(hosts), set()
+    for start in range(0, len(keys), 1000):
+        batch = keys[start:start + 1000]
+        try:
+            contributions.insert_many([
+                {"_id": key, "scan_time": hosts[key][0], "contribution": hosts[key][1]} for key in batch
+            ], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            skipped.update(batch[error["index"]] for error in errors)
+    return [contribution for key, (_, contribution) in hosts.items() if key not in skipped]
+
+
+def _reconcile_totals():
+    """
+    Applies any difference between the totals and the sum of the stored
+    contributions as one $inc (e.g. an ingest whose counter update failed).
+    Skipped if an ingest updated the totals meanwhile; the next run retries.
+    """
+    current = posture_counters_collection().find_one({"_id": COUNTERS_ID}) or {}
+
+    summed = {"total_hosts": 0}
+    for doc in posture_host_contributions_collection().find({}, {"contribution": 1}):
+        summed["total_hosts"] += 1
+        for field, value in _flatten(doc.get("contribution", {})).items():
+            summed[field] = summed.get(field, 0) + value
+
+    running = _flatten(current)
+    residual = {}
+    for field in set(running) | set(summed):
+        change = summed.get(field, 0) - running.get(field, 0)
+        if abs(change) > DRIFT_TOLERANCE:
+            residual[field] = change
+
+    if residual:
+        posture_counters_collection().update_one(
+            {"_id": COUNTERS_ID, "updated_at": current.get("updated_at")},
+            {"$inc": residual, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=not current,
+        )
+
+
+def verify_posture_counters() -> dict:
+    """
+    Full recompute: compares the running totals with a from-scratch count and
+    repairs what differs without overwriting concurrent ingests. Each
+    differing host contribution is swapped in only if no newer scan is
+    counted, with its exact difference $inc'd onto the totals (as apply_scan
+    does); hosts without a contribution are bulk-inserted (skipping any an
+    ingest added meanwhile) and contributions of hosts without scans are
+    removed only if unchanged since the read.
+
+    Returns:
+        {field: {"running": x, "actual": y}} for every drifted field.
+    """
+    totals, hosts = compute_fleet_counters()
+
+    current = posture_counters_collection().find_one({"_id": COUNTERS_ID}) or {}
+    running, actual = _flatten(current), _flatten(totals)
+
+    drift = {}
+    for field in set(running) | set(actual):
+        if abs(running.get(field, 0) - actual.get(field, 0)) > DRIFT_TOLERANCE:
+            drift[field] = {"running": running.get(field, 0), "actual": actual.get(field, 0)}
+
+    if current and drift:
+        print(f"[WARN] Posture counters drifted on {len(drift)} field(s); repairing")
+
+    contributions = posture_host_contributions_collection()
+    stored = {doc["_id"]: doc for doc in contributions.find()}
+
+    missing = {}
+    for key, (scan_time, contribution) in hosts.items():
+        doc = stored.get(key)
+        if doc is None:
+            missing[key] = (scan_time, contribution)
+        elif doc.get("scan_time") != scan_time or doc.get("contribution") != contribution:
+            _swap_contribution(key, scan_time, contribution)
+
+    # New hosts (e.g. the first build) in bulk, with one $inc for all of them
+    delta = {}
+    for contribution in _insert_contributions(missing):
+        for field, change in _contribution_delta(None, contribution).items():
+            delta[field] = delta.get(field, 0) + change
+    _inc_counters(delta)
+
+    for key, doc in stored.items():
+        if key in hosts:
+            continue
+        # Only if no scan for this host was counted since the read
+        removed = contributions.find_one_and_delete({"_id": key, "scan_time": doc.get("scan_time")})
+        if removed:
+            _inc_counters(_contribution_delta(removed.get("contribution", {}), None))
+
+    _reconcile_totals()
+
+    now = datetime.now(timezone.utc)
+    posture_counters_collection().update_one(
+        {"_id": COUNTERS_ID},
+        {"$set": {"verified_at": now, "last_drift": drift}},
+        upsert=True,
+    )
+
+    return drift
+
+
+posture_verifier = PeriodicTask(
+    "posture-verifier", verify_posture_counters, POSTURE_VERIFY_INTERVAL_SECONDS, lease=True
+)
@@ -0,0 +1,164 @@
+"""
+posture_rollups.py
+
+Pre-aggregated posture time series.
+
+Each stored snapshot is folded into one hourly and one daily bucket document
+in posture_rollups. A bucket holds, per issue, the sum and max affected-host
+count over its snapshots and the count in its latest snapshot, plus ML risk
+counts, host totals and the CIS average score. Trend queries read one small
+document per bucket instead of every snapshot (a year of daily buckets is
+365 documents).
+"""
+
+from datetime import datetime, timezone, timedelta
+
+from pymongo import UpdateOne
+
+from analysis.issue_rules import active_rules
+from backend.db.mongo import org_posture_snapshots_collection, posture_rollups_collection
+from backend.services.posture_snapshots import posture_state, snapshot_state, STATE_FIELDS
+
+
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# Range returned when the caller gives no start
+DEFAULT_WINDOWS = {
+    "hour": timedelta(days=7),
+    "day": timedelta(days=365),
+}
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_updates(state: dict, generated_at: datetime) -> list:
+    """One upsert per granularity folding a snapshot state into its buckets."""
+    inc = {"snapshots": 1, "total_hosts_sum": state["total_hosts"]}
+    max_fields = {}
+    last = {"last_generated_at": generated_at, "total_hosts_last": state["total_hosts"],
+            "last_issues": state["issues"]}
+
+    # Issues missing from a snapshot had 0 affected hosts; averages divide by `snapshots`
+    for issue, count in state["issues"].items():
+        inc[f"issues.{issue}.sum"] = count
+        max_fields[f"issues.{issue}.max"] = count
+
+    for name, value in state["ml"].items():
+        inc[f"ml.{name}"] = value
+
+    score = state["cis"].get("average_compliance_score")
+    if score is not None:
+        inc["cis_score_sum"] = score
+        inc["cis_samples"] = 1
+
+    updates = []
+    for granularity in GRANULARITIES:
+        start = bucket_start(generated_at, granularity)
+        update = {"$inc": inc, "$set": last, "$setOnInsert": {"granularity": granularity, "bucket_start": start}}
+        if max_fields:
+            update["$max"] = max_fields
+        updates.append(UpdateOne({"_id": f"{granularity}:{start.isoformat()}"}, update, upsert=True))
+    return updates
+
+
+def record_snapshot(posture_data: dict, generated_at: datetime):
+    """Folds a newly stored snapshot into its hourly and daily buckets."""
+    state = posture_state(posture_data)
+    posture_rollups_collection().bulk_write(_rollup_updates(state, generated_at), ordered=False)
+
+
+def rebuild_rollups() -> int:
+    """
+    Recomputes every bucket from the stored snapshots (backfill / repair).
+    Returns the number of snapshots folded in.
+    """
+    posture_rollups_collection().delete_many({})
+
+    count = 0
+    batch = []
+    snapshots = org_posture_snapshots_collection().find({}, STATE_FIELDS)
+    for snapshot in snapshots.sort("generated_at", 1):
+        if not snapshot.get("generated_at"):
+            continue
+        batch.extend(_rollup_updates(snapshot_state(snapshot), snapshot["generated_at"]))
+        count += 1
+        if len(batch) >= 1000:
+            posture_rollups_collection().bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        posture_rollups_collection().bulk_write(batch, ordered=False)
+    return count
+
+
+def _avg(total, n):
+    return round(total / n, 2) if n else None
+
+
+def posture_trends(issue: str = None, granularity: str = "day", start: datetime = None, end: datetime = None) -> dict:
+    """
+    Time series of bucket averages between start and end (default: the
+    last 7 days hourly, or the last 365 days daily). With `issue`, each point
+    also carries that issue's avg / max / last affected-host count.
+
+    `issue` is any issue of the current rule set, or one recorded in the
+    returned buckets (e.g. of a rule removed or renamed since).
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if issue and ("." in issue or issue.startswith("$")):  # not a field name
+        raise ValueError("Invalid issue name")
+
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_WINDOWS[granularity]
+
+    projection = {
+        "_id": 0, "bucket_start": 1, "snapshots": 1, "total_hosts_sum": 1,
+        "ml": 1, "cis_score_sum": 1, "cis_samples": 1,
+    }
+    if issue:
+        projection[f"issues.{issue}"] = 1
+        projection[f"last_issues.{issue}"] = 1
+
+    cursor = posture_rollups_collection().find(
+        {"granularity": granularity, "bucket_start": {"$gte": bucket_start(start, granularity), "$lte": end}},
+        projection
+    ).sort("bucket_start", 1)
+
+    points, recorded = [], False
+    for doc in cursor:
+        n = doc.get("snapshots", 0)
+        point = {
+            "bucket_start": doc["bucket_start"],
+            "snapshots": n,
+            "avg_total_hosts": _avg(doc.get("total_hosts_sum", 0), n),
+            "avg_ml_risk": {name: _avg(value, n) for name, value in (doc.get("ml") or {}).items()},
+            "avg_cis_score": _avg(doc.get("cis_score_sum", 0), doc.get("cis_samples", 0)),
+        }
+        if issue:
+            recorded = recorded or issue in (doc.get("issues") or {})
+            stats = (doc.get("issues") or {}).get(issue, {})
+            point["avg_affected_hosts"] = _avg(stats.get("sum", 0), n)
+            point["max_affected_hosts"] = stats.get("max", 0)
+            point["last_affected_hosts"] = (doc.get("last_issues") or {}).get(issue, 0)
+        points.append(point)
+
+    if issue and not recorded and issue not in active_rules().kinds:
+        raise ValueError(f"Unknown issue: {issue}")
+
+    return {
+        "issue": issue,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "points": points,
+    }
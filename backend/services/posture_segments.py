@@ -0,0 +1,75 @@
+"""
+posture_segments.py
+
+Segmented posture (per OS, site, tag, ...).
+
+The segment counts are computed in the same pass as the org-wide posture
+(see analyze_systemic_risk's segment_by) and stored with each snapshot, so
+these views only read the latest snapshot's `segments` field and classify
+each segment's counts against its own host total.
+"""
+
+from analysis.systemic_analysis import classify_issues
+from backend.db.mongo import org_posture_snapshots_collection
+from backend.services.posture_snapshots import snapshot_state, STATE_FIELDS
+
+
+def latest_segments():
+    """(latest snapshot with STATE_FIELDS and segments, its stored threshold)."""
+    snapshot = org_posture_snapshots_collection().find_one(
+        {}, {**STATE_FIELDS, "segments": 1}, sort=[("generated_at", -1)]
+    )
+    if not snapshot:
+        raise LookupError("No posture snapshots available yet")
+    if snapshot.get("segments") is None:
+        raise LookupError("Latest posture snapshot has no segments (run the python or columnar engine)")
+    return snapshot, snapshot_state(snapshot)["threshold"]
+
+
+def list_segments(key: str = None, threshold: float = None) -> dict:
+    """
+    Host total and systemic / isolated issue counts of every segment
+    (or only the segments of `key`) in the latest snapshot.
+    """
+    snapshot, stored_threshold = latest_segments()
+    threshold = stored_threshold if threshold is None else threshold
+
+    segments = []
+    for segment in snapshot["segments"]:
+        if key and segment["key"] != key:
+            continue
+        posture = classify_issues(segment["issues"], segment["total_hosts"], threshold)
+        segments.append({
+            "key": segment["key"],
+            "value": segment["value"],
+            "total_hosts": segment["total_hosts"],
+            "systemic_issue_count": posture["summary"]["systemic_issue_count"],
+            "isolated_issue_count": posture["summary"]["isolated_issue_count"],
+            "systemic_issues": [f["issue"] for f in posture["systemic_issues"]],
+        })
+
+    return {
+        "snapshot_id": str(snapshot["_id"]),
+        "generated_at": snapshot.get("generated_at"),
+        "threshold": threshold,
+        "keys": sorted({s["key"] for s in snapshot["segments"]}),
+        "segments": segments,
+    }
+
+
+def segment_posture(key: str, value: str, threshold: float = None) -> dict:
+    """Full posture (findings, percentages) of one segment of the latest snapshot."""
+    snapshot, stored_threshold = latest_segments()
+    threshold = stored_threshold if threshold is None else threshold
+
+    for segment in snapshot["segments"]:
+        if segment["key"] == key and segment["value"] == value:
+            return {
+                "snapshot_id": str(snapshot["_id"]),
+                "generated_at": snapshot.get("generated_at"),
+                "key": key,
+                "value": value,
+                "posture_data": classify_issues(segment["issues"], segment["total_hosts"], threshold),
+            }
+
+    raise LookupError(f"Segment not found: {key}={value}")
@@ -0,0 +1,273 @@
+"""
+posture_snapshots.py
+
+Storage of posture snapshots as keyframes plus compact deltas.
+
+Every POSTURE_KEYFRAME_INTERVAL-th snapshot is a keyframe holding the full
+posture_data plus its compact state (per-issue counts, host total, threshold,
+ML / CIS overviews). The snapshots in between only hold `delta`: the state
+fields that differ from their keyframe (base_id). Any snapshot's state is
+therefore its keyframe state plus one delta, i.e. at most two small reads.
+
+Snapshots written before this scheme (no `seq`) are read as keyframes.
+
+Per-segment counts (posture_data["segments"], see analyze_systemic_risk) are
+stored as-is in a top-level `segments` field of every snapshot, outside the
+keyframe / delta state.
+"""
+
+import os
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from backend.db.mongo import (
+    org_posture_snapshots_collection,
+    posture_snapshot_chain_collection,
+)
+from analysis.systemic_analysis import classify_issues
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+POSTURE_KEYFRAME_INTERVAL = int(os.getenv("POSTURE_KEYFRAME_INTERVAL", "24"))
+
+CHAIN_ID = "org"
+
+# Only these fields are needed to rebuild or diff a snapshot
+STATE_FIELDS = {"seq": 1, "keyframe": 1, "base_id": 1, "state": 1, "delta": 1, "generated_at": 1}
+
+
+# -------------------------------
+# Compact posture state
+# -------------------------------
+
+def posture_state(posture_data: dict) -> dict:
+    """
+    The compact state posture_data is derived from.
+    `issues` keeps finding order (systemic first, then isolated).
+    """
+    summary = posture_data.get("summary", {})
+    findings = posture_data.get("systemic_issues", []) + posture_data.get("isolated_issues", [])
+    return {
+        "total_hosts": summary.get("total_hosts_analyzed", 0),
+        "threshold": summary.get("threshold_used"),
+        "issues": {f["issue"]: f["affected_hosts"] for f in findings},
+        "ml": posture_data.get("ml_risk_overview", {}),
+        "cis": posture_data.get("cis_compliance_overview", {}),
+    }
+
+
+def posture_from_state(state: dict) -> dict:
+    """Rebuilds posture_data from a compact state."""
+    posture_data = classify_issues(state["issues"], state["total_hosts"], state["threshold"])
+    posture_data["ml_risk_overview"] = state["ml"]
+    posture_data["cis_compliance_overview"] = state["cis"]
+    return posture_data
+
+
+def _flatten(state: dict) -> dict:
+    flat = {"total_hosts": state["total_hosts"], "threshold": state["threshold"],
+            "order": list(state["issues"])}
+    for group in ("issues", "ml", "cis"):
+        for name, value in state[group].items():
+            flat[(group, name)] = value
+    return flat
+
+
+def _unflatten(flat: dict) -> dict:
+    state = {"total_hosts": flat["total_hosts"], "threshold": flat["threshold"],
+             "issues": {}, "ml": {}, "cis": {}}
+    for issue in flat["order"]:
+        state["issues"][issue] = flat[("issues", issue)]
+    for key, value in flat.items():
+        if isinstance(key, tuple) and key[0] != "issues":
+            state[key[0]][key[1]] = value
+    return state
+
+
+def state_delta(old: dict, new: dict) -> dict:
+    """
+    Fields of new that differ from old, nested like the state
+    (a removed issue or overview field is recorded as None).
+    """
+    old_flat, new_flat = _flatten(old), _flatten(new)
+    delta = {}
+    for key in set(old_flat) | set(new_flat):
+        value = new_flat.get(key)
+        if key in new_flat and key in old_flat and old_flat[key] == value:
+            continue
+        if isinstance(key, tuple):
+            delta.setdefault(key[0], {})[key[1]] = value
+        else:
+            delta[key] = value
+    return delta
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    flat = _flatten(state)
+    for key, value in delta.items():
+        if key in ("issues", "ml", "cis"):
+            for name, v in value.items():
+                if v is None:
+                    flat.pop((key, name), None)
+                else:
+                    flat[(key, name)] = v
+        else:
+            flat[key] = value
+    return _unflatten(flat)
+
+
+# -------------------------------
+# Write path
+# -------------------------------
+
+def _keyframe_stored(chain: dict) -> bool:
+    return org_posture_snapshots_collection().find_one({"_id": chain["keyframe_id"]}, {"_id": 1}) is not None
+
+
+def store_snapshot(posture_data: dict, generated_at: datetime = None) -> str:
+    """
+    Appends a snapshot: a keyframe every POSTURE_KEYFRAME_INTERVAL snapshots,
+    otherwise a delta against the current keyframe.
+    Returns the snapshot id.
+
+    The chain is advanced first (reserving the snapshot's seq) and the
+    snapshot inserted after, so a snapshot is never visible to readers
+    before it is final. If the current keyframe is missing (its writer died
+    in between, or has not inserted it yet), a new keyframe is written.
+    """
+    generated_at = generated_at or datetime.now(timezone.utc)
+    state = posture_state(posture_data)
+    segments = posture_data.get("segments")
+    posture_data = {k: v for k, v in posture_data.items() if k != "segments"}
+    chains = posture_snapshot_chain_collection()
+
+    while True:
+        chain = chains.find_one({"_id": CHAIN_ID})
+        seq = chain["seq"] + 1 if chain else 1
+        keyframe = (
+            chain is None
+            or seq - chain["keyframe_seq"] >= POSTURE_KEYFRAME_INTERVAL
+            or not _keyframe_stored(chain)
+        )
+
+        snapshot_id = ObjectId()
+        if keyframe:
+            new_chain = {"seq": seq, "keyframe_seq": seq, "keyframe_id": snapshot_id, "keyframe_state": state}
+        else:
+            new_chain = {"seq": seq}
+
+        # Reserve seq only if nobody else did meanwhile; otherwise retry on top of the winner's
+        try:
+            if chain is None:
+                chains.insert_one({"_id": CHAIN_ID, **new_chain})
+            elif not chains.update_one({"_id": CHAIN_ID, "seq": chain["seq"]}, {"$set": new_chain}).matched_count:
+                continue
+        except DuplicateKeyError:
+            continue
+        break
+
+    snapshot = {"_id": snapshot_id, "generated_at": generated_at, "seq": seq, "keyframe": keyframe}
+    if segments is not None:
+        snapshot["segments"] = segments
+    if keyframe:
+        snapshot.update(base_id=snapshot_id, posture_data=posture_data, state=state)
+    else:
+        snapshot.update(base_id=chain["keyframe_id"], delta=state_delta(chain["keyframe_state"], state))
+    org_posture_snapshots_collection().insert_one(snapshot)
+    return str(snapshot_id)
+
+
+# -------------------------------
+# Read path
+# -------------------------------
+
+def snapshot_state(snapshot: dict) -> dict:
+    """
+    Compact state of a snapshot (fetched with at least STATE_FIELDS):
+    its keyframe state with its delta applied.
+    """
+    if "seq" not in snapshot:
+        # Legacy full snapshot
+        full = snapshot if "posture_data" in snapshot else \
+            org_posture_snapshots_collection().find_one({"_id": snapshot["_id"]}, {"posture_data": 1})
+        return posture_state(full.get("posture_data") or {})
+
+    if snapshot.get("keyframe"):
+        return snapshot["state"]
+
+    base = org_posture_snapshots_collection().find_one({"_id": snapshot["base_id"]}, {"state": 1})
+    if not base:
+        raise ValueError("Posture snapshot keyframe missing")
+
+    return apply_delta(base["state"], snapshot.get("delta", {}))
+
+
+def load_posture_data(snapshot: dict):
+    """Full posture_data of a snapshot document (keyframe, delta or legacy)."""
+    if snapshot.get("posture_data"):
+        posture_data = snapshot["posture_data"]
+    elif "seq" not in snapshot and "_id" in snapshot:
+        snapshot = org_posture_snapshots_collection().find_one({"_id": snapshot["_id"]})
+        return (snapshot or {}).get("posture_data")
+    else:
+        posture_data = posture_from_state(snapshot_state(snapshot))
+
+    if snapshot.get("segments") is not None:
+        posture_data = {**posture_data, "segments": snapshot["segments"]}
+    return posture_data
+
+
+def find_snapshot(snapshot_id: str, projection: dict = None):
+    if not ObjectId.is_valid(snapshot_id):
+        raise ValueError("Invalid posture_snapshot_id")
+    return org_posture_snapshots_collection().find_one({"_id": ObjectId(snapshot_id)}, projection)
+
+
+def _change(old, new) -> dict:
+    entry = {"from": old, "to": new}
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        entry["change"] = round(new - old, 2)
+    return entry
+
+
+def diff_snapshots(from_id: str, to_id: str) -> dict:
+    """
+    What changed between two snapshots, computed from compact states
+    (keyframe state + delta) without loading full posture documents.
+    """
+    docs = {}
+    for snapshot_id in (from_id, to_id):
+        doc = find_snapshot(snapshot_id, STATE_FIELDS)
+        if not doc:
+            raise LookupError(f"Posture snapshot not found: {snapshot_id}")
+        docs[snapshot_id] = doc
+
+    old, new = snapshot_state(docs[from_id]), snapshot_state(docs[to_id])
+
+    issues = []
+    for issue in list(new["issues"]) + [i for i in old["issues"] if i not in new["issues"]]:
+        before, after = old["issues"].get(issue, 0), new["issues"].get(issue, 0)
+        if before != after:
+            issues.append({"issue": issue, **_change(before, after)})
+
+    def changed(group):
+        return {
+            name: _change(old[group].get(name), new[group].get(name))
+            for name in list(new[group]) + [n for n in old[group] if n not in new[group]]
+            if old[group].get(name) != new[group].get(name)
+        }
+
+    return {
+        "from": {"snapshot_id": from_id, "generated_at": docs[from_id].get("generated_at")},
+        "to": {"snapshot_id": to_id, "generated_at": docs[to_id].get("generated_at")},
+        "total_hosts": _change(old["total_hosts"], new["total_hosts"]),
+        "threshold": _change(old["threshold"], new["threshold"]),
+        "issues": issues,
+        "ml_risk_overview": changed("ml"),
+        "cis_compliance_overview": changed("cis"),
+    }
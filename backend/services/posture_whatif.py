@@ -0,0 +1,78 @@
+"""
+posture_whatif.py
+
+Threshold what-if evaluation.
+
+Reclassifies systemic vs isolated issues for another policy threshold using
+the per-issue counts already stored with the latest snapshot (its compact
+state), so no scans are read and nothing is re-analyzed.
+"""
+
+from analysis.systemic_analysis import classify_issues
+from backend.db.mongo import org_posture_snapshots_collection
+from backend.services.posture_snapshots import snapshot_state, STATE_FIELDS
+
+
+def latest_snapshot_state():
+    """(snapshot document with STATE_FIELDS, compact state) of the latest snapshot."""
+    snapshot = org_posture_snapshots_collection().find_one({}, STATE_FIELDS, sort=[("generated_at", -1)])
+    if not snapshot:
+        raise LookupError("No posture snapshots available yet")
+    return snapshot, snapshot_state(snapshot)
+
+
+def _classification(posture: dict) -> dict:
+    return {
+        f["issue"]: f["classification"]
+        for f in posture["systemic_issues"] + posture["isolated_issues"]
+    }
+
+
+def evaluate_threshold(threshold: float) -> dict:
+    """
+    Posture of the latest snapshot reclassified at `threshold`, with the
+    issues whose classification differs from the stored one.
+    """
+    snapshot, state = latest_snapshot_state()
+
+    stored = _classification(classify_issues(state["issues"], state["total_hosts"], state["threshold"]))
+    posture = classify_issues(state["issues"], state["total_hosts"], threshold)
+
+    changed = [
+        {"issue": issue, "from": stored.get(issue), "to": classification}
+        for issue, classification in _classification(posture).items()
+        if stored.get(issue) != classification
+    ]
+
+    return {
+        "snapshot_id": str(snapshot["_id"]),
+        "generated_at": snapshot.get("generated_at"),
+        "stored_threshold": state["threshold"],
+        "posture_data": posture,
+        "changed_classifications": changed,
+    }
+
+
+def sweep_thresholds(thresholds) -> dict:
+    """
+    Systemic / isolated split of the latest snapshot at each threshold.
+    """
+    snapshot, state = latest_snapshot_state()
+
+    results = []
+    for threshold in sorted(set(thresholds)):
+        posture = classify_issues(state["issues"], state["total_hosts"], threshold)
+        results.append({
+            "threshold": threshold,
+            "systemic_issue_count": posture["summary"]["systemic_issue_count"],
+            "isolated_issue_count": posture["summary"]["isolated_issue_count"],
+            "systemic_issues": [f["issue"] for f in posture["systemic_issues"]],
+        })
+
+    return {
+        "snapshot_id": str(snapshot["_id"]),
+        "generated_at": snapshot.get("generated_at"),
+        "stored_threshold": state["threshold"],
+        "total_hosts": state["total_hosts"],
+        "results": results,
+    }
@@ -0,0 +1,180 @@
+"""
+systemic_pipeline.py
+
+MongoDB aggregation pipelines for the "mongo" systemic analysis engine.
+
+The newest-scan-per-host dedup and all issue / CIS counters from
+analysis/systemic_analysis.analyze_systemic_risk and the systemic runner
+are computed inside MongoDB; Python only receives the final counts.
+ML scoring still needs per-host features, so a second pipeline returns
+just the fields extract_features reads.
+
+Semantics mirror the Python engine (see test_systemic_engine_parity.py).
+"""
+
+from analysis.systemic_analysis import (
+    CIS_CONTROL_ISSUES,
+    CIS_LOW_COMPLIANCE_SCORE,
+    ISSUE_ORDER,
+)
+from backend.services.ml_features import ML_FIELDS
+
+
+# -------------------------------
+# Expression helpers
+# -------------------------------
+
+def _truthy(expr) -> dict:
+    """Python truthiness of a JSON value (None, False, 0, "", [], {} are falsy)."""
+    return {"$not": {"$in": [{"$ifNull": [expr, None]}, [None, False, 0, "", [], {}]]}}
+
+
+def _non_compliant(controls, extra_cond) -> dict:
+    """Number of non-compliant controls matching extra_cond (on $$c)."""
+    return {"$size": {"$filter": {
+        "input": {"$cond": [{"$isArray": controls}, controls, []]},
+        "as": "c",
+        "cond": {"$and": [{"$eq": ["$$c.status", "non-compliant"]}, extra_cond]},
+    }}}
+
+
+# hostname or system.hostname, normalized like _host_id (strip + lower); None if missing
+_HOSTNAME = {"$cond": [_truthy("$scan_data.hostname"), "$scan_data.hostname", "$scan_data.system.hostname"]}
+_HOST_KEY = {"$cond": [
+    _truthy(_HOSTNAME),
+    {"$toLower": {"$trim": {"input": {"$toString": _HOSTNAME}}}},
+    None,
+]}
+
+
+def latest_scan_per_host_stages(fields) -> list:
+    """
+    Stages that keep the newest scan per normalized hostname.
+    Output documents: {_id: host, scan_time, scan: {<fields>}}.
+    """
+    projection = {"_id": 0, "scan_time": 1, "host": _HOST_KEY}
+    projection.update({f"scan_data.{f}": 1 for f in fields})
+
+    return [
+        {"$sort": {"scan_time": -1}},
+        {"$project": projection},
+        {"$match": {"host": {"$ne": None}}},
+        {"$group": {
+            "_id": "$host",
+            "scan_time": {"$first": "$scan_time"},
+            "scan": {"$first": "$scan_data"},
+        }},
+    ]
+
+
+# -------------------------------
+# Systemic counters
+# -------------------------------
+
+SYSTEMIC_FIELDS = [
+    "security_controls.firewall_status",
+    "security_controls.antivirus_effective_status",
+    "privilege_posture.user_is_admin",
+    "privilege_posture.uac_enabled",
+    "exposure_posture.rdp_enabled",
+    "exposure_posture.smbv1_enabled",
+    "exposure_posture.winrm_enabled",
+    "exposure_posture.risky_listening_ports",
+    "cis_compliance.compliance_score.weighted_score",
+    "cis_compliance.controls.control_id",
+    "cis_compliance.controls.status",
+    "cis_compliance.controls.severity_weight",
+]
+
+_CONTROLS = "$scan.cis_compliance.controls"
+_WEIGHTED_SCORE = {"$ifNull": ["$scan.cis_compliance.compliance_score.weighted_score", 0]}
+_CRITICAL_FAILURES = _non_compliant(_CONTROLS, {"$eq": ["$$c.severity_weight", 3]})
+
+# issue -> per-host condition
+_ISSUE_CONDITIONS = {
+    "firewall_disabled": {"$eq": ["$scan.security_controls.firewall_status", False]},
+    "antivirus_not_confirmed": {"$in": [
+        {"$ifNull": ["$scan.security_controls.antivirus_effective_status", None]},
+        ["disabled", "unknown"],
+    ]},
+    "admin_user": {"$eq": ["$scan.privilege_posture.user_is_admin", True]},
+    "uac_disabled": {"$eq": ["$scan.privilege_posture.uac_enabled", False]},
+    "rdp_enabled": {"$eq": ["$scan.exposure_posture.rdp_enabled", True]},
+    "smbv1_enabled": {"$eq": ["$scan.exposure_posture.smbv1_enabled", True]},
+    "winrm_enabled": {"$eq": ["$scan.exposure_posture.winrm_enabled", True]},
+    "risky_ports_exposed": _truthy("$scan.exposure_posture.risky_listening_ports"),
+    "cis_low_compliance": {"$lt": [_WEIGHTED_SCORE, CIS_LOW_COMPLIANCE_SCORE]},
+    "cis_critical_failures": {"$gt": [_CRITICAL_FAILURES, 0]},
+}
+
+# issue -> per-host affected count
+_ISSUE_COUNTS = {issue: {"$cond": [cond, 1, 0]} for issue, cond in _ISSUE_CONDITIONS.items()}
+# Specific CIS controls count every matching non-compliant entry, like the Python loop
+for _cid, _issue in CIS_CONTROL_ISSUES.items():
+    _ISSUE_COUNTS[_issue] = _non_compliant(_CONTROLS, {"$eq": ["$$c.control_id", _cid]})
+
+
+def systemic_counters_pipeline() -> list:
+    """
+    Pipeline returning one document:
+    {
+      issues: [{total_hosts, <issue>_count, <issue>_first, ...}],
+      cis: [{total_scans_with_cis, total_compliance_score, endpoints_with_critical_failures}]
+    }
+    <issue>_first is the newest host scan_time with that issue, used to reproduce
+    the Python engine's finding order.
+    """
+    per_host = {"_id": 0, "scan_time": 1}
+    per_host.update(_ISSUE_COUNTS)
+    per_host["cis_present"] = _truthy("$scan.cis_compliance")
+    per_host["cis_weighted_score"] = _WEIGHTED_SCORE
+    per_host["cis_critical"] = _CRITICAL_FAILURES
+
+    issue_group = {"_id": None, "total_hosts": {"$sum": 1}}
+    for issue in ISSUE_ORDER:
+        issue_group[f"{issue}_count"] = {"$sum": f"${issue}"}
+        issue_group[f"{issue}_first"] = {"$max": {"$cond": [{"$gt": [f"${issue}", 0]}, "$scan_time", None]}}
+
+    has_score = {"$gt": ["$cis_weighted_score", 0]}
+
+    return latest_scan_per_host_stages(SYSTEMIC_FIELDS) + [
+        {"$project": per_host},
+        {"$facet": {
+            "issues": [{"$group": issue_group}],
+            "cis": [
+                {"$match": {"cis_present": True}},
+                {"$group": {
+                    "_id": None,
+                    "total_scans_with_cis": {"$sum": {"$cond": [has_score, 1, 0]}},
+                    "total_compliance_score": {"$sum": {"$cond": [has_score, "$cis_weighted_score", 0]}},
+                    "endpoints_with_critical_failures": {"$sum": {"$cond": [{"$gt": ["$cis_critical", 0]}, 1, 0]}},
+                }},
+            ],
+        }},
+    ]
+
+
+def ordered_issue_counts(issues_doc: dict) -> dict:
+    """
+    Turns the "issues" facet document into {issue: count} for issues with count > 0,
+    ordered as the Python engine would insert them (newest affected host first,
+    then check order within a host).
+    """
+    present = [i for i in ISSUE_ORDER if issues_doc.get(f"{i}_count", 0) > 0]
+    # Stable sort: ties on first-seen time keep ISSUE_ORDER
+    present.sort(key=lambda i: issues_doc[f"{i}_first"], reverse=True)
+    return {i: issues_doc[f"{i}_count"] for i in present}
+
+
+# -------------------------------
+# ML features
+# -------------------------------
+
+def ml_feature_pipeline() -> list:
+    """
+    Pipeline yielding one small document per host ({scan: {...}}) with only the
+    fields ml_features.extract_features reads (ML_FIELDS).
+    """
+    return latest_scan_per_host_stages(ML_FIELDS) + [
+        {"$project": {"_id": 0, "scan": 1}},
+    ]
@@ -2,128 +2,305 @@
 systemic_runner.py
 
 Service layer to run systemic analysis using stored endpoint scans.
+
+Engines producing the same posture result:
+- "python": pulls every scan and dedups/counts in Python (default)
+- "columnar": same scan pull, issue counts via NumPy columns
+            (see analysis/systemic_columnar.py)
+- "mongo":  pushes the dedup and counters into a MongoDB aggregation
+            (see systemic_pipeline.py); Python receives only the counts
+- "incremental": reads running totals updated on each ingest
+            (see posture_counters.py); findings are in issue rule order
+Select with SYSTEMIC_ENGINE or the `engine` argument.
+
+The "python" and "columnar" engines also break the posture down by the
+SYSTEMIC_SEGMENT_BY keys (e.g. os, site, tag) in the same pass; endpoint
+metadata is attached to each scan under "endpoint" for that.
+
+Issue checks come from the declarative issue rules (analysis/issue_rules.py).
+"columnar" and "mongo" implement the built-in rule set directly and refuse
+to run while a customized rule file is active.
 """
 
+import os
 from datetime import datetime, timezone
 
-from backend.db.mongo import (
-    endpoint_scans_collection,
-    org_posture_snapshots_collection
+from backend.db.mongo import endpoint_scans_collection, endpoints_collection
+
+from analysis.systemic_analysis import (
+    analyze_systemic_risk,
+    classify_issues,
+    host_issue_counts,
+    DEFAULT_THRESHOLD,
 )
+from analysis.systemic_columnar import analyze_systemic_risk_columnar
+from analysis.issue_rules import active_rules, is_builtin
 
-from analysis.systemic_analysis import analyze_systemic_risk
 
+from backend.services.ml_service import predict_risk_batch
+from backend.services.posture_snapshots import store_snapshot
+from backend.services.posture_rollups import record_snapshot
+from backend.services.systemic_pipeline import (
+    systemic_counters_pipeline,
+    ml_feature_pipeline,
+    ordered_issue_counts,
+)
 
-from backend.services.ml_service import predict_risk
+SYSTEMIC_ENGINE = os.getenv("SYSTEMIC_ENGINE", "python")
 
-def run_and_store_systemic_analysis():
-    """
-    Fetches all endpoint scans (deduplicated by latest), runs systemic analysis,
-    stores the resulting posture snapshot with ML insights, and runs interpretation on it.
-    """
+# Group-by keys for segmented posture (empty to disable)
+SYSTEMIC_SEGMENT_BY = [k.strip() for k in os.getenv("SYSTEMIC_SEGMENT_BY", "os,site,tag").split(",") if k.strip()]
 
-    # Fetch all scans sorted by time descending to get latest first
-    scans_cursor = endpoint_scans_collection().find().sort("scan_time", -1)
-    
-    unique_scans_map = {}
-    ml_stats = {
+
+def new_ml_stats():
+    return {
         "high_risk_count": 0,
         "medium_risk_count": 0,
         "low_risk_count": 0,
         "anomalies_detected": 0
     }
-    
-    cis_stats = {
+
+
+def add_ml_risk(ml_stats, risk_res):
+    """Adds one host's ML result (from predict_risk_batch) to ml_stats."""
+    r_level = risk_res.get("risk", "Unknown")
+    is_anomaly = risk_res.get("is_anomaly", False)
+
+    if r_level == "High":
+        ml_stats["high_risk_count"] += 1
+    elif r_level == "Medium":
+        ml_stats["medium_risk_count"] += 1
+    elif r_level == "Low":
+        ml_stats["low_risk_count"] += 1
+
+    if is_anomaly:
+        ml_stats["anomalies_detected"] += 1
+
+
+def ml_risk_stats(scans) -> dict:
+    """Scores the latest scan of every host in one batch and returns the ML counters."""
+    ml_stats = new_ml_stats()
+    try:
+        results = predict_risk_batch(scans)
+    except Exception:
+        return ml_stats  # Don't fail systemic analysis if ML fails
+    for risk_res in results:
+        add_ml_risk(ml_stats, risk_res)
+    return ml_stats
+
+
+def new_cis_stats():
+    return {
         "total_scans_with_cis": 0,
         "total_compliance_score": 0,
         "endpoints_with_critical_failures": 0
     }
-    
+
+
+def add_cis_stats(cis_stats, sdata):
+    """Adds one host's latest scan to the CIS aggregates."""
+    cis_data = sdata.get("cis_compliance", {})
+    if cis_data:
+        cis_score = cis_data.get("compliance_score", {})
+        weighted_score = cis_score.get("weighted_score", 0)
+
+        if weighted_score > 0:
+            cis_stats["total_scans_with_cis"] += 1
+            cis_stats["total_compliance_score"] += weighted_score
+
+        # Check for critical failures
+        cis_controls = cis_data.get("controls", [])
+        critical_failures = sum(
+            1 for c in cis_controls
+            if c.get("status") == "non-compliant" and c.get("severity_weight") == 3
+        )
+        if critical_failures > 0:
+            cis_stats["endpoints_with_critical_failures"] += 1
+
+
+def host_contribution(sdata, risk_res=None) -> dict:
+    """
+    One host's contribution to every fleet-level counter
+    (issue counts, CIS aggregates, ML risk counts).
+    Pass risk_res when the host was already scored in a batch.
+    """
+    if risk_res is None:
+        ml_stats = ml_risk_stats([sdata])
+    else:
+        ml_stats = new_ml_stats()
+        add_ml_risk(ml_stats, risk_res)
+
+    cis_stats = new_cis_stats()
+    add_cis_stats(cis_stats, sdata)
+
+    return {
+        "issues": host_issue_counts(sdata),
+        "cis": cis_stats,
+        "ml": ml_stats
+    }
+
+
+def cis_overview(cis_stats):
+    cis_overview = {}
+    if cis_stats["total_scans_with_cis"] > 0:
+        avg_score = cis_stats["total_compliance_score"] / cis_stats["total_scans_with_cis"]
+        cis_overview = {
+            "average_compliance_score": round(avg_score, 2),
+            "endpoints_with_critical_failures": cis_stats["endpoints_with_critical_failures"],
+            "endpoints_analyzed": cis_stats["total_scans_with_cis"]
+        }
+    return cis_overview
+
+
+def endpoint_metadata() -> dict:
+    """Endpoint documents keyed by both agent endpoint_id and _id (legacy scans reference _id)."""
+    metadata = {}
+    for endpoint in endpoints_collection().find({}, {"last_seen": 0}):
+        metadata[endpoint["_id"]] = endpoint
+        if endpoint.get("endpoint_id"):
+            metadata[endpoint["endpoint_id"]] = endpoint
+    return metadata
+
+
+def compute_posture_python(threshold: float = DEFAULT_THRESHOLD, analyze=analyze_systemic_risk) -> dict:
+    """
+    Python engine: fetches all endpoint scans (deduplicated by latest per hostname)
+    and computes the posture with ML and CIS overviews.
+    """
+
+    segment_by = SYSTEMIC_SEGMENT_BY
+    metadata = endpoint_metadata() if segment_by else {}
+
+    # Fetch all scans sorted by time descending to get latest first
+    scans_cursor = endpoint_scans_collection().find().sort("scan_time", -1)
+
+    unique_scans_map = {}
+
+    cis_stats = new_cis_stats()
+
     scans_for_analysis = []
 
     for scan in scans_cursor:
         sdata = scan.get("scan_data", {})
         # Hostname determination logic matching systemic_analysis.py
         hostname = sdata.get("hostname") or sdata.get("system", {}).get("hostname")
-        
+
         if not hostname:
             continue
-            
+
         hostname = str(hostname).strip().lower()
 
         if hostname not in unique_scans_map:
+            if segment_by:
+                sdata = {**sdata, "endpoint": metadata.get(scan.get("endpoint_id"), {})}
             unique_scans_map[hostname] = sdata
             scans_for_analysis.append(sdata)
-            
-            # ML Risk Calculation
-            try:
-                risk_res = predict_risk(sdata)
-                r_level = risk_res.get("risk", "Unknown")
-                is_anomaly = risk_res.get("is_anomaly", False)
-                
-                if r_level == "High":
-                    ml_stats["high_risk_count"] += 1
-                elif r_level == "Medium":
-                    ml_stats["medium_risk_count"] += 1
-                elif r_level == "Low":
-                    ml_stats["low_risk_count"] += 1
-                    
-                if is_anomaly:
-                    ml_stats["anomalies_detected"] += 1
-            except Exception:
-                pass # Continue if ML fails for one host
-            
+
             # CIS Compliance Aggregation
-            cis_data = sdata.get("cis_compliance", {})
-            if cis_data:
-                cis_score = cis_data.get("compliance_score", {})
-                weighted_score = cis_score.get("weighted_score", 0)
-                
-                if weighted_score > 0:
-                    cis_stats["total_scans_with_cis"] += 1
-                    cis_stats["total_compliance_score"] += weighted_score
-                
-                # Check for critical failures
-                cis_controls = cis_data.get("controls", [])
-                critical_failures = sum(
-                    1 for c in cis_controls 
-                    if c.get("status") == "non-compliant" and c.get("severity_weight") == 3
-                )
-                if critical_failures > 0:
-                    cis_stats["endpoints_with_critical_failures"] += 1
+            add_cis_stats(cis_stats, sdata)
 
     if not scans_for_analysis:
         raise ValueError("No scans available for analysis")
 
     # Run existing analysis logic
-    posture_result = analyze_systemic_risk(scans_for_analysis)
-    
-    # Inject ML Stats
-    posture_result["ml_risk_overview"] = ml_stats
-    
+    posture_result = analyze(scans_for_analysis, threshold, segment_by=segment_by)
+
+    # Inject ML Stats (one vectorized scoring pass over all hosts)
+    posture_result["ml_risk_overview"] = ml_risk_stats(scans_for_analysis)
+
     # Inject CIS Compliance Overview
-    cis_overview = {}
-    if cis_stats["total_scans_with_cis"] > 0:
-        avg_score = cis_stats["total_compliance_score"] / cis_stats["total_scans_with_cis"]
-        cis_overview = {
-            "average_compliance_score": round(avg_score, 2),
-            "endpoints_with_critical_failures": cis_stats["endpoints_with_critical_failures"],
-            "endpoints_analyzed": cis_stats["total_scans_with_cis"]
-        }
-    posture_result["cis_compliance_overview"] = cis_overview
+    posture_result["cis_compliance_overview"] = cis_overview(cis_stats)
 
-    # Store snapshot
-    snapshot = {
-        "generated_at": datetime.now(timezone.utc),
-        "posture_data": posture_result
-    }
-    result = org_posture_snapshots_collection().insert_one(snapshot)
-    snapshot_id = str(result.inserted_id)
+    return posture_result
+
+
+def require_builtin_rules(engine: str):
+    """The columnar and mongo engines hard-code the built-in issue rules."""
+    if not is_builtin(active_rules()):
+        raise ValueError(f"The {engine} engine only supports the built-in issue rules; use the python engine")
+
+
+def compute_posture_columnar(threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    Columnar engine: compute_posture_python with vectorized issue counting.
+    """
+    require_builtin_rules("columnar")
+    return compute_posture_python(threshold, analyze=analyze_systemic_risk_columnar)
+
+
+def compute_posture_mongo(threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    Mongo engine: same result as compute_posture_python, with the per-host dedup
+    and all counters computed by an aggregation pipeline.
+    """
+    require_builtin_rules("mongo")
+
+    counters = next(
+        endpoint_scans_collection().aggregate(systemic_counters_pipeline(), allowDiskUse=True),
+        {}
+    )
+
+    issues = (counters.get("issues") or [None])[0]
+    if not issues or not issues.get("total_hosts"):
+        raise ValueError("No scans available for analysis")
+
+    posture_result = classify_issues(ordered_issue_counts(issues), issues["total_hosts"], threshold)
+
+    # ML scores all hosts in one batch, on the projected feature fields only
+    ml_scans = [
+        doc.get("scan", {})
+        for doc in endpoint_scans_collection().aggregate(ml_feature_pipeline(), allowDiskUse=True)
+    ]
+    posture_result["ml_risk_overview"] = ml_risk_stats(ml_scans)
+
+    cis_stats = (counters.get("cis") or [None])[0] or new_cis_stats()
+    posture_result["cis_compliance_overview"] = cis_overview(cis_stats)
+
+    return posture_result
+
+
+def compute_posture_incremental(threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    Incremental engine: reads the running per-issue totals maintained at ingest
+    (see posture_counters.py) instead of touching endpoint_scans.
+    """
+    from backend.services.posture_counters import posture_from_counters
+    return posture_from_counters(threshold)
+
+
+ENGINES = {
+    "python": compute_posture_python,
+    "columnar": compute_posture_columnar,
+    "mongo": compute_posture_mongo,
+    "incremental": compute_posture_incremental,
+}
+
+
+def run_and_store_systemic_analysis(engine: str = None):
+    """
+    Runs systemic analysis with the selected engine, stores the resulting
+    posture snapshot with ML insights, and runs interpretation on it.
+    """
+    engine = engine or SYSTEMIC_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown systemic analysis engine: {engine}")
+
+    posture_result = ENGINES[engine]()
+
+    # Store snapshot (keyframe or delta, see posture_snapshots.py)
+    generated_at = datetime.now(timezone.utc)
+    snapshot_id = store_snapshot(posture_result, generated_at)
+
+    # Fold it into the hourly / daily trend buckets
+    try:
+        record_snapshot(posture_result, generated_at)
+    except Exception as e:
+        print(f"[WARN] Posture rollup update failed: {e}")
 
     # Run interpretation on the new snapshot so Dashboard shows it
     try:
         from backend.services.interpretation_runner import run_and_store_interpretation
-        run_and_store_interpretation(snapshot_id)
+        run_and_store_interpretation(snapshot_id, posture_result)
     except Exception:
         pass  # Don't fail systemic analysis if interpretation fails
 
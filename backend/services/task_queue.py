@@ -0,0 +1,305 @@
+"""
+task_queue.py
+
+Background execution of CPU-heavy work (systemic analysis, ML training).
+
+Tasks run in a process pool so pandas / sklearn / aggregation work never
+blocks the request threads. Each task has a document in analysis_tasks,
+written by the API on submit and by the worker process as it runs, so
+GET /api/tasks/{task_id} works from any uvicorn worker.
+
+Recorded per task: queue wait, runtime and peak memory (RSS high-water mark
+of the worker process; each worker process runs one task, so it is per task).
+
+Single flight: equivalent tasks (same kind and engine) hold a lease document
+in task_leases while queued or running. A request for an equivalent task
+joins the leaseholder and gets its task_id (and so the same snapshot id),
+across all uvicorn workers. The worker renews the lease while it runs; a
+lease left by a crashed process expires after TASK_LEASE_SECONDS.
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+from threading import Lock
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from backend.db.mongo import analysis_tasks_collection, task_leases_collection
+from backend.services.periodic import PeriodicTask
+
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+TASK_POOL_WORKERS = int(os.getenv("TASK_POOL_WORKERS", "2"))
+
+# Task documents are removed by a TTL index this long after submission
+TASK_RETENTION_SECONDS = int(os.getenv("TASK_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+TASK_KINDS = ("analysis", "training")
+
+# A running task renews its lease every third of this
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "300"))
+
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=TASK_POOL_WORKERS,
+                # spawn: no forked Mongo clients; one task per process keeps peak memory per task
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=1,
+            )
+        return _executor
+
+
+def shutdown_pool():
+    """Stops the pool on app shutdown; queued tasks are cancelled."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# -------------------------------
+# Single-flight leases
+# -------------------------------
+
+def single_flight_key(kind: str, params: dict) -> str:
+    """Tasks with the same key are equivalent and share one run."""
+    if kind == "analysis":
+        from backend.services.systemic_runner import SYSTEMIC_ENGINE
+        return f"analysis:{params.get('engine') or SYSTEMIC_ENGINE}"
+    return kind
+
+
+def acquire_lease(key: str, task_id: str, seconds: float = None):
+    """
+    Takes the lease for key (for `seconds`, default TASK_LEASE_SECONDS)
+    unless a live one exists.
+
+    Returns:
+        (acquired, task_id of the leaseholder)
+    """
+    seconds = TASK_LEASE_SECONDS if seconds is None else seconds
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            lease = task_leases_collection().find_one_and_update(
+                {"_id": key, "expires_at": {"$lte": now}},
+                {"$set": {"task_id": task_id, "acquired_at": now,
+                          "expires_at": now + timedelta(seconds=seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return True, lease["task_id"]
+        except DuplicateKeyError:
+            # Live lease held by another task: join it
+            lease = task_leases_collection().find_one({"_id": key, "expires_at": {"$gt": now}})
+            if lease:
+                return False, lease["task_id"]
+            # Released in between: try to take it again
+
+
+def renew_lease(key: str, task_id: str, seconds: float = None):
+    seconds = TASK_LEASE_SECONDS if seconds is None else seconds
+    task_leases_collection().update_one(
+        {"_id": key, "task_id": task_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=seconds)}},
+    )
+
+
+def release_lease(key: str, task_id: str):
+    task_leases_collection().update_one(
+        {"_id": key, "task_id": task_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc)}},
+    )
+
+
+# -------------------------------
+# Worker side
+# -------------------------------
+
+def _peak_memory_mb():
+    """RSS high-water mark of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_analysis(params: dict) -> dict:
+    from analysis.issue_rules import active_rules
+    from backend.services.systemic_runner import run_and_store_systemic_analysis
+    snapshot_id = run_and_store_systemic_analysis(params.get("engine"))
+    # One task per process, so these are this run's per-rule costs
+    return {"posture_snapshot_id": snapshot_id, "issue_rules": active_rules().stats()}
+
+
+def _run_training(params: dict) -> dict:
+    from backend.services.ml_service import train_models
+    result = train_models()
+    if result.get("status") == "error":
+        raise ValueError(result.get("message", "Training failed"))
+    if params.get("reason"):
+        result["reason"] = params["reason"]
+    return result
+
+
+_RUNNERS = {
+    "analysis": _run_analysis,
+    "training": _run_training,
+}
+
+
+def _execute(task_id: str, kind: str, params: dict, submitted_at: datetime, bundle):
+    """
+    Runs one task inside a pool process and records its outcome.
+
+    Args:
+        bundle: the API process's serving ModelBundle, so analysis scores with
+                the same models instead of loading or training its own.
+
+    Returns:
+        The serving ModelBundle after the task, for the API process to adopt.
+    """
+    from backend.services import ml_service
+
+    if bundle is not None:
+        ml_service.publish_bundle(bundle)
+
+    lease_key = single_flight_key(kind, params)
+    heartbeat = PeriodicTask(f"lease-{task_id}", lambda: renew_lease(lease_key, task_id), TASK_LEASE_SECONDS / 3)
+    heartbeat.start()
+
+    started_at = datetime.now(timezone.utc)
+    analysis_tasks_collection().update_one(
+        {"task_id": task_id},
+        {"$set": {
+            "status": "running",
+            "started_at": started_at,
+            "queue_wait_seconds": round((started_at - submitted_at).total_seconds(), 3),
+        }}
+    )
+
+    start = time.perf_counter()
+    update = {}
+    try:
+        update["result"] = _RUNNERS[kind](params)
+        update["status"] = "completed"
+    except Exception as e:
+        update["status"] = "failed"
+        update["error"] = str(e)
+
+    update["finished_at"] = datetime.now(timezone.utc)
+    update["runtime_seconds"] = round(time.perf_counter() - start, 3)
+    update["peak_memory_mb"] = _peak_memory_mb()
+
+    analysis_tasks_collection().update_one({"task_id": task_id}, {"$set": update})
+
+    heartbeat.stop()
+    release_lease(lease_key, task_id)
+
+    return ml_service.current_bundle()
+
+
+# -------------------------------
+# API side
+# -------------------------------
+
+def _on_done(task_id: str, kind: str, lease_key: str):
+    def callback(future):
+        from backend.services import ml_service
+
+        if future.cancelled():
+            error = "Cancelled on shutdown"
+        else:
+            error = future.exception()
+            if error is None:
+                bundle = future.result()
+                # Adopt newly trained models (or the ones an analysis trained on first use):
+                # one reference swap, serving never pauses
+                if bundle is not None and (kind == "training" or ml_service.current_bundle() is None):
+                    ml_service.publish_bundle(bundle)
+                return
+
+        # The worker never recorded an outcome (process crashed or task cancelled)
+        try:
+            release_lease(lease_key, task_id)
+            analysis_tasks_collection().update_one(
+                {"task_id": task_id, "status": {"$in": ["queued", "running"]}},
+                {"$set": {
+                    "status": "failed",
+                    "error": str(error),
+                    "finished_at": datetime.now(timezone.utc),
+                }}
+            )
+        except Exception:
+            pass
+
+    return callback
+
+
+def submit_task(kind: str, params: dict = None):
+    """
+    Queues a task, or joins an equivalent one already queued or running.
+
+    Returns:
+        (task_id, joined)
+    """
+    if kind not in TASK_KINDS:
+        raise ValueError(f"Unknown task kind: {kind}")
+
+    from backend.services import ml_service
+
+    params = params or {}
+    lease_key = single_flight_key(kind, params)
+
+    acquired, task_id = acquire_lease(lease_key, str(uuid.uuid4()))
+    if not acquired:
+        return task_id, True
+
+    submitted_at = datetime.now(timezone.utc)
+
+    try:
+        analysis_tasks_collection().insert_one({
+            "task_id": task_id,
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "submitted_at": submitted_at,
+            "expires_at": submitted_at + timedelta(seconds=TASK_RETENTION_SECONDS),
+        })
+
+        bundle = ml_service.current_bundle() if kind == "analysis" else None
+
+        future = _pool().submit(_execute, task_id, kind, params, submitted_at, bundle)
+    except Exception:
+        release_lease(lease_key, task_id)
+        raise
+
+    future.add_done_callback(_on_done(task_id, kind, lease_key))
+
+    return task_id, False
+
+
+def get_task(task_id: str):
+    """Task document without Mongo internals, or None."""
+    return analysis_tasks_collection().find_one({"task_id": task_id}, {"_id": 0, "expires_at": 0})
@@ -0,0 +1,75 @@
+"""
+Benchmark: dict engine (analyze_systemic_risk) vs columnar engine
+(analyze_systemic_risk_columnar) on generated fleets.
+
+Columnar time is split into flattening (FleetColumns) and counting
+(issue counts + classification), since what-if runs flatten once and
+re-count per threshold. The what-if columns time a sweep over --thresholds
+thresholds: the dict engine re-runs per threshold, the columnar engine
+flattens once.
+
+Usage:
+    python benchmark_systemic_engines.py [--sizes 1000 10000 100000] [--repeat 3] [--thresholds 20]
+"""
+
+import argparse
+import gc
+import time
+
+from analysis.systemic_analysis import analyze_systemic_risk
+from analysis.systemic_columnar import FleetColumns
+from analysis.synthetic_fleet import generate_fleet
+
+
+def best_of(repeat, func):
+    """(best wall time in seconds, last result)"""
+    best, result = float("inf"), None
+    gc.disable()  # like timeit: keep collector pauses out of the comparison
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--thresholds", type=int, default=20)
+    args = parser.parse_args()
+
+    sweep = [i / args.thresholds for i in range(1, args.thresholds + 1)]
+
+    print(
+        f"{'hosts':>8} {'dict (s)':>10} {'flatten (s)':>12} {'count (s)':>10} {'columnar (s)':>13} {'speedup':>8}"
+        f" {'what-if dict (s)':>17} {'what-if col (s)':>16} {'speedup':>8}"
+    )
+
+    for size in args.sizes:
+        scans = generate_fleet(size, size, 1)
+
+        dict_time, expected = best_of(args.repeat, lambda: analyze_systemic_risk(scans))
+        flatten_time, columns = best_of(args.repeat, lambda: FleetColumns.from_scans(scans))
+        count_time, actual = best_of(args.repeat, columns.analyze)
+
+        if actual != expected:
+            raise SystemExit(f"Engines disagree at {size} hosts")
+
+        columnar_time = flatten_time + count_time
+        whatif_dict = dict_time * len(sweep)
+        whatif_count, _ = best_of(args.repeat, lambda: [columns.analyze(t) for t in sweep])
+        whatif_columnar = flatten_time + whatif_count
+
+        print(
+            f"{size:>8} {dict_time:>10.3f} {flatten_time:>12.3f} {count_time:>10.4f} "
+            f"{columnar_time:>13.3f} {dict_time / columnar_time:>7.2f}x"
+            f" {whatif_dict:>17.3f} {whatif_columnar:>16.3f} {whatif_dict / whatif_columnar:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
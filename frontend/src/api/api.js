@@ -12,11 +12,26 @@ export async function getScans(endpointId) {
   return res.json();
 }
 
-export async function triggerAnalysis() {
-  const res = await fetch(`${BASE_URL}/api/analyze`, { method: "POST" });
+export async function getTask(taskId) {
+  const res = await fetch(`${BASE_URL}/api/tasks/${taskId}`);
   return res.json();
 }
 
+// Analysis runs as a background task: queue it, then poll until it finishes
+export async function triggerAnalysis(pollMs = 1000) {
+  const res = await fetch(`${BASE_URL}/api/analyze`, { method: "POST" });
+  const queued = await res.json();
+  if (!queued.task_id) return queued;
+
+  for (;;) {
+    const task = await getTask(queued.task_id);
+    if (task.status === "completed" || task.status === "failed" || !task.status) {
+      return task;
+    }
+    await new Promise((resolve) => setTimeout(resolve, pollMs));
+  }
+}
+
 export async function getLatestPosture() {
   const res = await fetch(`${BASE_URL}/api/posture/latest`);
   return res.json();
@@ -41,9 +56,11 @@ export async function scheduleScanAll() {
   return res.json();
 }
 
-export async function scheduleScanEndpoint(endpointId) {
+export async function scheduleScanEndpoint(endpointId, sections) {
   const res = await fetch(`${BASE_URL}/api/jobs/scan/${endpointId}`, {
     method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(sections ? { sections } : {}),
   });
   return res.json();
 }
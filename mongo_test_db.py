@@ -0,0 +1,52 @@
+"""
+Shared setup for the tests that need MongoDB (MONGO_URI, default
+mongodb://localhost:27017).
+
+Import it before anything imports backend.db.mongo:
+
+    from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+It points DB_NAME at a scratch database (TEST_DB_NAME, default
+org_security_posture_test) so tests never touch the real one, then connects.
+mongo is the connected backend.db.mongo module, or None when no server is
+reachable. MongoTestCase classes are skipped in that case and drop the
+scratch database after they ran.
+"""
+
+import os
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+TEST_DB_NAME = os.getenv("TEST_DB_NAME", "org_security_posture_test")
+
+# Never touch the real database
+_imported = sys.modules.get("backend.db.mongo")
+if _imported is not None and _imported.DB_NAME != TEST_DB_NAME:
+    raise RuntimeError(
+        f"backend.db.mongo was imported with DB_NAME={_imported.DB_NAME} before mongo_test_db"
+    )
+os.environ["DB_NAME"] = TEST_DB_NAME
+
+try:
+    from backend.db import mongo
+    MONGO_AVAILABLE = True
+except Exception:  # RuntimeError from get_mongo_client, or pymongo missing
+    mongo = None
+    MONGO_AVAILABLE = False
+
+
+def drop_test_database():
+    mongo.mongo_client.drop_database(mongo.DB_NAME)
+
+
+@unittest.skipUnless(MONGO_AVAILABLE, "MongoDB not reachable")
+class MongoTestCase(unittest.TestCase):
+    """Base class for Mongo-backed tests; the scratch database is dropped after each class."""
+
+    @classmethod
+    def tearDownClass(cls):
+        drop_test_database()
+        super().tearDownClass()
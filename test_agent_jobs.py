@@ -0,0 +1,93 @@
+"""
+Tests for the agent check-in route (backend/routes/agent_jobs.py).
+
+Calls the route function directly with the rate limiter's bucket store
+stubbed out. Runs against the scratch database from mongo_test_db.py and is
+skipped if no server is available.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+from bson import ObjectId
+from starlette.requests import Request
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.limiter import endpoint_limiter
+    from backend.routes import agent_jobs
+
+
+def _request():
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("10.0.0.1", 40000)})
+
+
+class TestAgentCheckin(MongoTestCase):
+
+    def setUp(self):
+        mongo.agent_jobs_collection().delete_many({})
+        mongo.endpoints_collection().delete_many({})
+        mongo.endpoints_collection().insert_one({"endpoint_id": "ep-1", "hostname": "h1", "last_seen": None})
+
+        patcher = mock.patch.object(endpoint_limiter, "consume", return_value=(True, 0.0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = datetime.now(timezone.utc)
+
+    def _job(self, endpoint_id, created_minutes_ago, status="pending", expires_in=5):
+        job = agent_jobs.build_scan_job(
+            endpoint_id, status,
+            self.now - timedelta(minutes=created_minutes_ago),
+            self.now + timedelta(minutes=expires_in),
+        )
+        mongo.agent_jobs_collection().insert_one(job)
+        return job["job_id"]
+
+    def _checkin(self, **payload):
+        return agent_jobs.agent_checkin(request=_request(), payload=payload)
+
+    def test_no_job(self):
+        response = self._checkin(endpoint_id=" ep-1 ")
+        self.assertEqual(response["job"], None)
+        self.assertEqual(response["next_poll_seconds"], agent_jobs.CHECKIN_INTERVAL_SECONDS)
+        self.assertIsNotNone(mongo.endpoints_collection().find_one({"endpoint_id": "ep-1"})["last_seen"])
+
+        self.assertEqual(self._checkin()["status"], "error")
+
+    def test_oldest_pending_job(self):
+        self._job("ep-1", 1)
+        oldest = self._job("ep-1", 3)
+        self._job("ep-1", 9, expires_in=-1)  # expired
+        self._job("ep-1", 8, status="completed")
+
+        response = self._checkin(endpoint_id="ep-1")
+        self.assertEqual(response["job"]["job_id"], oldest)
+        self.assertEqual(response["next_poll_seconds"], agent_jobs.JOB_ACK_POLL_SECONDS)
+
+    def test_acks_are_scoped_to_the_endpoint(self):
+        own = self._job("ep-1", 2)
+        newer = self._job("ep-1", 1)
+        other = self._job("ep-2", 2)
+
+        response = self._checkin(endpoint_id="ep-1", completed_job_ids=[own, other, "unknown", None])
+        self.assertEqual(response["acknowledged"], 1)
+        self.assertEqual(response["job"]["job_id"], newer)  # the acked job is not handed out again
+
+        status = {job["job_id"]: job["status"] for job in mongo.agent_jobs_collection().find()}
+        self.assertEqual(status, {own: "completed", newer: "pending", other: "pending"})
+
+    def test_legacy_endpoint_id(self):
+        legacy = ObjectId()
+        job_id = self._job(legacy, 1)
+        self.assertEqual(self._checkin(endpoint_id=str(legacy))["job"]["job_id"], job_id)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,121 @@
+"""
+Tests for the debounced auto-analysis trigger (backend/services/auto_analysis.py).
+
+Runs against the scratch database from mongo_test_db.py and is skipped if no
+server is available. The task queue is stubbed out.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services import auto_analysis
+
+
+class TestAutoAnalysis(MongoTestCase):
+
+    def setUp(self):
+        mongo.auto_analysis_state_collection().delete_many({})
+        self._saved = (
+            auto_analysis.AUTO_ANALYSIS_SCAN_COUNT,
+            auto_analysis.AUTO_ANALYSIS_MAX_DELAY_SECONDS,
+            auto_analysis.AUTO_ANALYSIS_MIN_INTERVAL_SECONDS,
+        )
+        auto_analysis.AUTO_ANALYSIS_SCAN_COUNT = 5
+        auto_analysis.AUTO_ANALYSIS_MAX_DELAY_SECONDS = 300
+        auto_analysis.AUTO_ANALYSIS_MIN_INTERVAL_SECONDS = 120
+
+    def tearDown(self):
+        (
+            auto_analysis.AUTO_ANALYSIS_SCAN_COUNT,
+            auto_analysis.AUTO_ANALYSIS_MAX_DELAY_SECONDS,
+            auto_analysis.AUTO_ANALYSIS_MIN_INTERVAL_SECONDS,
+        ) = self._saved
+
+    def _state(self):
+        return mongo.auto_analysis_state_collection().find_one({"_id": auto_analysis.STATE_ID}) or {}
+
+    def _ingest(self, n, at):
+        for _ in range(n):
+            auto_analysis.note_scan_ingested(at)
+
+    def test_debounce(self):
+        now = datetime.now(timezone.utc)
+        self.assertIsNone(auto_analysis.claim_auto_analysis(now))  # nothing pending
+
+        self._ingest(4, now)
+        self.assertIsNone(auto_analysis.claim_auto_analysis(now))  # too few, too recent
+
+        self._ingest(1, now)
+        self.assertEqual(auto_analysis.claim_auto_analysis(now)["pending_scans"], 5)
+        self.assertEqual(self._state()["pending_scans"], 0)
+        self.assertNotIn("first_pending_at", self._state())
+
+        # Within the minimum interval nothing is claimed, however many scans arrive
+        self._ingest(5, now + timedelta(seconds=1))
+        self.assertIsNone(auto_analysis.claim_auto_analysis(now + timedelta(seconds=60)))
+
+        # A single old scan is enough once the interval has passed
+        later = now + timedelta(seconds=400)
+        mongo.auto_analysis_state_collection().update_one(
+            {"_id": auto_analysis.STATE_ID}, {"$set": {"pending_scans": 1}}
+        )
+        claimed = auto_analysis.claim_auto_analysis(later)
+        self.assertEqual(claimed["pending_scans"], 1)
+        self.assertIsNone(auto_analysis.claim_auto_analysis(later))  # claimed once
+
+    def test_run_queues_analysis(self):
+        self._ingest(5, datetime.now(timezone.utc))
+        with mock.patch.object(auto_analysis, "submit_task", return_value=("t-1", False)) as submit:
+            self.assertEqual(auto_analysis.run_auto_analysis_if_due(), "t-1")
+            self.assertIsNone(auto_analysis.run_auto_analysis_if_due())
+        submit.assert_called_once_with("analysis")
+
+        state = self._state()
+        self.assertEqual((state["pending_scans"], state["last_task_id"]), (0, "t-1"))
+
+    def test_join_rearms(self):
+        first_pending = datetime.now(timezone.utc) - timedelta(seconds=30)
+        self._ingest(5, first_pending)
+
+        def join_running(kind):
+            self._ingest(2, datetime.now(timezone.utc))  # arrive while submitting
+            return "t-running", True
+
+        with mock.patch.object(auto_analysis, "submit_task", side_effect=join_running):
+            self.assertEqual(auto_analysis.run_auto_analysis_if_due(), "t-running")
+
+        state = self._state()
+        self.assertEqual(state["pending_scans"], 7)
+        self.assertEqual(
+            state["first_pending_at"].replace(tzinfo=timezone.utc, microsecond=0),
+            first_pending.replace(microsecond=0),
+        )
+
+    def test_failure_rearms(self):
+        now = datetime.now(timezone.utc)
+        self._ingest(5, now)
+        with mock.patch.object(auto_analysis, "submit_task", side_effect=RuntimeError("queue down")):
+            with self.assertRaises(RuntimeError):
+                auto_analysis.run_auto_analysis_if_due()
+        self.assertEqual(self._state()["pending_scans"], 5)
+
+        # The re-armed scans trigger the next run once the interval has passed
+        mongo.auto_analysis_state_collection().update_one(
+            {"_id": auto_analysis.STATE_ID}, {"$set": {"last_run_at": now - timedelta(seconds=600)}}
+        )
+        with mock.patch.object(auto_analysis, "submit_task", return_value=("t-2", False)):
+            self.assertEqual(auto_analysis.run_auto_analysis_if_due(), "t-2")
+        self.assertEqual(self._state()["pending_scans"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,129 @@
+"""
+Tests for the bulk scan importer (backend/db/import_scans.py).
+
+Imports a small folder and .jsonl archive into the scratch database from
+mongo_test_db.py (skipped if no server is available) and checks re-runs,
+resuming from a checkpoint and scans without a scan time.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+from analysis import scan_loader
+
+if MONGO_AVAILABLE:
+    from backend.db import import_scans
+
+
+def _scan(host, day, endpoint_id=None, os_name="Windows 11"):
+    scan = {"hostname": host, "os": os_name, "metadata": {"scan_time_utc": f"2026-01-{day:02d}T10:00:00Z"}}
+    if endpoint_id:
+        scan["endpoint_id"] = endpoint_id
+    return scan
+
+
+class TestImportScans(MongoTestCase):
+
+    def setUp(self):
+        mongo.endpoints_collection().delete_many({})
+        mongo.endpoint_scans_collection().delete_many({})
+
+        self.dir = tempfile.TemporaryDirectory()
+        root = self.dir.name
+        self.checkpoint = os.path.join(root, "checkpoint.json")
+        folder = os.path.join(root, "folder")
+        os.makedirs(folder)
+
+        undated = {"hostname": "host-a", "os": "Windows 11", "marker": "undated"}
+        for i, scan in enumerate([_scan("host-a", 3), _scan("host-b", 4, "ep-b"), undated]):
+            with open(os.path.join(folder, f"scan_{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(scan, f)
+        self.archive = os.path.join(root, "history.jsonl")
+        with open(self.archive, "w", encoding="utf-8") as f:
+            for scan in [_scan("host-a", 1), _scan("host-b", 2, "ep-b", "Windows 10"), _scan("host-c", 5)]:
+                f.write(json.dumps(scan) + "\n")
+        self.inputs = [folder, self.archive]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _import(self, *extra):
+        """Runs the CLI with one file / line per unit and per batch."""
+        argv = ["import_scans", *self.inputs, "--checkpoint", self.checkpoint, "--batch-size", "1", "--no-rebuild", *extra]
+        out = io.StringIO()
+        with mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(out), \
+                mock.patch.object(scan_loader, "SCAN_LOADER_BATCH_FILES", 1), \
+                mock.patch.object(scan_loader, "SCAN_LOADER_BATCH_LINES", 1):
+            import_scans.main()
+        return out.getvalue()
+
+    def _scan_times(self):
+        return sorted(
+            (scan["scan_data"]["hostname"], scan["scan_time"].day)
+            for scan in mongo.endpoint_scans_collection().find()
+        )
+
+    def test_import_and_rerun(self):
+        self.assertIn("5 scans imported", self._import())
+        self.assertIn("1 without hostname/os/scan time", self._import("--restart"))
+        self.assertIn("0 scans imported", self._import("--restart"))
+
+        # The undated scan is never stored, so it cannot become host-a's newest
+        self.assertEqual(self._scan_times(), [("host-a", 1), ("host-a", 3), ("host-b", 2), ("host-b", 4), ("host-c", 5)])
+        self.assertEqual(mongo.endpoints_collection().count_documents({}), 3)
+
+        # Nothing left to do after a completed run
+        self.assertIn("0 scans imported", self._import())
+
+    def test_resume_after_crash(self):
+        save_checkpoint, saves = import_scans.save_checkpoint, []
+
+        def crash_on_second(path, checkpoint):
+            saves.append(checkpoint["position"])
+            if len(saves) == 2:
+                raise RuntimeError("crash")  # after the second unit was written
+            save_checkpoint(path, checkpoint)
+
+        with mock.patch.object(import_scans, "save_checkpoint", crash_on_second):
+            with self.assertRaises(RuntimeError):
+                self._import()
+        self.assertEqual(mongo.endpoint_scans_collection().count_documents({}), 2)
+
+        # The second unit is written again, the rest continues from the checkpoint
+        output = self._import()
+        self.assertIn("Resuming after", output)
+        self.assertIn("3 scans imported", output)
+        self.assertIn("1 already present", output)
+        self.assertEqual(mongo.endpoint_scans_collection().count_documents({}), 5)
+
+    def test_old_archive_keeps_live_endpoint(self):
+        seen = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        mongo.endpoints_collection().insert_one(
+            {"endpoint_id": "ep-b", "hostname": "host-b-renamed", "os": "Windows 11", "last_seen": seen}
+        )
+        self._import()
+
+        endpoint = mongo.endpoints_collection().find_one({"endpoint_id": "ep-b"})
+        self.assertEqual((endpoint["hostname"], endpoint["os"]), ("host-b-renamed", "Windows 11"))
+        self.assertEqual(endpoint["last_seen"].replace(tzinfo=timezone.utc), seen)
+
+        # Newer data than the endpoint's last_seen does update it
+        mongo.endpoints_collection().update_one({"endpoint_id": "ep-b"}, {"$set": {"last_seen": datetime(2026, 1, 1)}})
+        self._import("--restart")
+        endpoint = mongo.endpoints_collection().find_one({"endpoint_id": "ep-b"})
+        self.assertEqual((endpoint["hostname"], endpoint["os"]), ("host-b", "Windows 11"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,135 @@
+"""
+Tests for the declarative issue rules (analysis/issue_rules.py).
+
+Checks the generated evaluator against the rule-by-rule (profiling) path,
+custom rule kinds and operators, validation, hot reload and per-rule stats.
+Needs no database.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from analysis import issue_rules
+from analysis.issue_rules import RuleSet, load_rules, active_rules, reload_rules, is_builtin
+from analysis.synthetic_fleet import generate_fleet
+
+
+CUSTOM_RULES = [
+    {"issue": "many_ports", "field": "listening_ports_count", "op": "ge", "value": 20},
+    {"issue": "old_os", "field": "system.os", "op": "in", "value": ["Windows 7", "Windows XP"]},
+    {"issue": "no_score", "field": "cis_compliance.compliance_score.weighted_score", "op": "eq",
+     "value": -1, "default": -1},
+    {"issue": "any_high", "any_control": {"status": "non-compliant", "severity_weight": 2}},
+    {"issue": "cis_smb", "control_id": "18.3.1"},
+]
+
+
+class TestIssueRules(unittest.TestCase):
+
+    def test_generated_matches_rule_by_rule(self):
+        rules = load_rules(issue_rules.DEFAULT_RULES_PATH)
+        for scan in generate_fleet(11, 500, 1) + [{}, {"cis_compliance": None}]:
+            # Same issues, counts and order
+            self.assertEqual(list(rules._evaluate(scan).items()), list(rules._profiled_counts(scan).items()))
+
+    def test_custom_rules(self):
+        rules = RuleSet(CUSTOM_RULES)
+        scan = {
+            "listening_ports_count": 25,
+            "system": {"os": "Windows 7"},
+            "cis_compliance": {"controls": [
+                {"control_id": "18.3.1", "status": "non-compliant", "severity_weight": 3},
+                {"control_id": "1.1.1", "status": "non-compliant", "severity_weight": 2},
+                {"control_id": "18.3.1", "status": "non-compliant", "severity_weight": 3},
+            ]},
+        }
+        expected = {"many_ports": 1, "old_os": 1, "no_score": 1, "any_high": 1, "cis_smb": 2}
+        self.assertEqual(list(rules.host_issue_counts(scan).items()), list(expected.items()))
+        self.assertEqual(rules.issue_order, [r["issue"] for r in CUSTOM_RULES])
+
+        # Wrong types never match a comparison
+        self.assertEqual(rules.host_issue_counts({"listening_ports_count": "many"}), {"no_score": 1})
+
+    def test_invalid_rules(self):
+        for definitions in (
+            [],
+            [{"issue": "x", "field": "a", "op": "like", "value": 1}],
+            [{"issue": "x", "field": "a", "op": "is", "value": "yes"}],
+            [{"issue": "x", "field": "a", "op": "in", "value": "abc"}],
+            [{"issue": "x", "field": "a..b", "op": "truthy"}],
+            [{"issue": "x", "field": "a", "op": "truthy"}, {"issue": "x", "control_id": "1"}],
+            [{"issue": "x"}],
+        ):
+            with self.subTest(definitions=definitions):
+                with self.assertRaises(ValueError):
+                    RuleSet(definitions)
+
+    def test_builtin_detection(self):
+        self.assertTrue(is_builtin(load_rules(issue_rules.DEFAULT_RULES_PATH)))
+        self.assertFalse(is_builtin(RuleSet(CUSTOM_RULES)))
+
+    def test_stats(self):
+        rules = load_rules(issue_rules.DEFAULT_RULES_PATH)
+        for scan in generate_fleet(12, 640, 1):
+            rules.host_issue_counts(scan)
+
+        stats = rules.stats()
+        self.assertEqual(stats["sampled_hosts"], 640 // issue_rules.ISSUE_RULES_PROFILE_EVERY)
+        self.assertEqual([r["issue"] for r in stats["rules"]], rules.issue_order)
+        for rule in stats["rules"]:
+            self.assertIsNotNone(rule["match_rate"])
+            self.assertEqual(rule["avg_ns"] is None, rule["kind"] != "field")
+
+
+class TestIssueRulesReload(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (issue_rules.ISSUE_RULES_PATH, issue_rules.ISSUE_RULES_RELOAD_SECONDS)
+        self.dir = tempfile.TemporaryDirectory()
+        issue_rules.ISSUE_RULES_PATH = os.path.join(self.dir.name, "rules.json")
+        issue_rules.ISSUE_RULES_RELOAD_SECONDS = 0
+        issue_rules._active = None
+        self._mtime = time.time_ns()
+        self._write({"rules": CUSTOM_RULES})
+
+    def tearDown(self):
+        issue_rules.ISSUE_RULES_PATH, issue_rules.ISSUE_RULES_RELOAD_SECONDS = self._saved
+        issue_rules._active = None
+        self.dir.cleanup()
+
+    def _write(self, data):
+        with open(issue_rules.ISSUE_RULES_PATH, "w", encoding="utf-8") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        # Distinct mtime even on coarse filesystem clocks
+        self._mtime += 10 ** 9
+        os.utime(issue_rules.ISSUE_RULES_PATH, ns=(self._mtime, self._mtime))
+
+    def test_hot_reload(self):
+        first = active_rules()
+        self.assertIs(active_rules(), first)  # unchanged file: same compiled rules
+
+        self._write({"rules": CUSTOM_RULES[:2]})
+        second = active_rules()
+        self.assertEqual(second.issue_order, ["many_ports", "old_os"])
+
+        # A broken file keeps the previous rules
+        self._write("{not json")
+        self.assertIs(active_rules(), second)
+        self.assertIsNotNone(issue_rules.rules_status()["last_reload_error"])
+        with self.assertRaises(ValueError):
+            reload_rules()
+        self.assertIs(active_rules(), second)
+
+        self._write({"rules": CUSTOM_RULES[:1]})
+        self.assertEqual(reload_rules().issue_order, ["many_ports"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,107 @@
+"""
+Tests for the cached, batched LLM explanation service
+(backend/services/llm_explanations.py), using the local stub client.
+
+Needs MongoDB for the explanation cache; uses the scratch database from
+mongo_test_db.py and is skipped if no server is available.
+"""
+
+import os
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services.llm_explanations import (
+        ExplanationService, StubLLMClient, explanation_inputs, inputs_hash,
+    )
+
+
+def _text(result):
+    return result["input_hash"], result["explanation"], result["model"]
+
+
+def _scan(i, level="High"):
+    return {
+        "system": {"hostname": f"host-{i}", "os": "Windows 11"},
+        "risk_assessment": {"risk_score": i, "risk_level": level, "breakdown": [["rdp_enabled", 2]]},
+        "risk_flags": ["rdp_enabled"],
+        "features": {"rdp_enabled": 1},
+        "listening_ports_count": i,  # not a grounded input
+    }
+
+
+class FailingClient:
+    def generate(self, prompt):
+        raise RuntimeError("model unavailable")
+
+
+class TestLLMExplanations(MongoTestCase):
+
+    def setUp(self):
+        mongo.llm_explanations_collection().delete_many({})
+        self.client = StubLLMClient(latency_ms=20)
+        self.service = ExplanationService(self.client, batch_size=8, batch_wait_ms=20, concurrency=2)
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_inputs_are_grounded(self):
+        a, b = explanation_inputs(_scan(1)), explanation_inputs({**_scan(1), "listening_ports_count": 99})
+        self.assertEqual(inputs_hash(a), inputs_hash(b))
+        self.assertNotEqual(inputs_hash(a), inputs_hash(explanation_inputs(_scan(1, "Low"))))
+
+        # ML anomaly only where the scan has none; rounded against retraining noise
+        prediction = {"is_anomaly": True, "anomaly_score": -0.12341}
+        self.assertEqual(explanation_inputs(_scan(1), prediction)["anomaly_assessment"],
+                         {"is_anomalous": True, "anomaly_score": -0.12})
+
+    def test_unchanged_inputs_are_not_regenerated(self):
+        first = self.service.explain(explanation_inputs(_scan(1))).result(timeout=10)
+        again = self.service.explain(explanation_inputs(_scan(1)))
+        self.assertTrue(again.done())  # straight from the cache
+        self.assertEqual(_text(again.result()), _text(first))
+
+        # Survives a restart: the cache is in MongoDB
+        other = ExplanationService(StubLLMClient())
+        try:
+            self.assertEqual(_text(other.explain(explanation_inputs(_scan(1))).result(timeout=10)), _text(first))
+            self.assertEqual(other.stats()["generated"], 0)
+        finally:
+            other.stop()
+        self.assertEqual(self.service.stats()["generated"], 1)
+
+    def test_batching_and_joining(self):
+        inputs = [explanation_inputs(_scan(i % 20)) for i in range(60)]
+        futures = self.service.explain_many(inputs[:30]) + self.service.explain_many(inputs[30:])
+        results = [f.result(timeout=10) for f in futures]
+
+        stats = self.service.stats()
+        self.assertEqual(stats["generated"], 20)
+        self.assertEqual(stats["joined"] + stats["cache_hits"], 40)
+        self.assertLessEqual(self.client.calls, 20 // 8 + 2)
+        self.assertEqual(mongo.llm_explanations_collection().count_documents({}), 20)
+
+        # Deterministic: equal inputs, equal text; different inputs, different text
+        self.assertEqual(results[0], results[20])
+        self.assertNotEqual(results[0]["explanation"], results[1]["explanation"])
+
+    def test_failures_are_not_cached(self):
+        failing = ExplanationService(FailingClient(), batch_wait_ms=0)
+        try:
+            with self.assertRaises(RuntimeError):
+                failing.explain(explanation_inputs(_scan(3))).result(timeout=10)
+            self.assertEqual(failing.stats()["inflight"], 0)
+        finally:
+            failing.stop()
+
+        self.assertEqual(mongo.llm_explanations_collection().count_documents({}), 0)
+        self.assertIn("explanation", self.service.explain(explanation_inputs(_scan(3))).result(timeout=10))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,124 @@
+"""
+Tests for the versioned ML model registry (backend/services/model_registry.py).
+
+Saves small models into a temporary registry and checks metadata, loading,
+schema / checksum validation, activation, rollback and pruning.
+Needs no database.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from backend.services import model_registry
+
+
+COLUMNS = ["listening_ports_count", "rdp_enabled"]
+
+
+def _save(marker, activate=True, columns=COLUMNS):
+    return model_registry.save_version(
+        {"isolation_forest": marker, "kmeans": {"mapping": {0: "Low"}}},
+        {"feature_columns": columns, "training_samples": 20},
+        activate=activate,
+    )
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (model_registry.ML_MODEL_DIR, model_registry.ML_MODEL_KEEP)
+        self.dir = tempfile.TemporaryDirectory()
+        model_registry.ML_MODEL_DIR = os.path.join(self.dir.name, "ml_models")
+        model_registry.ML_MODEL_KEEP = 3
+
+    def tearDown(self):
+        model_registry.ML_MODEL_DIR, model_registry.ML_MODEL_KEEP = self._saved
+        self.dir.cleanup()
+
+    def test_save_and_load(self):
+        self.assertIsNone(model_registry.active_version())
+        self.assertEqual(model_registry.list_versions(), [])
+
+        version = _save("first")
+        self.assertEqual(model_registry.active_version(), version)
+
+        models, metadata = model_registry.load_version(version, COLUMNS)
+        self.assertEqual(models["isolation_forest"], "first")
+        self.assertEqual(metadata["training_samples"], 20)
+        self.assertEqual(metadata["feature_columns"], COLUMNS)
+        self.assertTrue(metadata["created_at"])
+
+        # No temporary directories left behind
+        self.assertEqual(sorted(os.listdir(model_registry.ML_MODEL_DIR)), sorted([version, "active.json"]))
+
+    def test_validation(self):
+        version = _save("first")
+        with self.assertRaises(ValueError):
+            model_registry.load_version(version, COLUMNS + ["av_enabled"])
+
+        with open(os.path.join(model_registry.ML_MODEL_DIR, version, model_registry.MODELS_FILE), "ab") as f:
+            f.write(b"garbage")
+        with self.assertRaises(ValueError):
+            model_registry.load_version(version, COLUMNS)
+
+        for bad in ("missing", "../etc", ".tmp-x", ""):
+            with self.subTest(version=bad):
+                with self.assertRaises(LookupError):
+                    model_registry.read_metadata(bad)
+
+    def test_activate_and_rollback(self):
+        first, second = _save("first"), _save("second")
+        self.assertEqual(model_registry.active_version(), second)
+
+        third = _save("third", activate=False)
+        self.assertEqual(model_registry.active_version(), second)
+
+        model_registry.activate_version(third)
+        self.assertEqual(model_registry.rollback_target(), second)
+        self.assertEqual(model_registry.rollback_version()["version"], second)
+        self.assertEqual(model_registry.rollback_version()["version"], first)
+        with self.assertRaises(LookupError):
+            model_registry.rollback_version()
+        self.assertEqual(model_registry.active_version(), first)
+
+    def test_rollback_history(self):
+        first, second, third = _save("first"), _save("second"), _save("third")
+        self.assertEqual(model_registry.active_state()["history"], [first, second])
+
+        # Re-activating the active version records nothing
+        model_registry.activate_version(third)
+        self.assertEqual(model_registry.active_state()["history"], [first, second])
+
+        # A rolled-back-to version that was removed meanwhile is skipped
+        shutil.rmtree(os.path.join(model_registry.ML_MODEL_DIR, second))
+        self.assertEqual(model_registry.rollback_target(), first)
+        self.assertEqual(model_registry.rollback_version()["version"], first)
+        self.assertEqual(model_registry.active_state()["history"], [])
+
+    def test_history_limit(self):
+        saved = model_registry.HISTORY_LIMIT
+        model_registry.HISTORY_LIMIT = 2
+        try:
+            versions = [_save(str(i)) for i in range(4)]
+        finally:
+            model_registry.HISTORY_LIMIT = saved
+        self.assertEqual(model_registry.active_state()["history"], versions[1:3])
+
+    def test_pruning_keeps_active(self):
+        first = _save("first")
+        later = [_save(str(i), activate=False) for i in range(4)]
+
+        versions = [m["version"] for m in model_registry.list_versions()]
+        self.assertEqual(versions[:3], later[::-1][:3])
+        self.assertIn(first, versions)  # active, so never pruned
+        self.assertEqual(len(versions), 4)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
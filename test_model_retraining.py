@@ -0,0 +1,204 @@
+"""
+Tests for background retraining and the model bundle swap
+(backend/services/model_retraining.py, ml_service.py).
+
+The bundle swap and the retraining thresholds are checked against a
+temporary model registry with the training data stubbed out; they need no
+database. The training query and the new-scan count run against the scratch
+database from mongo_test_db.py and are skipped if no server is available.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MongoTestCase, mongo
+from backend.services import ml_service, model_registry, model_retraining
+
+
+def _scans(n, scan_time, offset=0):
+    return [
+        {
+            "endpoint_id": f"ep-{offset + i}",
+            "scan_time": scan_time,
+            "scan_data": {
+                "listening_ports_count": (offset + i) % 40,
+                "risky_listening_ports": [3389] * ((offset + i) % 3),
+                "features": {"av_enabled": (offset + i) % 4 != 0, "software_count": 20 + (offset + i) % 50},
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def _training_matrix(all_scans=None, extra_rows=0):
+    """Stand-in for ml_service.load_training_matrix over _scans(60)."""
+    rows = [ml_service.get_feature_vector(s["scan_data"]) for s in _scans(60, None)]
+    X = np.zeros((len(rows) + extra_rows, len(ml_service.FEATURE_COLUMNS)), dtype=np.float32)
+    X[:len(rows)] = rows
+    return X, len(rows)
+
+
+class RegistryTestCase(unittest.TestCase):
+    """Temporary model registry and no serving bundle for each test."""
+
+    def setUp(self):
+        self._saved = (model_registry.ML_MODEL_DIR, model_retraining.ML_RETRAIN_NEW_SCANS, ml_service.MODEL_BUNDLE)
+        self.dir = tempfile.TemporaryDirectory()
+        model_registry.ML_MODEL_DIR = self.dir.name
+        model_retraining.ML_RETRAIN_NEW_SCANS = 10
+        ml_service.publish_bundle(None)
+
+    def tearDown(self):
+        model_registry.ML_MODEL_DIR, model_retraining.ML_RETRAIN_NEW_SCANS, bundle = self._saved
+        ml_service.publish_bundle(bundle)
+        self.dir.cleanup()
+
+
+class TestBundleSwap(RegistryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ml_service, "load_training_matrix", _training_matrix)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_train_publishes_registry_version(self):
+        self.assertIsNone(ml_service.current_bundle())
+        result = ml_service.train_models()
+        self.assertEqual(result["status"], "success")
+
+        bundle = ml_service.current_bundle()
+        self.assertEqual(bundle.version, result["version"])
+        self.assertEqual(model_registry.active_version(), bundle.version)
+        self.assertEqual(bundle.metadata["real_samples"], 60)
+        self.assertEqual(bundle.metadata["training_samples"], 60 + ml_service.BASELINE_SAMPLES)
+        self.assertIsNotNone(bundle.trained_at)
+
+    def test_no_training_on_request(self):
+        with mock.patch.object(ml_service, "train_models") as train:
+            result = ml_service.predict_risk_batch([{}], train=False)[0]
+        train.assert_not_called()
+        self.assertEqual(result["risk"], "Unknown")
+        self.assertIsNone(ml_service.current_bundle())
+
+    def test_swap_while_serving(self):
+        ml_service.train_models()
+        first = ml_service.current_bundle()
+        first_mapping = dict(first.mapping)
+
+        scans = [s["scan_data"] for s in _scans(60, None)]
+        errors, stop = [], threading.Event()
+
+        def serve():
+            while not stop.is_set():
+                for result in ml_service.predict_risk_batch(scans):
+                    if result["risk"] not in ("High", "Medium", "Low"):
+                        errors.append(result)
+
+        readers = [threading.Thread(target=serve) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        try:
+            for _ in range(3):
+                self.assertEqual(ml_service.train_models()["status"], "success")
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(errors, [])
+        current = ml_service.current_bundle()
+        self.assertIsNot(current, first)
+        self.assertEqual(first.mapping, first_mapping)  # published bundles are never mutated
+        self.assertEqual(model_registry.active_version(), current.version)
+
+    def test_follows_rollback(self):
+        ml_service.train_models()
+        first = ml_service.current_bundle().version
+        ml_service.train_models()
+
+        model_registry.rollback_version()
+        ml_service.sync_active_version(force=True)
+        self.assertEqual(ml_service.current_bundle().version, first)
+
+
+class TestRetrainReason(RegistryTestCase):
+
+    def _publish(self, trained_at):
+        ml_service.publish_bundle(ml_service.ModelBundle(None, None, {}, "v1", {"created_at": trained_at.isoformat()}))
+
+    def test_thresholds(self):
+        now = datetime.now(timezone.utc)
+        interval = timedelta(seconds=model_retraining.ML_RETRAIN_INTERVAL_SECONDS)
+
+        with mock.patch.object(model_retraining, "_new_scans_since", return_value=0) as counted:
+            self.assertEqual(model_retraining.retrain_reason(now), "no model")
+            counted.assert_not_called()
+
+            self._publish(now - timedelta(hours=1))
+            self.assertIsNone(model_retraining.retrain_reason(now))
+            counted.assert_called_once_with(now - timedelta(hours=1), 10)
+
+            self._publish(now - interval)
+            self.assertEqual(model_retraining.retrain_reason(now), "scheduled")
+
+        self._publish(now - timedelta(hours=1))
+        for new_scans, expected in ((9, None), (10, "10+ new scans")):
+            with mock.patch.object(model_retraining, "_new_scans_since", return_value=new_scans):
+                self.assertEqual(model_retraining.retrain_reason(now), expected)
+
+
+class TestModelRetrainingMongo(RegistryTestCase, MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mongo.endpoint_scans_collection().delete_many({})
+
+    def test_retrain_reasons(self):
+        mongo.endpoint_scans_collection().insert_many(_scans(30, datetime.now(timezone.utc) - timedelta(hours=1)))
+        self.assertEqual(model_retraining.retrain_reason(), "no model")
+
+        self.assertEqual(ml_service.train_models()["status"], "success")
+        self.assertIsNone(model_retraining.retrain_reason())
+
+        mongo.endpoint_scans_collection().insert_many(
+            _scans(10, datetime.now(timezone.utc) + timedelta(seconds=1), offset=30)
+        )
+        self.assertEqual(model_retraining.retrain_reason(), "10+ new scans")
+
+    def test_training_matrix(self):
+        now = datetime.now(timezone.utc)
+        mongo.endpoint_scans_collection().insert_many(
+            _scans(30, now - timedelta(days=1)) + _scans(30, now, offset=5) + [{"endpoint_id": "ep-99", "scan_time": now}]
+        )
+        newest = {}
+        for scan in mongo.endpoint_scans_collection().find({"scan_data": {"$exists": True}}).sort("scan_time", 1):
+            newest[scan["endpoint_id"]] = scan["scan_data"]
+        expected = [ml_service.get_feature_vector(scan_data) for scan_data in newest.values()]
+
+        saved = ml_service.ML_TRAIN_CHUNK_ROWS
+        ml_service.ML_TRAIN_CHUNK_ROWS = 7  # several chunks
+        try:
+            X, rows = ml_service.load_training_matrix(extra_rows=3)
+            X_all, rows_all = ml_service.load_training_matrix(all_scans=True)
+        finally:
+            ml_service.ML_TRAIN_CHUNK_ROWS = saved
+
+        self.assertEqual(X.dtype, "float32")
+        self.assertEqual((rows, X.shape), (35, (38, len(ml_service.FEATURE_COLUMNS))))
+        self.assertEqual(sorted(X[:rows].tolist()), sorted(np.asarray(expected, dtype=np.float32).tolist()))
+        self.assertEqual((rows_all, len(X_all)), (60, 60))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
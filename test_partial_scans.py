@@ -0,0 +1,135 @@
+"""
+Tests for partial scans: section validation when scheduling
+(backend/routes/agent_jobs.py, job_scheduler.py) and merging a partial
+upload into the endpoint's latest scan (backend/routes/scans.py).
+
+The route modules connect to MongoDB on import, so everything here uses the
+scratch database from mongo_test_db.py and is skipped if no server is
+available. The upload route is called directly with the rate limiter's
+bucket store stubbed out.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.limiter import endpoint_limiter
+    from backend.routes import scans
+    from backend.routes.agent_jobs import validate_scan_sections
+    from backend.routes.job_scheduler import _requested_sections
+
+
+FULL_SCAN = {
+    "endpoint_id": "ep-1",
+    "hostname": "host-1",
+    "os": "Windows 11",
+    "metadata": {"scan_time_utc": "2026-01-01T10:00:00Z"},
+    "security_controls": {"firewall_status": "on"},
+    "privilege_posture": {"user_is_admin": True},
+    "exposure_posture": {"rdp_enabled": True},
+    "cis_compliance": {"controls": [{"control_id": "1.1", "status": "FAIL"}]},
+}
+
+
+def _partial(sections, **collected):
+    return {
+        "endpoint_id": "ep-1",
+        "hostname": "host-1",
+        "os": "Windows 11",
+        "metadata": {"scan_time_utc": "2026-01-02T10:00:00Z"},
+        "partial_sections": sections,
+        **collected,
+    }
+
+
+@unittest.skipUnless(MONGO_AVAILABLE, "MongoDB not reachable")
+class TestSections(unittest.TestCase):
+
+    def test_validate_scan_sections(self):
+        self.assertIsNone(validate_scan_sections(None))
+        self.assertIsNone(validate_scan_sections([]))
+        self.assertEqual(
+            validate_scan_sections(["cis_compliance", "privilege_posture", "cis_compliance"]),
+            ["privilege_posture", "cis_compliance"],
+        )
+        with self.assertRaises(ValueError) as raised:
+            validate_scan_sections(["cis_compliance", "security_controls"])
+        self.assertIn("security_controls", str(raised.exception))
+
+    def test_scheduling_rejects_unknown_sections(self):
+        self.assertEqual(_requested_sections({"sections": ["exposure_posture"]}), ["exposure_posture"])
+        self.assertIsNone(_requested_sections(None))
+        for payload in ({"sections": ["registry"]}, {"sections": "cis_compliance"}):
+            with self.subTest(payload=payload):
+                with self.assertRaises(HTTPException) as raised:
+                    _requested_sections(payload)
+                self.assertEqual(raised.exception.status_code, 400)
+
+    def test_merge_replaces_only_requested_sections(self):
+        partial = _partial(
+            ["cis_compliance", "exposure_posture"],
+            cis_compliance={"controls": []},
+            privilege_posture={"user_is_admin": False},  # not requested: ignored
+        )
+        merged = scans.merge_partial_scan(FULL_SCAN, partial)
+
+        self.assertEqual(merged["cis_compliance"], {"controls": []})
+        self.assertEqual(merged["exposure_posture"], FULL_SCAN["exposure_posture"])  # requested but not sent
+        self.assertEqual(merged["privilege_posture"], FULL_SCAN["privilege_posture"])
+        self.assertEqual(merged["security_controls"], FULL_SCAN["security_controls"])
+        self.assertEqual(merged["metadata"], partial["metadata"])
+        self.assertEqual(merged["partial_sections"], ["cis_compliance", "exposure_posture"])
+        self.assertNotIn("partial_sections", FULL_SCAN)  # the stored scan is not modified
+
+
+class TestPartialUpload(MongoTestCase):
+
+    def setUp(self):
+        mongo.endpoints_collection().delete_many({})
+        mongo.endpoint_scans_collection().delete_many({})
+        patcher = mock.patch.object(endpoint_limiter, "consume", return_value=(True, 0.0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, scan):
+        request = Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("10.0.0.1", 40000)})
+        return scans.upload_scan(request=request, scan=scan)
+
+    def test_needs_an_earlier_scan(self):
+        partial = _partial(["cis_compliance"], cis_compliance={"controls": []})
+        for scan in (partial, {k: v for k, v in partial.items() if k != "endpoint_id"}):
+            with self.subTest(endpoint_id=scan.get("endpoint_id")):
+                with self.assertRaises(HTTPException) as raised:
+                    self._upload(scan)
+                self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(mongo.endpoint_scans_collection().count_documents({}), 0)
+
+    def test_merges_into_the_latest_scan(self):
+        self._upload(dict(FULL_SCAN))
+        older = dict(FULL_SCAN, security_controls={"firewall_status": "off"})
+        mongo.endpoint_scans_collection().insert_one(
+            {"endpoint_id": "ep-1", "scan_time": datetime.now(timezone.utc) - timedelta(days=1), "scan_data": older}
+        )
+
+        response = self._upload(_partial(["cis_compliance"], cis_compliance={"controls": []}))
+        self.assertEqual(response["message"], "Partial scan merged and stored")
+
+        stored = mongo.endpoint_scans_collection().find_one({"endpoint_id": "ep-1"}, sort=[("scan_time", -1)])
+        self.assertEqual(stored["scan_data"]["cis_compliance"], {"controls": []})
+        self.assertEqual(stored["scan_data"]["security_controls"], FULL_SCAN["security_controls"])
+        self.assertEqual(stored["scan_data"]["exposure_posture"], FULL_SCAN["exposure_posture"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+"""
+Tests for the hourly / daily posture rollups (backend/services/posture_rollups.py).
+
+Folds a few snapshots into their buckets and checks the averages, maxima and
+last values posture_trends returns, the issue name checks, and that a
+rebuild from the stored snapshots gives the same buckets. Runs against the
+scratch database from mongo_test_db.py and is skipped if no server is
+available.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services.posture_rollups import posture_trends, rebuild_rollups, record_snapshot
+    from backend.services.posture_snapshots import posture_from_state, store_snapshot
+
+
+DAY = datetime(2026, 3, 2, tzinfo=timezone.utc)
+ISSUE = "firewall_disabled"  # built-in rule
+REMOVED = "legacy_agent_issue"  # no longer in the rule set
+
+
+def _posture(total_hosts, issues, ml=None, score=None):
+    return posture_from_state({
+        "total_hosts": total_hosts,
+        "threshold": 0.5,
+        "issues": issues,
+        "ml": ml or {},
+        "cis": {} if score is None else {"average_compliance_score": score},
+    })
+
+
+def _snapshots():
+    return [
+        (DAY + timedelta(hours=10, minutes=15), _posture(10, {ISSUE: 4, REMOVED: 2}, {"High": 2}, 70.0)),
+        (DAY + timedelta(hours=10, minutes=45), _posture(20, {ISSUE: 8}, {"High": 4}, 80.0)),
+        (DAY + timedelta(hours=13, minutes=5), _posture(30, {}, {"High": 6})),
+    ]
+
+
+class TestPostureRollups(MongoTestCase):
+
+    def setUp(self):
+        mongo.posture_rollups_collection().delete_many({})
+        mongo.org_posture_snapshots_collection().delete_many({})
+        mongo.posture_snapshot_chain_collection().delete_many({})
+
+    def _record_all(self):
+        for generated_at, posture_data in _snapshots():
+            record_snapshot(posture_data, generated_at)
+
+    def _trends(self, issue=None, granularity="hour"):
+        return posture_trends(issue, granularity, DAY, DAY + timedelta(hours=23))["points"]
+
+    def test_hourly_buckets(self):
+        self._record_all()
+        points = self._trends(ISSUE)
+
+        self.assertEqual([p["bucket_start"].hour for p in points], [10, 13])
+        ten, one = points
+        self.assertEqual((ten["snapshots"], ten["avg_total_hosts"]), (2, 15.0))
+        self.assertEqual(ten["avg_ml_risk"], {"High": 3.0})
+        self.assertEqual(ten["avg_cis_score"], 75.0)
+        self.assertEqual(
+            (ten["avg_affected_hosts"], ten["max_affected_hosts"], ten["last_affected_hosts"]), (6.0, 8, 8)
+        )
+
+        # A snapshot without the issue counts as 0 affected hosts; no CIS score, no average
+        self.assertEqual(
+            (one["avg_affected_hosts"], one["max_affected_hosts"], one["last_affected_hosts"]), (0.0, 0, 0)
+        )
+        self.assertIsNone(one["avg_cis_score"])
+
+    def test_daily_bucket(self):
+        self._record_all()
+        (day,) = self._trends(ISSUE, "day")
+        self.assertEqual(day["bucket_start"].replace(tzinfo=timezone.utc), DAY)
+        self.assertEqual((day["snapshots"], day["avg_total_hosts"], day["avg_ml_risk"]), (3, 20.0, {"High": 4.0}))
+        self.assertEqual(day["avg_cis_score"], 75.0)  # over the two snapshots that had one
+        self.assertEqual(
+            (day["avg_affected_hosts"], day["max_affected_hosts"], day["last_affected_hosts"]), (4.0, 8, 0)
+        )
+
+    def test_issue_names(self):
+        self._record_all()
+
+        # A removed / renamed rule stays queryable while its buckets exist
+        (day,) = self._trends(REMOVED, "day")
+        self.assertEqual((day["avg_affected_hosts"], day["max_affected_hosts"]), (0.67, 2))
+
+        # A current rule without any affected hosts yet is a flat series
+        self.assertEqual([p["max_affected_hosts"] for p in self._trends("rdp_enabled")], [0, 0])
+
+        for issue in ("no_such_issue", "issues.x", "$where"):
+            with self.subTest(issue=issue):
+                with self.assertRaises(ValueError):
+                    self._trends(issue)
+
+        with self.assertRaises(ValueError):
+            posture_trends(granularity="week")
+
+    def test_rebuild_matches_recorded(self):
+        for generated_at, posture_data in _snapshots():
+            store_snapshot(posture_data, generated_at)
+            record_snapshot(posture_data, generated_at)
+        recorded = {granularity: self._trends(ISSUE, granularity) for granularity in ("hour", "day")}
+
+        self.assertEqual(rebuild_rollups(), 3)
+        for granularity, points in recorded.items():
+            self.assertEqual(self._trends(ISSUE, granularity), points)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
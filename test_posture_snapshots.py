@@ -0,0 +1,174 @@
+"""
+Tests for keyframe / delta posture snapshot storage
+(backend/services/posture_snapshots.py).
+
+Stores random postures and checks that every snapshot (keyframe, delta or
+legacy full document) reads back exactly as stored, and that
+diff_snapshots matches the stored states. Runs against the scratch database
+from mongo_test_db.py and is skipped if no server is available.
+"""
+
+import os
+import random
+import sys
+import threading
+import unittest
+from datetime import datetime, timezone, timedelta
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services import posture_snapshots
+    from backend.services.posture_snapshots import (
+        apply_delta,
+        diff_snapshots,
+        find_snapshot,
+        load_posture_data,
+        posture_from_state,
+        posture_state,
+        state_delta,
+        store_snapshot,
+    )
+
+
+ISSUES = [f"issue_{i}" for i in range(12)]
+
+
+def _random_state(rng):
+    total_hosts = rng.randint(1, 200)
+    issues = rng.sample(ISSUES, rng.randint(0, len(ISSUES)))
+    return {
+        "total_hosts": total_hosts,
+        "threshold": rng.choice([0.3, 0.5]),
+        "issues": {issue: rng.randint(1, total_hosts) for issue in issues},
+        "ml": {risk: rng.randint(0, 50) for risk in rng.sample(["High", "Medium", "Low", "Unknown"], rng.randint(0, 4))},
+        "cis": {field: rng.randint(0, 100) for field in rng.sample(["pass", "fail", "average_score"], rng.randint(0, 3))},
+    }
+
+
+def _random_posture(rng):
+    posture_data = posture_from_state(_random_state(rng))
+    if rng.random() < 0.5:
+        posture_data["segments"] = {"os": {"Windows 11": {"hosts": rng.randint(1, 9)}}}
+    return posture_data
+
+
+class TestPostureSnapshots(MongoTestCase):
+
+    def setUp(self):
+        mongo.org_posture_snapshots_collection().delete_many({})
+        mongo.posture_snapshot_chain_collection().delete_many({})
+        self._interval = posture_snapshots.POSTURE_KEYFRAME_INTERVAL
+        posture_snapshots.POSTURE_KEYFRAME_INTERVAL = 4
+
+    def tearDown(self):
+        posture_snapshots.POSTURE_KEYFRAME_INTERVAL = self._interval
+
+    def test_delta_round_trip(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            old, new = _random_state(rng), _random_state(rng)
+            self.assertEqual(apply_delta(old, state_delta(old, new)), new)
+            self.assertEqual(list(apply_delta(old, state_delta(old, new))["issues"]), list(new["issues"]))
+        self.assertEqual(state_delta(old, old), {})
+
+    def test_stored_snapshots_load_back(self):
+        rng = random.Random(2)
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        stored = {}
+        for i in range(11):
+            posture_data = _random_posture(rng)
+            stored[store_snapshot(posture_data, base + timedelta(hours=i))] = posture_data
+
+        # Legacy full document, written before seq / keyframes
+        legacy = _random_posture(rng)
+        legacy_id = mongo.org_posture_snapshots_collection().insert_one(
+            {"generated_at": base - timedelta(days=1), "posture_data": legacy}
+        ).inserted_id
+        stored[str(legacy_id)] = legacy
+
+        keyframes = [
+            doc["seq"] for doc in mongo.org_posture_snapshots_collection().find({"keyframe": True}).sort("seq", 1)
+        ]
+        self.assertEqual(keyframes, [1, 5, 9])
+
+        for snapshot_id, posture_data in stored.items():
+            with self.subTest(snapshot_id=snapshot_id):
+                self.assertEqual(load_posture_data(find_snapshot(snapshot_id)), posture_data)
+                # State-only reads as used by rollups and diffs
+                state_doc = find_snapshot(snapshot_id, posture_snapshots.STATE_FIELDS)
+                self.assertEqual(posture_snapshots.snapshot_state(state_doc), posture_state(posture_data))
+
+    def test_diff_snapshots(self):
+        rng = random.Random(3)
+        postures = [_random_posture(rng) for _ in range(6)]
+        ids = [store_snapshot(posture_data) for posture_data in postures]
+
+        for a, b in [(0, 5), (2, 3), (5, 1), (4, 4)]:
+            with self.subTest(pair=(a, b)):
+                old, new = posture_state(postures[a]), posture_state(postures[b])
+                diff = diff_snapshots(ids[a], ids[b])
+
+                changed = {entry["issue"]: (entry["from"], entry["to"]) for entry in diff["issues"]}
+                expected = {
+                    issue: (old["issues"].get(issue, 0), new["issues"].get(issue, 0))
+                    for issue in set(old["issues"]) | set(new["issues"])
+                    if old["issues"].get(issue, 0) != new["issues"].get(issue, 0)
+                }
+                self.assertEqual(changed, expected)
+                self.assertEqual(
+                    (diff["total_hosts"]["from"], diff["total_hosts"]["to"]), (old["total_hosts"], new["total_hosts"])
+                )
+                for group, key in (("ml", "ml_risk_overview"), ("cis", "cis_compliance_overview")):
+                    self.assertEqual(
+                        {name: (c["from"], c["to"]) for name, c in diff[key].items()},
+                        {
+                            name: (old[group].get(name), new[group].get(name))
+                            for name in set(old[group]) | set(new[group])
+                            if old[group].get(name) != new[group].get(name)
+                        },
+                    )
+
+        with self.assertRaises(LookupError):
+            diff_snapshots(ids[0], "0" * 24)
+
+    def test_concurrent_writers(self):
+        rng = random.Random(4)
+        postures = [_random_posture(rng) for _ in range(24)]
+        ids, start = {}, threading.Barrier(6)
+
+        def write(batch):
+            start.wait()
+            for i in batch:
+                ids[store_snapshot(postures[i])] = postures[i]
+
+        threads = [threading.Thread(target=write, args=(range(t, 24, 6),)) for t in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        docs = list(mongo.org_posture_snapshots_collection().find())
+        self.assertEqual(len(docs), 24)  # nothing written twice or dropped
+        self.assertEqual(sorted(doc["seq"] for doc in docs), list(range(1, 25)))
+        for snapshot_id, posture_data in ids.items():
+            self.assertEqual(load_posture_data(find_snapshot(snapshot_id)), posture_data)
+
+    def test_missing_keyframe_starts_a_new_one(self):
+        rng = random.Random(5)
+        first = store_snapshot(_random_posture(rng))
+
+        # Its writer died after advancing the chain, before inserting it
+        mongo.org_posture_snapshots_collection().delete_one({"_id": find_snapshot(first)["_id"]})
+
+        posture_data = _random_posture(rng)
+        snapshot = find_snapshot(store_snapshot(posture_data))
+        self.assertTrue(snapshot["keyframe"])
+        self.assertEqual(load_posture_data(snapshot), posture_data)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
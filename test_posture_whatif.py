@@ -0,0 +1,82 @@
+"""
+Tests for threshold what-if evaluation (backend/services/posture_whatif.py).
+
+Stores snapshots in the scratch database from mongo_test_db.py (skipped if
+no server is available) and reclassifies the latest one at other
+thresholds.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services.posture_snapshots import posture_from_state, store_snapshot
+    from backend.services.posture_whatif import evaluate_threshold, sweep_thresholds
+
+
+NOW = datetime(2026, 3, 2, 12, tzinfo=timezone.utc)
+
+# Affected hosts out of 100: 80%, 45%, 20%, 5%
+ISSUES = {"firewall_disabled": 80, "rdp_enabled": 45, "smbv1_enabled": 20, "uac_disabled": 5}
+
+
+def _store(issues, threshold, generated_at):
+    posture_data = posture_from_state({
+        "total_hosts": 100, "threshold": threshold, "issues": issues, "ml": {}, "cis": {},
+    })
+    return store_snapshot(posture_data, generated_at)
+
+
+class TestPostureWhatif(MongoTestCase):
+
+    def setUp(self):
+        mongo.org_posture_snapshots_collection().delete_many({})
+        mongo.posture_snapshot_chain_collection().delete_many({})
+
+    def test_no_snapshot(self):
+        with self.assertRaises(LookupError):
+            evaluate_threshold(0.5)
+        with self.assertRaises(LookupError):
+            sweep_thresholds([0.5])
+
+    def test_evaluate_threshold(self):
+        _store({"firewall_disabled": 1}, 0.5, NOW - timedelta(days=1))  # older, ignored
+        latest = _store(ISSUES, 0.5, NOW)
+
+        result = evaluate_threshold(0.2)
+        self.assertEqual(result["snapshot_id"], latest)
+        self.assertEqual(result["stored_threshold"], 0.5)
+        self.assertEqual(
+            [f["issue"] for f in result["posture_data"]["systemic_issues"]],
+            ["firewall_disabled", "rdp_enabled", "smbv1_enabled"],  # ratio >= threshold
+        )
+        self.assertEqual(
+            result["changed_classifications"],
+            [
+                {"issue": "rdp_enabled", "from": "isolated", "to": "systemic"},
+                {"issue": "smbv1_enabled", "from": "isolated", "to": "systemic"},
+            ],
+        )
+        self.assertEqual(evaluate_threshold(0.5)["changed_classifications"], [])
+
+    def test_sweep_thresholds(self):
+        _store(ISSUES, 0.5, NOW)
+        result = sweep_thresholds([0.9, 0.1, 0.5, 0.1])
+
+        self.assertEqual(result["total_hosts"], 100)
+        self.assertEqual(
+            [(r["threshold"], r["systemic_issue_count"], r["isolated_issue_count"]) for r in result["results"]],
+            [(0.1, 3, 1), (0.5, 1, 3), (0.9, 0, 4)],
+        )
+        self.assertEqual(result["results"][1]["systemic_issues"], ["firewall_disabled"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
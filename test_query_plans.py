@@ -0,0 +1,122 @@
+"""
+Query-plan verification for the backend's hot MongoDB queries.
+
+Runs each route/service query through explain() against a local mongod
+and fails if the winning plan falls back to a COLLSCAN.
+
+Needs MongoDB; uses the scratch database from mongo_test_db.py and is
+skipped if no server is available.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone, timedelta
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MongoTestCase, drop_test_database, mongo
+
+
+NOW = datetime.now(timezone.utc)
+
+# (description, collection, filter, sort) for every query issued by routes/services
+HOT_QUERIES = [
+    ("register/heartbeat/scan upload: endpoint by id", "endpoints",
+     {"endpoint_id": "ep-1"}, None),
+    ("legacy scan upload: endpoint by hostname", "endpoints",
+     {"hostname": "host-1"}, None),
+    ("endpoints list: scan count per endpoint", "endpoint_scans",
+     {"endpoint_id": "ep-1"}, None),
+    ("scans read / ml predict: scans per endpoint newest first", "endpoint_scans",
+     {"endpoint_id": "ep-1"}, [("scan_time", -1)]),
+    ("explanations: newest scan of each requested endpoint", "endpoint_scans",
+     {"endpoint_id": {"$in": ["ep-1", "ep-2"]}}, [("endpoint_id", 1), ("scan_time", -1)]),
+    ("systemic analysis: all scans newest first", "endpoint_scans",
+     {}, [("scan_time", -1)]),
+    ("ml training: newest scan per endpoint", "endpoint_scans",
+     {}, [("endpoint_id", 1), ("scan_time", -1)]),
+    ("agent poll / check-in: oldest pending non-expired job", "agent_jobs",
+     {"endpoint_id": "ep-1", "status": "pending", "expires_at": {"$gt": NOW}}, [("created_at", 1)]),
+    ("scheduler: existing queued job", "agent_jobs",
+     {"endpoint_id": "ep-1", "status": {"$in": ["pending", "disconnected"]},
+      "expires_at": {"$gt": NOW}}, None),
+    ("job sweeper: stale pending/disconnected jobs", "agent_jobs",
+     {"status": {"$in": ["pending", "disconnected"]}, "expires_at": {"$lt": NOW}}, None),
+    ("job sweeper: jobs past retention", "agent_jobs",
+     {"expires_at": {"$lt": NOW - timedelta(minutes=5)}}, None),
+    ("job completion by job_id", "agent_jobs",
+     {"job_id": "job-1"}, None),
+    ("jobs page: newest first", "agent_jobs",
+     {}, [("created_at", -1)]),
+    ("posture latest / list", "org_posture_snapshots",
+     {}, [("generated_at", -1)]),
+    ("interpretation latest", "org_interpretations",
+     {}, [("generated_at", -1)]),
+    ("interpretation by snapshot", "org_interpretations",
+     {"posture_snapshot_id": "snap-1"}, None),
+    ("interpretation memo: earlier interpretation of the same posture", "org_interpretations",
+     {"posture_hash": "0" * 64}, None),
+    ("posture trends: buckets in range", "posture_rollups",
+     {"granularity": "day", "bucket_start": {"$gte": NOW - timedelta(days=365), "$lte": NOW}},
+     [("bucket_start", 1)]),
+    ("task status by task_id", "analysis_tasks",
+     {"task_id": "task-1"}, None),
+    ("CIS drill-down: failing hosts of a control", "cis_host_controls",
+     {"failing": "2.3.1"}, [("_id", 1)]),
+]
+
+
+def _stages(plan):
+    """Yields every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+class TestQueryPlans(MongoTestCase):
+    """Every hot query must be served by an index"""
+
+    @classmethod
+    def setUpClass(cls):
+        drop_test_database()
+        mongo.ensure_database_exists()
+
+        # A little data so the planner has something to choose between
+        for i in range(50):
+            eid = f"ep-{i}"
+            mongo.endpoints_collection().insert_one(
+                {"endpoint_id": eid, "hostname": f"host-{i}", "os": "Windows", "last_seen": NOW}
+            )
+            mongo.endpoint_scans_collection().insert_one(
+                {"endpoint_id": eid, "scan_time": NOW - timedelta(minutes=i), "scan_data": {}}
+            )
+            mongo.agent_jobs_collection().insert_one({
+                "job_id": f"job-{i}", "endpoint_id": eid, "job_type": "RUN_SCAN",
+                "status": "pending", "created_at": NOW, "expires_at": NOW + timedelta(minutes=2)
+            })
+
+    def test_no_collscan(self):
+        for description, collection, query, sort in HOT_QUERIES:
+            with self.subTest(description):
+                cursor = mongo.db[collection].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain()["queryPlanner"]["winningPlan"]
+                self.assertNotIn("COLLSCAN", list(_stages(plan)), f"{description}: {plan}")
+
+    def test_indexes_match_spec(self):
+        for collection, models in mongo.INDEX_SPECS.items():
+            existing = set(mongo.db[collection].index_information())
+            for model in models:
+                self.assertIn(model.document["name"], existing)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
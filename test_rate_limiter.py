@@ -0,0 +1,148 @@
+"""
+Tests for the agent route rate limiter (backend/limiter.py).
+
+Bucket keys, 429 responses and failing open are checked with the bucket
+store stubbed out and need no database. The token buckets themselves run
+against the scratch database from mongo_test_db.py and are skipped if no
+server is available.
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MongoTestCase, mongo
+from backend import limiter
+from backend.limiter import TokenBucketLimiter, endpoint_identity
+
+
+def _request(ip="10.0.0.1", header_endpoint_id=None, path_params=None):
+    headers = [(b"x-endpoint-id", header_endpoint_id.encode())] if header_endpoint_id else []
+    return Request({
+        "type": "http", "method": "POST", "path": "/", "headers": headers,
+        "client": (ip, 40000), "path_params": path_params or {},
+    })
+
+
+class TestBucketKeys(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(limiter, "is_registered_endpoint", lambda e: e == "ep-registered")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.limiter = TokenBucketLimiter()
+        self.keys = []
+        self.limiter.consume = lambda key, rate, burst: (self.keys.append(key), (True, 0.0))[1]
+
+        @self.limiter.limit("5/minute", scope="upload", body="scan")
+        def upload(request, scan):
+            return "stored"
+
+        @self.limiter.limit("5/minute", scope="poll")
+        def poll(request, endpoint_id):
+            return "polled"
+
+        self.upload, self.poll = upload, poll
+
+    def test_identity(self):
+        # The header is never trusted
+        self.assertEqual(endpoint_identity(_request(header_endpoint_id="ep-registered")), "ip:10.0.0.1")
+        self.assertEqual(endpoint_identity(_request(), " ep-registered "), "endpoint:ep-registered")
+        self.assertEqual(endpoint_identity(_request(), "ep-made-up"), "ip:10.0.0.1")
+
+    def test_keys_follow_the_body_and_path(self):
+        self.assertEqual(self.upload(request=_request(), scan={"endpoint_id": "ep-registered"}), "stored")
+        self.upload(request=_request(header_endpoint_id="ep-registered"), scan={"hostname": "legacy"})
+        self.poll(request=_request(), endpoint_id="ep-registered")
+        self.assertEqual(self.keys, ["upload:endpoint:ep-registered", "upload:ip:10.0.0.1", "poll:endpoint:ep-registered"])
+
+    def test_rotating_ids_share_the_ip_bucket(self):
+        for i in range(5):
+            self.upload(request=_request(header_endpoint_id=f"h-{i}"), scan={"endpoint_id": f"ep-{i}"})
+        self.assertEqual(set(self.keys), {"upload:ip:10.0.0.1"})
+
+
+class TestLimitDecorator(unittest.TestCase):
+
+    def _route(self, consume):
+        bucket = TokenBucketLimiter(key_func=lambda request, endpoint_id=None: "ip:test")
+        bucket.consume = consume
+
+        @bucket.limit("6/minute", burst=2, scope="route")
+        def route(request):
+            return "ok"
+
+        return route
+
+    def test_rejects_with_retry_after(self):
+        route = self._route(lambda key, rate, burst: (False, 9.5))
+        with self.assertRaises(HTTPException) as raised:
+            route(request=_request())
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.headers["Retry-After"], "10")
+
+    def test_fails_open(self):
+        def unavailable(key, rate, burst):
+            raise RuntimeError("store unavailable")
+
+        self.assertEqual(self._route(unavailable)(request=_request()), "ok")
+
+        # An identity lookup failure fails open as well
+        bucket = TokenBucketLimiter(key_func=mock.Mock(side_effect=RuntimeError("store unavailable")))
+        route = bucket.limit("6/minute", scope="route")(lambda request: "ok")
+        self.assertEqual(route(request=_request()), "ok")
+
+
+class TestTokenBuckets(MongoTestCase):
+
+    def setUp(self):
+        mongo.rate_limit_buckets_collection().delete_many({})
+        mongo.endpoints_collection().delete_many({})
+        self.limiter = TokenBucketLimiter()
+
+    def test_burst_then_refill(self):
+        rate = 20.0  # tokens per second
+        results = [self.limiter.consume("b", rate, 3) for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertGreater(results[-1][1], 0)
+        self.assertLessEqual(results[-1][1], 1 / rate)
+
+        time.sleep(2 / rate)
+        self.assertTrue(self.limiter.consume("b", rate, 3)[0])
+        self.assertTrue(self.limiter.consume("other", rate, 3)[0])  # buckets are independent
+
+    def test_concurrent_consumers_share_the_bucket(self):
+        allowed = []
+
+        def take():
+            for _ in range(5):
+                allowed.append(self.limiter.consume("shared", 0.001, 10)[0])
+
+        threads = [threading.Thread(target=take) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 10)
+
+    def test_registered_identity(self):
+        mongo.endpoints_collection().insert_one({"endpoint_id": "ep-1", "hostname": "h"})
+        legacy_id = mongo.endpoints_collection().insert_one({"hostname": "legacy"}).inserted_id
+
+        self.assertEqual(endpoint_identity(_request(), "ep-1"), "endpoint:ep-1")
+        self.assertEqual(endpoint_identity(_request(), str(legacy_id)), f"endpoint:{legacy_id}")
+        self.assertEqual(endpoint_identity(_request(), "ep-2"), "ip:10.0.0.1")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
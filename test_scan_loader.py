@@ -0,0 +1,126 @@
+"""
+Tests for the streaming scan loader (analysis/scan_loader.py).
+
+Writes a small archive (.json files, .jsonl and .jsonl.gz) and checks that
+the parallel load keeps exactly the newest scan per host, in thread and
+process mode. Needs no database.
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from analysis import scan_loader
+from analysis.scan_loader import LatestScans, LoadStats, load_latest_scans, scan_timestamp
+
+
+def _scan(host, day, marker):
+    return {"hostname": host, "metadata": {"scan_time_utc": f"2026-01-{day:02d}T10:00:00Z"}, "marker": marker}
+
+
+def _items(units):
+    """Files and (path, line number) pairs covered by units, in order."""
+    items = []
+    for unit in units:
+        if unit[0] == "files":
+            items.extend(unit[1])
+        else:
+            _, path, first, lines = unit
+            items.extend((path, first + i) for i in range(len(lines)))
+    return items
+
+
+class TestScanLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        root = self.dir.name
+        os.makedirs(os.path.join(root, "folder"))
+
+        # host-a: newest in a .json file; host-b: newest in the .jsonl.gz; host-c: only in .jsonl
+        for i, scan in enumerate([_scan("host-a", 9, "a-new"), _scan("HOST-B ", 1, "b-old"), {"system": {}}]):
+            with open(os.path.join(root, "folder", f"scan_{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(scan, f)
+        with open(os.path.join(root, "folder", "notes.txt"), "w", encoding="utf-8") as f:
+            f.write("not a scan")
+        with open(os.path.join(root, "more.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(_scan("host-a", 2, "a-old")) + "\n\n")
+            f.write(json.dumps(_scan("host-c", 3, "c")) + "\n")
+            f.write("{broken\n")
+        with gzip.open(os.path.join(root, "archive.jsonl.gz"), "wt", encoding="utf-8") as f:
+            f.write(json.dumps(_scan("host-b", 5, "b-new")) + "\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _load(self, **kwargs):
+        stats = LoadStats(out=None)
+        scans = load_latest_scans([self.dir.name], stats=stats, **kwargs)
+        return scans, stats
+
+    def test_latest_per_host(self):
+        for processes in (False, True):
+            with self.subTest(processes=processes):
+                scans, stats = self._load(workers=2, processes=processes)
+                markers = sorted(s.get("marker", "anonymous") for s in scans)
+                self.assertEqual(markers, ["a-new", "anonymous", "b-new", "c"])
+                self.assertEqual((stats.files, stats.scans, stats.errors), (5, 6, 1))
+
+    def test_small_batches_keep_unit_order(self):
+        saved = scan_loader.SCAN_LOADER_BATCH_FILES, scan_loader.SCAN_LOADER_BATCH_LINES
+        scan_loader.SCAN_LOADER_BATCH_FILES = scan_loader.SCAN_LOADER_BATCH_LINES = 1
+        try:
+            streamed = [unit for unit, _ in scan_loader.stream_scans([self.dir.name], workers=3, stats=LoadStats(out=None))]
+            expected = list(scan_loader.iter_units(scan_loader.scan_sources([self.dir.name])))
+        finally:
+            scan_loader.SCAN_LOADER_BATCH_FILES, scan_loader.SCAN_LOADER_BATCH_LINES = saved
+        self.assertEqual(len(expected), 8)  # 3 files + 4 .jsonl lines + 1 .jsonl.gz line
+        self.assertEqual(streamed, expected)
+
+    def test_resume_after_each_unit(self):
+        saved = scan_loader.SCAN_LOADER_BATCH_FILES, scan_loader.SCAN_LOADER_BATCH_LINES
+        scan_loader.SCAN_LOADER_BATCH_FILES = scan_loader.SCAN_LOADER_BATCH_LINES = 2
+        try:
+            sources = scan_loader.scan_sources([self.dir.name])
+            units = list(scan_loader.iter_units(sources))
+            for i, unit in enumerate(units):
+                with self.subTest(unit=i):
+                    resumed = list(scan_loader.iter_units(sources, scan_loader.unit_position(unit)))
+                    # Exactly the files / lines after the resume point (batching may differ)
+                    self.assertEqual(_items(resumed), _items(units[i + 1:]))
+        finally:
+            scan_loader.SCAN_LOADER_BATCH_FILES, scan_loader.SCAN_LOADER_BATCH_LINES = saved
+
+        with self.assertRaises(ValueError):
+            list(scan_loader.iter_units(sources, ("/elsewhere.jsonl", 3)))
+
+    def test_non_object_values_are_errors(self):
+        path = os.path.join(self.dir.name, "values.jsonl")
+        lines = [b"[1, 2]\n", b"null\n", b"7\n", b'"text"\n', json.dumps(_scan("h", 1, "ok")).encode() + b"\n"]
+        scans, files, _, errors = scan_loader.parse_unit(("lines", path, 1, lines))
+        self.assertEqual([s["marker"] for s in scans], ["ok"])
+        self.assertEqual(files, 1)
+        self.assertEqual([e.split(": ")[0] for e in errors], [f"values.jsonl:{n}" for n in range(1, 5)])
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[]")
+        scans, _, _, errors = scan_loader.parse_unit(("files", [path]))
+        self.assertEqual((scans, len(errors)), ([], 1))
+
+    def test_accumulator(self):
+        latest = LatestScans()
+        latest.add({"hostname": "h", "marker": "untimed"})
+        latest.add(_scan("h", 4, "timed"))
+        latest.add(_scan("H", 4, "tie"))
+        self.assertEqual([s["marker"] for s in latest.scans()], ["timed"])
+        self.assertIsNone(scan_timestamp({"metadata": {"scan_time_utc": "yesterday"}}))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
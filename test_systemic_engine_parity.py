@@ -0,0 +1,310 @@
+"""
+Parity test for the systemic analysis engines.
+
+Generates random fleets (analysis/synthetic_fleet.py), stores them in a scratch MongoDB database and checks that
+the "mongo" aggregation engine returns exactly what the "python" engine returns.
+The "incremental" engine is checked after replaying the same scans, out of
+order, through the ingest hook (findings compared regardless of order).
+The CIS control matrix built at ingest is checked the same way against a
+rebuild from the stored scans.
+The in-memory columnar engine is compared with analyze_systemic_risk directly
+and needs no database.
+
+The Mongo-backed tests use the scratch database from mongo_test_db.py and
+are skipped if no server is available.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, drop_test_database, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services import systemic_runner, posture_counters, cis_matrix, interpretation_runner, ml_service
+    from backend.services import model_registry
+
+from analysis.systemic_analysis import analyze_systemic_risk, segment_values, unique_host_scans
+from analysis.systemic_columnar import analyze_systemic_risk_columnar, FleetColumns
+from analysis.synthetic_fleet import generate_fleet, generate_scan
+
+
+class TestColumnarEngineParity(unittest.TestCase):
+    """Columnar engine must match analyze_systemic_risk, including finding order"""
+
+    def test_generated_fleets(self):
+        for seed, n_hosts, max_scans in [(1, 1, 1), (2, 25, 3), (3, 400, 3), (4, 2000, 1)]:
+            with self.subTest(seed=seed, hosts=n_hosts):
+                scans = generate_fleet(seed, n_hosts, max_scans)
+                scans.append({"system": {}})  # no hostname: counted on its own
+                self.assertEqual(analyze_systemic_risk_columnar(scans), analyze_systemic_risk(scans))
+
+    def test_thresholds_reuse_columns(self):
+        scans = generate_fleet(7, 300, 2)
+        columns = FleetColumns.from_scans(scans)
+        for threshold in (0.0, 0.25, 0.5, 1.0):
+            self.assertEqual(columns.analyze(threshold), analyze_systemic_risk(scans, threshold))
+
+    def test_control_order_within_host(self):
+        # Tracked controls are reported in the host's own control order
+        scan = {"hostname": "h", "cis_compliance": {"controls": [
+            {"control_id": "18.9.3", "status": "non-compliant"},
+            {"control_id": "1.1.1", "status": "non-compliant"},
+            {"control_id": "18.9.3", "status": "non-compliant"},
+        ]}}
+        self.assertEqual(analyze_systemic_risk_columnar([scan]), analyze_systemic_risk([scan]))
+
+    def test_segments(self):
+        scans = generate_fleet(8, 300, 2)
+        rng = random.Random(8)
+        for scan in scans:
+            scan["system"]["os"] = rng.choice(["Windows 10", "Windows 11", ""])
+            if rng.random() < 0.5:
+                scan["tags"] = rng.sample(["finance", "dev", "kiosk"], rng.randint(1, 2))
+        segment_by = ["os", "tag", "site"]
+
+        expected = analyze_systemic_risk(scans, segment_by=segment_by)
+        self.assertEqual(analyze_systemic_risk_columnar(scans, segment_by=segment_by), expected)
+
+        # Each segment counts exactly what an analysis of its hosts alone counts
+        unique = unique_host_scans(scans)
+        for segment in expected["segments"]:
+            with self.subTest(key=segment["key"], value=segment["value"]):
+                hosts = [s for s in unique if segment["value"] in segment_values(s, segment["key"])]
+                alone = analyze_systemic_risk(hosts)
+                self.assertEqual(segment["total_hosts"], len(hosts))
+                self.assertEqual(
+                    segment["issues"],
+                    {f["issue"]: f["affected_hosts"] for f in alone["systemic_issues"] + alone["isolated_issues"]},
+                )
+
+    def test_empty_input(self):
+        with self.assertRaises(ValueError):
+            analyze_systemic_risk_columnar([])
+
+
+class TestSystemicEngineParity(MongoTestCase):
+    """Mongo aggregation engine must match the Python engine"""
+
+    def setUp(self):
+        drop_test_database()
+        mongo.ensure_database_exists()
+        # Segments are only produced by the python / columnar engines
+        self._segment_by = systemic_runner.SYSTEMIC_SEGMENT_BY
+        systemic_runner.SYSTEMIC_SEGMENT_BY = []
+        # Models trained here go to a temporary registry
+        self._models = (model_registry.ML_MODEL_DIR, ml_service.current_bundle())
+        self._model_dir = tempfile.TemporaryDirectory()
+        model_registry.ML_MODEL_DIR = self._model_dir.name
+
+    def tearDown(self):
+        systemic_runner.SYSTEMIC_SEGMENT_BY = self._segment_by
+        model_registry.ML_MODEL_DIR, bundle = self._models
+        ml_service.publish_bundle(bundle)
+        self._model_dir.cleanup()
+
+    def _store_fleet(self, seed, n_hosts, max_scans_per_host):
+        rng = random.Random(seed)
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        records = []
+        for h in range(n_hosts):
+            name = f"Host-{h:04d}"
+            for _ in range(rng.randint(1, max_scans_per_host)):
+                hostname = rng.choice([name, name.lower(), f"  {name.upper()} "])
+                records.append({
+                    "endpoint_id": f"ep-{h}",
+                    # distinct times so "newest scan" is unambiguous
+                    "scan_time": base + timedelta(seconds=len(records) * 7 + rng.randint(0, 5)),
+                    "scan_data": generate_scan(rng, hostname),
+                })
+        # A scan without any hostname is ignored by both engines
+        records.append({"endpoint_id": "anon", "scan_time": base, "scan_data": {"system": {}}})
+        rng.shuffle(records)
+        mongo.endpoint_scans_collection().insert_many(records)
+        return records
+
+    def test_generated_fleets(self):
+        for seed, n_hosts, max_scans in [(1, 1, 1), (2, 25, 3), (3, 200, 4), (4, 600, 2)]:
+            with self.subTest(seed=seed, hosts=n_hosts):
+                mongo.endpoint_scans_collection().delete_many({})
+                self._store_fleet(seed, n_hosts, max_scans)
+
+                expected = systemic_runner.compute_posture_python()
+                actual = systemic_runner.compute_posture_mongo()
+
+                self.assertEqual(actual, expected)
+
+    def test_threshold_is_applied(self):
+        self._store_fleet(5, 50, 2)
+        for threshold in (0.1, 0.5, 0.9):
+            self.assertEqual(
+                systemic_runner.compute_posture_mongo(threshold),
+                systemic_runner.compute_posture_python(threshold),
+            )
+
+    def test_incremental_counters(self):
+        def by_issue(posture):
+            for key in ("systemic_issues", "isolated_issues"):
+                posture[key] = sorted(posture[key], key=lambda f: f["issue"])
+            return posture
+
+        records = self._store_fleet(6, 120, 4)
+        ml_service.train_models()  # ingest scores with the serving model but never trains one
+        for record in records:  # shuffled: older scans arrive after newer ones
+            posture_counters.apply_scan(record["scan_data"], record["scan_time"])
+
+        expected = by_issue(systemic_runner.compute_posture_python())
+        self.assertEqual(by_issue(systemic_runner.compute_posture_incremental()), expected)
+
+        # Running totals agree with a full recompute
+        self.assertEqual(posture_counters.verify_posture_counters(), {})
+
+        # Drift is detected and repaired
+        mongo.posture_counters_collection().update_one(
+            {"_id": posture_counters.COUNTERS_ID}, {"$inc": {"issues.rdp_enabled": 5}}
+        )
+        self.assertIn("issues.rdp_enabled", posture_counters.verify_posture_counters())
+        self.assertEqual(by_issue(systemic_runner.compute_posture_incremental()), expected)
+
+    def test_verify_keeps_concurrent_ingest(self):
+        records = self._store_fleet(10, 60, 2)
+        ml_service.train_models()
+        for record in records:
+            posture_counters.apply_scan(record["scan_data"], record["scan_time"])
+
+        newer = {
+            "endpoint_id": "ep-3",
+            "scan_time": max(r["scan_time"] for r in records) + timedelta(days=1),
+            "scan_data": generate_scan(random.Random(11), "Host-0003"),
+        }
+        compute = posture_counters.compute_fleet_counters
+
+        def compute_then_ingest():
+            # A scan lands after the verifier's read, before its writes
+            result = compute()
+            mongo.endpoint_scans_collection().insert_one(dict(newer))
+            posture_counters.apply_scan(newer["scan_data"], newer["scan_time"])
+            return result
+
+        posture_counters.compute_fleet_counters = compute_then_ingest
+        try:
+            posture_counters.verify_posture_counters()
+        finally:
+            posture_counters.compute_fleet_counters = compute
+
+        counted = mongo.posture_host_contributions_collection().find_one({"_id": "host-0003"})
+        self.assertEqual(counted["scan_time"].replace(tzinfo=timezone.utc), newer["scan_time"])
+        self.assertEqual(posture_counters.verify_posture_counters(), {})
+
+    def test_verify_never_trains(self):
+        self._store_fleet(12, 20, 1)
+        saved = ml_service.current_bundle()
+        ml_service.publish_bundle(None)
+        try:
+            with mock.patch.object(ml_service, "sync_active_version"), \
+                    mock.patch.object(ml_service, "train_models") as train:
+                totals, _ = posture_counters.compute_fleet_counters()
+        finally:
+            ml_service.publish_bundle(saved)
+        train.assert_not_called()  # the first model comes from model_retrainer
+        self.assertEqual(totals["total_hosts"], 20)
+
+    def test_cis_matrix(self):
+        def counts(rates):
+            return sorted((c["control_id"], c["failing_hosts"], c["compliant_hosts"]) for c in rates["controls"])
+
+        records = self._store_fleet(7, 120, 4)
+        for record in records:  # shuffled: older scans arrive after newer ones
+            cis_matrix.apply_scan_controls(record["scan_data"], record["scan_time"], record["endpoint_id"])
+
+        incremental = cis_matrix.control_failure_rates()
+        failing = cis_matrix.failing_endpoints("2.3.1", limit=1000)
+        self.assertEqual(incremental["total_hosts"], 120)
+
+        cis_matrix.rebuild_cis_matrix()
+        self.assertEqual(counts(cis_matrix.control_failure_rates()), counts(incremental))
+        self.assertEqual(cis_matrix.failing_endpoints("2.3.1", limit=1000)["endpoints"], failing["endpoints"])
+        self.assertEqual(len(failing["endpoints"]), failing["failing_hosts"])
+
+    def test_cis_matrix_concurrent_ingest(self):
+        records = self._store_fleet(12, 60, 2)
+        for record in records:
+            cis_matrix.apply_scan_controls(record["scan_data"], record["scan_time"], record["endpoint_id"])
+
+        # An unchanged row does not touch the counters document
+        counters = mongo.cis_control_counters_collection()
+        updated_at = counters.find_one()["updated_at"]
+        newest = max(records, key=lambda r: r["scan_time"])
+        cis_matrix.apply_scan_controls(newest["scan_data"], newest["scan_time"], newest["endpoint_id"])
+        self.assertEqual(counters.find_one()["updated_at"], updated_at)
+
+        newer = {
+            "endpoint_id": "ep-3",
+            "scan_time": newest["scan_time"] + timedelta(days=1),
+            "scan_data": generate_scan(random.Random(13), "Host-0003"),
+        }
+        latest_scans = cis_matrix._latest_scans
+
+        def read_then_ingest():
+            # A scan lands after the rebuild's read, before its writes
+            result = latest_scans()
+            mongo.endpoint_scans_collection().insert_one(dict(newer))
+            cis_matrix.apply_scan_controls(newer["scan_data"], newer["scan_time"], newer["endpoint_id"])
+            return result
+
+        cis_matrix._latest_scans = read_then_ingest
+        try:
+            cis_matrix.rebuild_cis_matrix()
+        finally:
+            cis_matrix._latest_scans = latest_scans
+
+        row = mongo.cis_host_controls_collection().find_one({"_id": "host-0003"})
+        self.assertEqual(row["scan_time"].replace(tzinfo=timezone.utc), newer["scan_time"])
+
+        # Totals still match a from-scratch build
+        incremental = cis_matrix.control_failure_rates()
+        mongo.cis_host_controls_collection().delete_many({})
+        counters.delete_many({})
+        cis_matrix.rebuild_cis_matrix()
+        self.assertEqual(cis_matrix.control_failure_rates()["controls"], incremental["controls"])
+
+    def test_interpretation_memo(self):
+        records = self._store_fleet(8, 60, 2)
+        interpretations = mongo.org_interpretations_collection()
+
+        first_snapshot = systemic_runner.run_and_store_systemic_analysis("python")
+        second_snapshot = systemic_runner.run_and_store_systemic_analysis("python")
+        first, second = interpretations.find().sort("generated_at", 1)
+        self.assertIn("interpretation", first)
+        self.assertEqual(second["interpretation_id"], first["_id"])
+        self.assertEqual(interpretation_runner.resolve_interpretation(second), first["interpretation"])
+
+        # The posture read back from the snapshot hashes like the in-memory one
+        snapshot = mongo.org_posture_snapshots_collection().find_one({"_id": second["posture_snapshot_id"]})
+        stored = interpretation_runner.load_posture_data(snapshot)
+        self.assertEqual(interpretation_runner.posture_hash(stored), first["posture_hash"])
+        self.assertNotEqual(first_snapshot, second_snapshot)
+
+        # A changed posture is interpreted again
+        mongo.endpoint_scans_collection().insert_one({
+            "endpoint_id": "ep-new",
+            "scan_time": max(r["scan_time"] for r in records) + timedelta(days=1),
+            "scan_data": generate_scan(random.Random(9), "Host-New"),
+        })
+        systemic_runner.run_and_store_systemic_analysis("python")
+        self.assertIn("interpretation", interpretations.find_one(sort=[("generated_at", -1)]))
+
+    def test_empty_collection(self):
+        with self.assertRaises(ValueError):
+            systemic_runner.compute_posture_mongo()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
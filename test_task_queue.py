@@ -0,0 +1,145 @@
+"""
+Tests for the single-flight task leases (backend/services/task_queue.py)
+and the leased periodic tasks built on them (backend/services/periodic.py).
+
+Runs against the scratch database from mongo_test_db.py and is skipped if no
+server is available.
+"""
+
+import os
+import sys
+import threading
+import unittest
+from datetime import datetime, timezone, timedelta
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from mongo_test_db import MONGO_AVAILABLE, MongoTestCase, mongo
+
+if MONGO_AVAILABLE:
+    from backend.services.periodic import PeriodicTask
+    from backend.services.task_queue import acquire_lease, release_lease, renew_lease
+
+
+KEY = "analysis:test"
+
+
+class TestTaskLeases(MongoTestCase):
+
+    def setUp(self):
+        mongo.task_leases_collection().delete_many({})
+
+    def _lease(self):
+        return mongo.task_leases_collection().find_one({"_id": KEY})
+
+    def _expire(self):
+        mongo.task_leases_collection().update_one(
+            {"_id": KEY}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+
+    def test_concurrent_acquire(self):
+        results, start = {}, threading.Barrier(8)
+
+        def acquire(task_id):
+            start.wait()
+            results[task_id] = acquire_lease(KEY, task_id)
+
+        threads = [threading.Thread(target=acquire, args=(f"t-{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [task_id for task_id, (acquired, _) in results.items() if acquired]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual({holder for _, holder in results.values()}, set(winners))
+        self.assertEqual(self._lease()["task_id"], winners[0])
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertEqual(acquire_lease(KEY, "a"), (True, "a"))
+        self.assertEqual(acquire_lease(KEY, "b"), (False, "a"))
+
+        self._expire()
+        self.assertEqual(acquire_lease(KEY, "b"), (True, "b"))
+
+        # The previous holder can no longer extend or end the lease
+        before = self._lease()
+        renew_lease(KEY, "a")
+        release_lease(KEY, "a")
+        self.assertEqual(self._lease(), before)
+        self.assertEqual(acquire_lease(KEY, "c"), (False, "b"))
+
+    def test_renew_extends_own_lease(self):
+        acquire_lease(KEY, "a")
+        self._expire()
+        renew_lease(KEY, "a")
+        self.assertEqual(acquire_lease(KEY, "b"), (False, "a"))
+
+    def test_release(self):
+        acquire_lease(KEY, "a")
+
+        release_lease(KEY, "b")  # not the holder
+        self.assertEqual(acquire_lease(KEY, "c"), (False, "a"))
+
+        release_lease(KEY, "a")
+        self.assertEqual(acquire_lease(KEY, "c"), (True, "c"))
+
+
+class TestPeriodicLease(MongoTestCase):
+
+    def setUp(self):
+        mongo.task_leases_collection().delete_many({})
+        self.runs = []
+
+    def _workers(self, func=None, n=2, interval=60):
+        """The same leased task as started by n uvicorn workers."""
+        func = func or (lambda: self.runs.append(1))
+        return [PeriodicTask("sweep", func, interval, lease=True) for _ in range(n)]
+
+    def _expire(self):
+        mongo.task_leases_collection().update_one(
+            {"_id": "periodic:sweep"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+
+    def test_one_worker_per_interval(self):
+        a, b = self._workers()
+        self.assertTrue(a.run_once())
+        self.assertFalse(b.run_once())
+        self.assertFalse(a.run_once())  # not before the interval is over
+        self.assertEqual(len(self.runs), 1)
+
+        lease = mongo.task_leases_collection().find_one({"_id": "periodic:sweep"})
+        remaining = lease["expires_at"].replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)
+        self.assertGreater(remaining, timedelta(seconds=50))
+        self.assertLessEqual(remaining, timedelta(seconds=60))
+
+        self._expire()
+        self.assertTrue(b.run_once())
+        self.assertEqual(len(self.runs), 2)
+
+    def test_lease_held_while_running(self):
+        skipped = []
+        a, b = self._workers(lambda: skipped.append(not b.run_once()), interval=0)
+        self.assertTrue(a.run_once())
+        self.assertEqual(skipped, [True])
+        self.assertTrue(b.run_once())  # held for a zero interval after the run
+
+    def test_failed_run_keeps_the_interval(self):
+        def fail():
+            raise RuntimeError("sweep failed")
+
+        a, b = self._workers(fail)
+        with self.assertRaises(RuntimeError):
+            a.run_once()
+        self.assertFalse(b.run_once())
+
+    def test_unleased_always_runs(self):
+        tasks = [PeriodicTask("local", lambda: self.runs.append(1), 60) for _ in range(2)]
+        self.assertTrue(all(task.run_once() for task in tasks))
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(mongo.task_leases_collection().count_documents({}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)